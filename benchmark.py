@@ -0,0 +1,468 @@
+#!/usr/bin/env python
+
+#############################################################################
+# Benchmark for the training content conversion pipeline of CyLMS
+#############################################################################
+
+# External imports
+import getopt
+import json
+import logging
+import os
+import platform
+import re
+import resource
+import shutil
+import sys
+import tempfile
+import time
+import yaml
+
+# Internal imports
+import cnt2lms
+import pkg_mgmt
+import tmpl_mgmt
+import val_mgmt
+from storyboard import Storyboard
+
+#############################################################################
+# Constants
+#############################################################################
+
+# Version of the results file format
+RESULTS_VERSION = 1
+
+# Default size of the synthetic training content
+DEFAULT_TRAININGS = 1
+DEFAULT_QUESTIONS = 100
+DEFAULT_HINTS = 3
+DEFAULT_CHOICES = 4
+DEFAULT_RESOURCES = 0
+DEFAULT_RESOURCE_SIZE = 64 # KB
+
+# Default number of measured runs (an additional warm-up run is not measured)
+DEFAULT_REPEAT = 5
+
+# Relative increase of the median total time above which a comparison
+# with previous results is considered a regression
+DEFAULT_THRESHOLD = 0.10
+
+# Names of synthetic files
+CONTENT_FILE_NAME = "benchmark.yml"
+RESOURCES_DIR_NAME = "resources"
+RESOURCE_FILE_TEMPLATE = "resource{:04d}.bin"
+PACKAGE_BASE_NAME = "benchmark"
+
+# Text used in synthetic content (ASCII or Japanese, the latter escaped
+# so that this file only contains ASCII characters)
+ASCII_TEXT = {"title": "Benchmark training #{}",
+              "overview": "This training was generated to measure the conversion speed of CyLMS.",
+              "body": "What is the answer to question #{} of this \"benchmark\" training?",
+              "choice": "Choice #{}",
+              "hint": "Hint #{} is here to help you find the answer."}
+UNICODE_TEXT = {"title": u"\u30d9\u30f3\u30c1\u30de\u30fc\u30af\u8a13\u7df4 #{}",
+                "overview": u"\u3053\u306e\u8a13\u7df4\u306f CyLMS \u306e\u5909\u63db\u901f\u5ea6\u3092\u6e2c\u5b9a\u3059\u308b\u305f\u3081\u306b\u751f\u6210\u3055\u308c\u307e\u3057\u305f\u3002",
+                "body": u"\u3053\u306e\u300c\u30d9\u30f3\u30c1\u30de\u30fc\u30af\u300d\u306e\u8cea\u554f #{} \u306e\u7b54\u3048\u306f\u4f55\u3067\u3059\u304b\uff1f",
+                "choice": u"\u9078\u629e\u80a2 #{}",
+                "hint": u"\u30d2\u30f3\u30c8 #{} \u304c\u7b54\u3048\u3092\u898b\u3064\u3051\u308b\u52a9\u3051\u306b\u306a\u308a\u307e\u3059\u3002"}
+
+# Conversion stages, and the functions whose time is attributed to them;
+# nested calls are only counted for the innermost stage
+STAGE_YAML_LOAD = "yaml_load"
+STAGE_VALIDATION = "validation"
+STAGE_TEMPLATE = "template"
+STAGE_RENDERING = "rendering"
+STAGE_PACKAGE = "package"
+STAGE_OTHER = "other"
+STAGES = [STAGE_YAML_LOAD, STAGE_VALIDATION, STAGE_TEMPLATE, STAGE_RENDERING, STAGE_PACKAGE, STAGE_OTHER]
+STAGE_FUNCTIONS = [(STAGE_YAML_LOAD, cnt2lms.YAML_LOADER, "check_node"),
+                   (STAGE_YAML_LOAD, cnt2lms.YAML_LOADER, "get_node"),
+                   (STAGE_YAML_LOAD, cnt2lms.YAML_LOADER, "construct_document"),
+                   (STAGE_VALIDATION, val_mgmt.ContentValidator, "validate_document"),
+                   (STAGE_TEMPLATE, tmpl_mgmt.TemplateManager, "__init__"),
+                   (STAGE_TEMPLATE, pkg_mgmt.PackageManager, "get_template_cache"),
+                   (STAGE_RENDERING, cnt2lms, "add_question"),
+                   (STAGE_RENDERING, cnt2lms, "add_information"),
+                   (STAGE_PACKAGE, pkg_mgmt.PackageManager, "create_package")]
+
+#############################################################################
+# Class that measures the time spent in each stage by temporarily wrapping
+# the functions of the stages with timers
+#############################################################################
+class StageTimer:
+
+    # Constructor
+    def __init__(self, stage_functions=STAGE_FUNCTIONS):
+        self.stage_functions = stage_functions
+        self.stage_times = {}
+        self.call_stack = []
+        self.originals = []
+
+    # Wrap a function (or method) so that the time spent in it is added to
+    # the given stage, excluding the time spent in nested stages
+    def get_timed_function(self, stage, function):
+        def timed_function(*args, **kwargs):
+            # Each stack entry contains the time spent in nested stages
+            self.call_stack.append(0.0)
+            start_time = time.time()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                duration = time.time() - start_time
+                nested_time = self.call_stack.pop()
+                self.stage_times[stage] = self.stage_times.get(stage, 0.0) + duration - nested_time
+                if self.call_stack:
+                    self.call_stack[-1] += duration
+        return timed_function
+
+    # Start measuring (wrap the stage functions)
+    def start(self):
+        self.stage_times = {}
+        for stage, owner, name in self.stage_functions:
+            # Keep the attribute defined by the owner itself (if any), so that
+            # inherited methods are restored by removing the wrapper
+            original = None
+            if hasattr(owner, "__dict__") and name in owner.__dict__:
+                original = owner.__dict__[name]
+            self.originals.append((owner, name, original))
+            setattr(owner, name, self.get_timed_function(stage, getattr(owner, name)))
+
+    # Stop measuring (restore the stage functions); return the stage times
+    def stop(self):
+        for owner, name, original in reversed(self.originals):
+            if original is None:
+                delattr(owner, name)
+            else:
+                setattr(owner, name, original)
+        self.originals = []
+        return self.stage_times
+
+
+#############################################################################
+# Functions
+#############################################################################
+
+# Print usage information
+def usage():
+    print "\nOVERVIEW: Benchmark for the training content conversion pipeline of CyLMS.\n"
+    print "USAGE: benchmark.py [options]\n"
+    print "OPTIONS:"
+    print "-h, --help                     Display this help message and exit"
+    print "-t, --trainings <NUMBER>       Number of trainings in the content file (default: {})".format(DEFAULT_TRAININGS)
+    print "-q, --questions <NUMBER>       Number of questions per training (default: {})".format(DEFAULT_QUESTIONS)
+    print "    --hints <NUMBER>           Number of hints per question (default: {})".format(DEFAULT_HINTS)
+    print "    --choices <NUMBER>         Number of choices per question; questions alternate between"
+    print "                               fill-in and multiple-choice (default: {})".format(DEFAULT_CHOICES)
+    print "    --resources <NUMBER>       Number of resource files (default: {})".format(DEFAULT_RESOURCES)
+    print "    --resource-size <KB>       Size of each resource file (default: {} KB)".format(DEFAULT_RESOURCE_SIZE)
+    print "-u, --unicode                  Use Japanese text in the training content"
+    print "-r, --repeat <NUMBER>          Number of measured runs (default: {})".format(DEFAULT_REPEAT)
+    print "-p, --program-path <DIR>       Directory that contains the SCORM template (default: program directory)"
+    print "-o, --output <FILE>            Save the results to file in JSON format"
+    print "-C, --compare <FILE>           Compare the results with previous results saved in file"
+    print "    --threshold <RATIO>        Relative slowdown reported as a regression (default: {})".format(DEFAULT_THRESHOLD)
+    print "    --keep                     Keep the generated files\n"
+
+
+# Generate a training content file with synthetic content in the given directory;
+# return the content file name
+def generate_content(work_dir, parameters):
+
+    text = UNICODE_TEXT if parameters["unicode"] else ASCII_TEXT
+
+    # Create the resource files (random data, which is not compressible)
+    resources_dir = None
+    if parameters["resources"]:
+        resources_dir = os.path.join(work_dir, RESOURCES_DIR_NAME)
+        os.makedirs(resources_dir)
+        for index in range(parameters["resources"]):
+            with open(os.path.join(resources_dir, RESOURCE_FILE_TEMPLATE.format(index)), "wb") as resource_file:
+                resource_file.write(os.urandom(parameters["resource_size"] * 1024))
+
+    # Build the content, then write it in block style (as in the example files)
+    trainings = []
+    for training_index in range(parameters["trainings"]):
+        training = {Storyboard.KEY_ID: "BENCHMARK-{:03d}".format(training_index + 1),
+                    Storyboard.KEY_TITLE: text["title"].format(training_index + 1),
+                    Storyboard.KEY_LEVEL: training_index % 5 + 1,
+                    Storyboard.KEY_OVERVIEW: text["overview"],
+                    Storyboard.KEY_QUESTIONS: []}
+        if resources_dir:
+            training[Storyboard.KEY_RESOURCES] = resources_dir
+        for question_index in range(parameters["questions"]):
+            question = {Storyboard.KEY_ID: "{}-{:05d}".format(training[Storyboard.KEY_ID], question_index + 1),
+                        Storyboard.KEY_BODY: text["body"].format(question_index + 1)}
+            choices = [text["choice"].format(index + 1) for index in range(parameters["choices"])]
+            if choices and question_index % 2:
+                question[Storyboard.KEY_CHOICES] = choices
+                question[Storyboard.KEY_ANSWER] = choices[0]
+            else:
+                question[Storyboard.KEY_ANSWER] = text["choice"].format(1)
+            if parameters["hints"]:
+                question[Storyboard.KEY_HINTS] = [text["hint"].format(index + 1) for index in range(parameters["hints"])]
+            training[Storyboard.KEY_QUESTIONS].append(question)
+        trainings.append(training)
+
+    content_file = os.path.join(work_dir, CONTENT_FILE_NAME)
+    with open(content_file, "w") as content_stream:
+        yaml.safe_dump([{Storyboard.KEY_TRAINING: trainings}], content_stream, allow_unicode=True,
+                       default_flow_style=False, encoding="utf-8")
+    return content_file
+
+# Convert the content file once, and return the total time and the time
+# spent in each stage
+def run_conversion(content_file, work_dir, program_path):
+
+    # Make sure that the template is read and compiled again, as in a new process
+    tmpl_mgmt.template_managers.clear()
+
+    stage_timer = StageTimer()
+    stage_timer.start()
+    start_time = time.time()
+    try:
+        results = cnt2lms.yaml2scorm_all(content_file, os.path.join(work_dir, PACKAGE_BASE_NAME), program_path,
+                                         False, "N", None)
+    finally:
+        total_time = time.time() - start_time
+        stage_times = stage_timer.stop()
+
+    if not results or not all([package_name for package_name, training_title in results]):
+        return None
+    stage_times[STAGE_OTHER] = max(0.0, total_time - sum(stage_times.values()))
+    return total_time, stage_times
+
+# Compute statistics (minimum, median, maximum) of a list of values
+def get_statistics(values):
+    values = sorted(values)
+    middle = len(values) // 2
+    if len(values) % 2:
+        median = values[middle]
+    else:
+        median = (values[middle - 1] + values[middle]) / 2.0
+    return {"min": round(values[0], 6), "median": round(median, 6), "max": round(values[-1], 6)}
+
+# Get the peak memory usage of the process in KB (ru_maxrss is in bytes on macOS)
+def get_peak_memory():
+    peak_memory = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin":
+        peak_memory //= 1024
+    return peak_memory
+
+# Get the CyLMS version from the CHANGES file
+def get_version(program_dir):
+    try:
+        with open(os.path.join(program_dir, "CHANGES")) as changes_file:
+            for line in changes_file:
+                if re.match("CyLMS v", line):
+                    return line.rstrip()
+    except IOError:
+        pass
+    return "CyLMS"
+
+# Run the benchmark and return the results as a dictionary
+def run_benchmark(parameters, program_path, repeat, keep_files=False):
+
+    work_dir = tempfile.mkdtemp(prefix="cylms-benchmark-")
+    try:
+        logging.info("Generate synthetic training content in '{}'.".format(work_dir))
+        content_file = generate_content(work_dir, parameters)
+        input_size = os.path.getsize(content_file)
+        question_count = parameters["trainings"] * parameters["questions"]
+
+        # The conversion cache would make all runs but the first one trivial
+        use_conversion_cache = cnt2lms.USE_CONVERSION_CACHE
+        cnt2lms.USE_CONVERSION_CACHE = False
+        # Only report errors of the conversion itself
+        logger = logging.getLogger()
+        log_level = logger.level
+        logger.setLevel(logging.WARNING)
+        try:
+            logging.debug("Run warm-up conversion.")
+            measurements = []
+            for run_index in range(repeat + 1):
+                measurement = run_conversion(content_file, work_dir, program_path)
+                if not measurement:
+                    return None
+                if run_index > 0:
+                    measurements.append(measurement)
+        finally:
+            logger.setLevel(log_level)
+            cnt2lms.USE_CONVERSION_CACHE = use_conversion_cache
+
+        output_size = sum([os.path.getsize(os.path.join(work_dir, file_name)) for file_name in os.listdir(work_dir)
+                           if file_name.endswith(pkg_mgmt.PACKAGE_EXTENSION)])
+    finally:
+        if keep_files:
+            logging.info("Generated files were kept in '{}'.".format(work_dir))
+        else:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    total_times = [total_time for total_time, stage_times in measurements]
+    stage_results = {}
+    for stage in STAGES:
+        stage_results[stage] = get_statistics([stage_times.get(stage, 0.0) for total_time, stage_times in measurements])
+    median_time = get_statistics(total_times)["median"]
+    program_dir = os.path.dirname(os.path.realpath(__file__))
+    return {"version": RESULTS_VERSION,
+            "cylms": get_version(program_dir),
+            "date": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "python": platform.python_version(),
+            "yaml_loader": cnt2lms.YAML_LOADER.__name__,
+            "parameters": parameters,
+            "repeat": repeat,
+            "input_size": input_size,
+            "output_size": output_size,
+            "total": get_statistics(total_times),
+            "stages": stage_results,
+            "throughput": {"questions_per_second": round(question_count / median_time, 1) if median_time else None,
+                           "input_mb_per_second": round(input_size / median_time / 1024 / 1024, 3) if median_time else None},
+            "peak_memory_kb": get_peak_memory()}
+
+# Show the results of a benchmark
+def show_results(results):
+    parameters = results["parameters"]
+    logging.info("Converted {} training(s) with {} question(s) each ({} bytes) in {} run(s) using {}:"
+                 .format(parameters["trainings"], parameters["questions"], results["input_size"], results["repeat"],
+                         results["yaml_loader"]))
+    logging.info("  - Total: median {median:.4f} s (min {min:.4f} s, max {max:.4f} s)".format(**results["total"]))
+    for stage in STAGES:
+        logging.info("  - Stage {:<11} median {:.4f} s".format(stage + ":", results["stages"][stage]["median"]))
+    logging.info("  - Throughput: {} question(s)/s, {} MB/s of input"
+                 .format(results["throughput"]["questions_per_second"], results["throughput"]["input_mb_per_second"]))
+    logging.info("  - Peak memory: {} KB".format(results["peak_memory_kb"]))
+
+# Compare results with previous results; return False if the total
+# time increased by more than the threshold
+def compare_results(results, previous_results, threshold):
+    if previous_results.get("version") != RESULTS_VERSION:
+        logging.error("Unsupported format of previous results.")
+        return False
+    if previous_results.get("parameters") != results["parameters"]:
+        logging.warning("Previous results were obtained with different parameters: {}"
+                        .format(previous_results.get("parameters")))
+
+    logging.info("Comparison with previous results ({}, {}):".format(previous_results.get("cylms"),
+                                                                   previous_results.get("date")))
+    comparisons = [("total", previous_results["total"]["median"], results["total"]["median"])]
+    for stage in STAGES:
+        if stage in previous_results.get("stages", {}):
+            comparisons.append((stage, previous_results["stages"][stage]["median"], results["stages"][stage]["median"]))
+    for name, previous_time, current_time in comparisons:
+        if previous_time:
+            change = "{:+.1%}".format(current_time / previous_time - 1)
+        else:
+            change = "n/a"
+        logging.info("  - {:<11} {:.4f} s => {:.4f} s ({})".format(name + ":", previous_time, current_time, change))
+    logging.info("  - Peak memory: {} KB => {} KB".format(previous_results.get("peak_memory_kb"), results["peak_memory_kb"]))
+
+    previous_time = previous_results["total"]["median"]
+    if previous_time and results["total"]["median"] > previous_time * (1 + threshold):
+        logging.error("Performance regression: total time increased by more than {:.0%}.".format(threshold))
+        return False
+    return True
+
+
+#############################################################################
+# Main program
+#############################################################################
+def main(args):
+
+    # Configure logging
+    logging.basicConfig(level=logging.INFO,
+                        format='* %(levelname)s: %(filename)s: %(message)s')
+
+    # Program parameters and their default values
+    parameters = {"trainings": DEFAULT_TRAININGS, "questions": DEFAULT_QUESTIONS, "hints": DEFAULT_HINTS,
+                  "choices": DEFAULT_CHOICES, "resources": DEFAULT_RESOURCES, "resource_size": DEFAULT_RESOURCE_SIZE,
+                  "unicode": False}
+    repeat = DEFAULT_REPEAT
+    program_path = os.path.dirname(os.path.realpath(__file__))
+    output_file = None
+    compare_file = None
+    threshold = DEFAULT_THRESHOLD
+    keep_files = False
+
+    # Parse command line arguments
+    try:
+        opts, trailing_args = getopt.getopt(args, "ht:q:ur:p:o:C:",
+                                            ["help", "trainings=", "questions=", "hints=", "choices=", "resources=",
+                                             "resource-size=", "unicode", "repeat=", "program-path=", "output=",
+                                             "compare=", "threshold=", "keep"])
+        for opt, arg in opts:
+            if opt in ("-h", "--help"):
+                usage()
+                sys.exit()
+            elif opt in ("-t", "--trainings"):
+                parameters["trainings"] = int(arg)
+            elif opt in ("-q", "--questions"):
+                parameters["questions"] = int(arg)
+            elif opt == "--hints":
+                parameters["hints"] = int(arg)
+            elif opt == "--choices":
+                parameters["choices"] = int(arg)
+            elif opt == "--resources":
+                parameters["resources"] = int(arg)
+            elif opt == "--resource-size":
+                parameters["resource_size"] = int(arg)
+            elif opt in ("-u", "--unicode"):
+                parameters["unicode"] = True
+            elif opt in ("-r", "--repeat"):
+                repeat = int(arg)
+            elif opt in ("-p", "--program-path"):
+                program_path = os.path.abspath(arg)
+            elif opt in ("-o", "--output"):
+                output_file = arg
+            elif opt in ("-C", "--compare"):
+                compare_file = arg
+            elif opt == "--threshold":
+                threshold = float(arg)
+            elif opt == "--keep":
+                keep_files = True
+    except (getopt.GetoptError, ValueError) as err:
+        logging.error("Command-line argument error: {}".format(str(err)))
+        usage()
+        sys.exit(1)
+
+    if trailing_args:
+        logging.error("Unrecognized trailing arguments {} => abort execution.".format(trailing_args))
+        usage()
+        sys.exit(1)
+    if parameters["trainings"] < 1 or repeat < 1:
+        logging.error("At least one training and one run are required => abort execution.")
+        sys.exit(1)
+
+    # Read the previous results first, so that errors are detected early
+    previous_results = None
+    if compare_file:
+        try:
+            with open(compare_file) as compare_stream:
+                previous_results = json.load(compare_stream)
+        except (IOError, ValueError) as e:
+            logging.error("Cannot read previous results from '{}': {}".format(compare_file, str(e)))
+            sys.exit(1)
+
+    # Run the benchmark
+    results = run_benchmark(parameters, program_path, repeat, keep_files)
+    if not results:
+        logging.error("Conversion failed => abort benchmark.")
+        sys.exit(1)
+    show_results(results)
+
+    if output_file:
+        try:
+            with open(output_file, "w") as output_stream:
+                json.dump(results, output_stream, indent=2, sort_keys=True, separators=(",", ": "))
+            logging.info("Saved results to '{}'.".format(output_file))
+        except IOError as e:
+            logging.error("Cannot save results to '{}': {}".format(output_file, str(e)))
+            sys.exit(1)
+
+    if previous_results and not compare_results(results, previous_results, threshold):
+        sys.exit(1)
+
+
+#############################################################################
+# Run program
+#############################################################################
+if __name__ == "__main__":
+    main(sys.argv[1:])
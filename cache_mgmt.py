@@ -0,0 +1,279 @@
+#############################################################################
+# Conversion cache management for CyLMS
+#############################################################################
+
+# External imports
+import hashlib
+import json
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+#############################################################################
+# Constants
+#############################################################################
+
+# Version of the cache key format; change it whenever the conversion
+# output changes for the same input, so that old entries are not reused
+CACHE_KEY_VERSION = 1
+
+# Cache directory (relative to the program path) and entry file names
+PACKAGE_CACHE_DIRECTORY = "cache/packages"
+CACHE_ENTRY_TEMPLATE = "{}.zip"
+TEMP_ENTRY_PREFIX = ".cylms-"
+
+# Build manifest file (created in the directory of the converted content)
+# and its format version; entries are grouped by training content file
+# (identified by its absolute path), then by training id
+BUILD_MANIFEST_FILE = ".cylms_manifest.json"
+BUILD_MANIFEST_VERSION = 2
+
+# Eviction settings: maximum total size of the cache in bytes, and maximum
+# age of entries in seconds (the age is reset each time an entry is used)
+CACHE_MAX_SIZE = 512 * 1024 * 1024
+CACHE_MAX_AGE = 30 * 24 * 3600
+
+#############################################################################
+# Class that manages a content-addressed cache of SCORM packages
+#############################################################################
+class CacheManager:
+
+    # Constructor
+    def __init__(self, cache_dir, max_size=CACHE_MAX_SIZE, max_age=CACHE_MAX_AGE):
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        self.max_age = max_age
+
+    # Get the file name of the cache entry with given key
+    def get_entry_name(self, key):
+        return os.path.join(self.cache_dir, CACHE_ENTRY_TEMPLATE.format(key))
+
+    # Copy the cached package with given key to the package file; return
+    # the package file name, or None if the package is not in the cache
+    def get_package(self, key, package_name):
+        entry_name = self.get_entry_name(key)
+        if not os.path.isfile(entry_name):
+            logging.debug("Conversion cache miss for key '{}'.".format(key))
+            return None
+        try:
+            copy_file(entry_name, package_name)
+            # Update the modification time so that the entry is kept longer
+            os.utime(entry_name, None)
+        except (IOError, OSError) as e:
+            logging.warning("Cannot use cached package '{}': {}".format(entry_name, str(e)))
+            return None
+        logging.debug("Conversion cache hit for key '{}'.".format(key))
+        return package_name
+
+    # Store a copy of the package file in the cache using the given key
+    def put_package(self, key, package_name):
+        try:
+            if not os.path.isdir(self.cache_dir):
+                os.makedirs(self.cache_dir)
+            copy_file(package_name, self.get_entry_name(key))
+        except (IOError, OSError) as e:
+            logging.warning("Cannot store package '{}' in conversion cache: {}".format(package_name, str(e)))
+            return False
+        self.evict()
+        return True
+
+    # Remove the entries that are too old, then the least recently
+    # used entries until the total size is within the limit
+    def evict(self):
+        entries = []
+        current_time = time.time()
+        total_size = 0
+        for file_name in os.listdir(self.cache_dir):
+            if file_name.startswith(TEMP_ENTRY_PREFIX):
+                continue
+            entry_name = os.path.join(self.cache_dir, file_name)
+            try:
+                entry_stat = os.stat(entry_name)
+                if current_time - entry_stat.st_mtime > self.max_age:
+                    logging.debug("Evict expired cache entry '{}'.".format(entry_name))
+                    os.remove(entry_name)
+                    continue
+            except OSError:
+                # The entry may have been removed by another process
+                continue
+            entries.append((entry_stat.st_mtime, entry_stat.st_size, entry_name))
+            total_size += entry_stat.st_size
+
+        for entry_mtime, entry_size, entry_name in sorted(entries):
+            if total_size <= self.max_size:
+                break
+            logging.debug("Evict cache entry '{}' to reduce cache size.".format(entry_name))
+            try:
+                os.remove(entry_name)
+            except OSError:
+                pass
+            total_size -= entry_size
+
+    # Remove all the entries in the cache
+    def clear(self):
+        if os.path.isdir(self.cache_dir):
+            shutil.rmtree(self.cache_dir)
+
+
+#############################################################################
+# Class that manages the manifest of the last build, which records for each
+# training (identified by its training content file and id) the hash of the
+# conversion inputs and the output package name
+#############################################################################
+class BuildManifest:
+
+    # Constructor; the manifest is loaded from the manifest file (if given),
+    # or initialized from the given entries
+    def __init__(self, manifest_file=None, entries=None):
+        self.manifest_file = manifest_file
+        self.entries = {}
+        self.updated_entries = {}
+        if entries:
+            self.merge(entries)
+        if manifest_file:
+            self.load()
+
+    # Load the manifest entries from file; a missing or unreadable
+    # manifest is treated as an empty one (everything is rebuilt)
+    def load(self):
+        if not os.path.isfile(self.manifest_file):
+            return
+        try:
+            with open(self.manifest_file) as manifest_stream:
+                manifest = json.load(manifest_stream)
+            if manifest.get("version") == BUILD_MANIFEST_VERSION:
+                self.merge(manifest.get("trainings", {}))
+            else:
+                logging.warning("Unsupported build manifest version in '{}' => ignore it.".format(self.manifest_file))
+        except (IOError, ValueError) as e:
+            logging.warning("Cannot read build manifest '{}' => ignore it: {}".format(self.manifest_file, str(e)))
+
+    # Save the manifest entries to file
+    def save(self):
+        manifest = {"version": BUILD_MANIFEST_VERSION, "trainings": self.entries}
+        temp_fd, temp_name = tempfile.mkstemp(prefix=TEMP_ENTRY_PREFIX, dir=os.path.dirname(os.path.abspath(self.manifest_file)))
+        try:
+            with os.fdopen(temp_fd, "w") as manifest_stream:
+                json.dump(manifest, manifest_stream, indent=2, sort_keys=True, separators=(",", ": "))
+            os.chmod(temp_name, 0o644)
+            os.rename(temp_name, self.manifest_file)
+        except (IOError, OSError) as e:
+            logging.error("Cannot write build manifest '{}': {}".format(self.manifest_file, str(e)))
+            if os.path.exists(temp_name):
+                os.remove(temp_name)
+            return False
+        return True
+
+    # Add the given entries (grouped by training content file) to the manifest;
+    # entries of other trainings in the same file are kept
+    def merge(self, entries):
+        for source_key, source_entries in entries.items():
+            self.entries.setdefault(source_key, {}).update(source_entries)
+
+    # Check whether the package of a training in the given training content
+    # file was built from the same inputs (identified by their hash) and still
+    # exists
+    def is_up_to_date(self, source_file, training_id, input_hash, package_name):
+        entry = self.entries.get(get_source_key(source_file), {}).get(unicode(training_id))
+        return (entry is not None and entry.get("hash") == input_hash
+                and entry.get("package") == package_name and os.path.isfile(package_name))
+
+    # Record the inputs hash and package name of a training in the given
+    # training content file
+    def update(self, source_file, training_id, input_hash, package_name):
+        entry = {"hash": input_hash, "package": package_name}
+        source_key = get_source_key(source_file)
+        self.entries.setdefault(source_key, {})[unicode(training_id)] = entry
+        self.updated_entries.setdefault(source_key, {})[unicode(training_id)] = entry
+
+
+#############################################################################
+# Functions
+#############################################################################
+
+# Compute the cache key for a conversion from all the inputs that determine
+# the content of the resulting package; the training data is normalized by
+# serializing it with sorted keys
+def compute_key(training, template_signature, resources, enable_vnc, port_filename):
+    key_hash = hashlib.sha256()
+    key_hash.update("version={}\n".format(CACHE_KEY_VERSION))
+    key_hash.update(json.dumps(training, sort_keys=True, default=repr).encode("utf-8"))
+    key_hash.update("\ntemplate={}\n".format(template_signature))
+    key_hash.update("resources={}\n".format(get_directory_hash(resources)))
+    key_hash.update("enable_vnc={}\n".format(bool(enable_vnc)))
+    key_hash.update("port_filename={}\n".format(port_filename))
+    return key_hash.hexdigest()
+
+# Compute a hash of the names and contents of all the files in a directory
+def get_directory_hash(directory):
+    directory_hash = hashlib.sha256()
+    # Unicode paths (e.g., read from YAML) are encoded, so that the directory is
+    # walked and file names are hashed as byte strings, whatever their characters
+    if isinstance(directory, unicode):
+        directory = directory.encode("utf-8")
+    if directory and os.path.isdir(directory):
+        for dirpath, dirnames, filenames in os.walk(directory):
+            dirnames.sort()
+            for filename in sorted(filenames):
+                file_path = os.path.join(dirpath, filename)
+                directory_hash.update(os.path.relpath(file_path, directory) + "\0")
+                with open(file_path, "rb") as resource_file:
+                    for data in iter(lambda: resource_file.read(65536), ""):
+                        directory_hash.update(data)
+                directory_hash.update("\0")
+    return directory_hash.hexdigest()
+
+# Get the build manifest key of a training content file (its absolute path
+# as a unicode string, like the keys loaded from the manifest file)
+def get_source_key(source_file):
+    source_key = os.path.abspath(source_file)
+    if isinstance(source_key, str):
+        source_key = source_key.decode("utf-8", "replace")
+    return source_key
+
+# Copy a file via a temporary file in the target directory, so that the
+# target is never seen in an incomplete state
+def copy_file(source_name, target_name):
+    temp_fd, temp_name = tempfile.mkstemp(prefix=TEMP_ENTRY_PREFIX, dir=os.path.dirname(os.path.abspath(target_name)))
+    os.close(temp_fd)
+    try:
+        shutil.copyfile(source_name, temp_name)
+        os.chmod(temp_name, 0o644)
+        os.rename(temp_name, target_name)
+    finally:
+        if os.path.exists(temp_name):
+            os.remove(temp_name)
+
+
+#############################################################################
+# Main program (used for testing purposes)
+#############################################################################
+def main(args):
+
+    # Configure logging level for running the tests below
+    logging.basicConfig(level=logging.INFO,
+                        format='* %(levelname)s: %(filename)s: %(message)s')
+
+    # Show the content of the conversion cache, or clear it if requested
+    program_path = os.path.dirname(os.path.realpath(__file__))
+    cache_manager = CacheManager(os.path.join(program_path, PACKAGE_CACHE_DIRECTORY))
+    if args and args[0] == "clear":
+        cache_manager.clear()
+        logging.info("Cleared conversion cache '{}'.".format(cache_manager.cache_dir))
+    elif os.path.isdir(cache_manager.cache_dir):
+        file_names = os.listdir(cache_manager.cache_dir)
+        total_size = sum([os.path.getsize(os.path.join(cache_manager.cache_dir, file_name)) for file_name in file_names])
+        logging.info("Conversion cache '{}' contains {} entries ({} bytes)."
+                     .format(cache_manager.cache_dir, len(file_names), total_size))
+    else:
+        logging.info("Conversion cache '{}' is empty.".format(cache_manager.cache_dir))
+
+
+#############################################################################
+# Run main program
+#############################################################################
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -6,6 +6,7 @@
 # External imports
 import logging
 import ConfigParser
+import os
 import sys
 
 # Internal imports
@@ -39,7 +40,7 @@ class CfgManager:
             if self.config_parser.has_option(Storyboard.CONFIG_SECTION, setting):
                 logging.debug("Setting '{}' present in configuration file.".format(setting))
                 # Some settings are treated in a special manner
-                if setting == Storyboard.CONFIG_ENABLE_VNC:
+                if setting in (Storyboard.CONFIG_ENABLE_VNC, Storyboard.CONFIG_VNC_PROXY):
                     return self.config_parser.getboolean(Storyboard.CONFIG_SECTION, setting)
                 return self.config_parser.get(Storyboard.CONFIG_SECTION, setting)
             else:
@@ -49,6 +50,27 @@ class CfgManager:
             sys.exit(1)
 
 
+#############################################################################
+# Functions
+#############################################################################
+
+# Configuration managers indexed by configuration file path, so that each
+# file is parsed only once per process (or again after it is modified)
+cfg_managers = {}
+
+# Get the manager for the given configuration file (create it if needed)
+def get_cfg_manager(config_file):
+    config_file = os.path.abspath(config_file)
+    try:
+        config_mtime = os.path.getmtime(config_file)
+    except OSError:
+        config_mtime = None
+    cached_entry = cfg_managers.get(config_file)
+    if not cached_entry or cached_entry[0] != config_mtime:
+        cfg_managers[config_file] = (config_mtime, CfgManager(config_file))
+    return cfg_managers[config_file][1]
+
+
 #############################################################################
 # Main program (used for testing purposes)
 #############################################################################
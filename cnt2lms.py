@@ -4,26 +4,46 @@
 #############################################################################
 
 # External imports
-from distutils import dir_util
-from distutils.errors import DistutilsFileError
 import os
-import io
 import codecs
-import re
+import glob
+import json
 import logging
+import multiprocessing
 import yaml
 import sys
-import shutil
 
 # Internal imports
 from storyboard import Storyboard
+import cache_mgmt
+import cfg_mgmt
+import perf_mgmt
+import pkg_mgmt
+import tmpl_mgmt
+import val_mgmt
 import vnc_mgmt
 
 # Constants
 TEMPLATE_DIR = 'Template' # Template SCORM package
-REMOVE_TEMP_PKG_DIR = True
+TEMPLATE_ZIP = 'Template.zip' # Pre-built template SCORM package (used if directory is missing)
 YAML2SCORM_ERROR = None, None
+MULTI_PACKAGE_NAME_FORMAT = "{}-{}" # SCORM file name and training id
+SESSION_ID_DEFAULT = "N" # Session id used in the default session file of shared packages
+BATCH_FILE_PATTERNS = ["*.yml", "*.yaml"] # Content files converted when a directory is given
+USE_CONVERSION_CACHE = True # Reuse packages from the conversion cache when inputs are unchanged
 DEBUG = False # Use to debug text encoding/conversion issues
+YAML_LOADER = val_mgmt.YAML_LOADER # Use libyaml-based loader if available
+
+# Shared packages: when converting content for this session id, the package
+# doesn't depend on the session, and its start file reads the range access
+# information from the session file (see Storyboard.SESSION_FILE) of each
+# activity at runtime; the port & file name tag appears inside a double-quoted
+# JavaScript string in the start file, hence the value below
+SHARED_SESSION_ID = "shared"
+SHARED_SHOW_RANGE_BUTTON = "cylmsSession.showRangeButton"
+SHARED_PORT_FILENAME = '" + cylmsSession.portFilename + "'
+SESSION_SCRIPT_TAG = '<script type="text/javascript" src="{}"></script>'.format(os.path.basename(Storyboard.SESSION_FILE))
+SESSION_FILE_FORMAT = "var cylmsSession = {};\n"
 
 #############################################################################
 # Functions
@@ -32,8 +52,10 @@ DEBUG = False # Use to debug text encoding/conversion issues
 
 
 #############################################################################
-# Add question to question file in SCORM package
-def add_question(question_file, question_file_temp, question_id, question_body,
+# Add question to question buffer of SCORM package; the question template
+# is rendered into the buffer, which is written to file only once
+@perf_mgmt.timed("render.add_question")
+def add_question(question_buffer, question_template, question_id, question_body,
                  question_type, question_answer, question_correct_answer, question_hints):
 
     # Define objective ID of training (by default is obj_playing, do not change it)
@@ -61,11 +83,6 @@ def add_question(question_file, question_file_temp, question_id, question_body,
             logging.error("No strings provided in the 'hints' array.")
             return False
 
-    my_f = io.open(question_file,'r',encoding='utf8')
-    temp = io.open(question_file_temp,'ab')
-
-    # Replace content in template file
-    content = my_f.read().encode('utf-8')
     # Convert int to unicode
     temp_list = [question_id, question_body, question_type, question_answer, question_correct_answer, question_objective_id]
     for counter, i in enumerate(temp_list):
@@ -79,60 +96,59 @@ def add_question(question_file, question_file_temp, question_id, question_body,
     if DEBUG: print "---------------------------------------------------------"
     ## Process question id
     if DEBUG: print "- Question id: ORIGINAL: " + question_id
-    question_id = question_id.encode('utf-8').replace('"','\\"').replace('\\\\','\\')
+    question_id = escape_string(question_id)
     if DEBUG: print "  Question id: ENCODED : " + question_id
     ## Process question body
     if DEBUG: print "- Question body: ORIGINAL: " + question_body
-    question_body = question_body.encode('utf-8').replace('"','\\"').replace('\\\\','\\')
+    question_body = escape_string(question_body)
     if DEBUG: print "  Question body: ENCODED : " + question_body
     ## Process question type
-    question_type = question_type.encode('utf-8').replace('"','\\"').replace('\\\\','\\')
+    question_type = escape_string(question_type)
     ## Process question answer
     if DEBUG: print "- Question answer: ORIGINAL: " + question_correct_answer
-    question_correct_answer = question_correct_answer.encode('utf-8').replace('"','\\"').replace('\\\\','\\')
+    question_correct_answer = escape_string(question_correct_answer)
     if DEBUG: print "  Question answer: ENCODED : " + question_correct_answer
     ## Process choices for multiple-choice questions
     if DEBUG: print "- Question choices: ORIGINAL: " + str(question_answer)
     ### Create choice data appropriate for inclusion in JavaScript file
     choice_data = build_choice_data(question_answer)
+    if choice_data is None:
+        return False
     if DEBUG: print "  Question choices: ENCODED: " + choice_data
     ## ObjectiveId is predefined as 'obj_playing' and should not be changed (see above), so do nothing
-    #question_objective_id = question_objective_id.encode('utf-8').replace('"','\\"').replace('\\\\','\\')
     ## Process hints
     for i in range(0,len(hints)):
         if DEBUG: print "- Hint #" + str(i+1) +": ORIGINAL: " + hints[i]
-        hints[i] = hints[i].encode('utf-8').replace('"','\\"').replace('\\\\','\\')
+        hints[i] = escape_string(hints[i])
         if DEBUG: print "  Hint #" + str(i+1) +": ENCODED : " + hints[i]
 
-    # Insert information into the overall 'content' object
-    ## Add question id
-    content = content.replace(Storyboard.TAG_QUESTION_ID, str(question_id))
-    ## Add question body
-    content = content.replace(Storyboard.TAG_QUESTION_BODY, str(question_body))
-    ## Add question type
-    content = content.replace(Storyboard.TAG_QUESTION_TYPE, str(question_type))
-    ## Add question answer
-    content = content.replace(Storyboard.TAG_QUESTION_CORRECT_ANSWER, str(question_correct_answer))
-    ## Add choices for multiple-choice questions
-    ### This a special case for which we need to put the choices in an array
+    # Build the values of the template tags
+    ## Choices for multiple-choice questions are a special case for which
+    ## we need to put the choices in an array
     if question_type == 'QUESTION_TYPE_CHOICE':
-        content = content.replace(Storyboard.TAG_QUESTION_ANSWER, 'new Array({})'.format(Storyboard.TAG_QUESTION_ANSWER))
-    content = content.replace(Storyboard.TAG_QUESTION_ANSWER, str(choice_data))
-    ## TODO: Add what?
-    content = content.replace(Storyboard.TAG_QUESTION_OBJECTIVE_ID, str(question_objective_id))
-    ## Add hints individually
-    for i in range(0,len(hints)):
-        content = content.replace(Storyboard.TAG_QUESTION_HINT + str(i+1), hints[i])
-    content = re.sub('".*{}.*"'.format(Storyboard.TAG_QUESTION_HINT),'""',content)
-
-    logging.debug("Content: "+content)
-    temp.write(content)
-    my_f.close()
-    temp.close()
+        choice_data = 'new Array({})'.format(choice_data)
+    values = {Storyboard.TAG_QUESTION_ID: str(question_id),
+              Storyboard.TAG_QUESTION_BODY: str(question_body),
+              Storyboard.TAG_QUESTION_TYPE: str(question_type),
+              Storyboard.TAG_QUESTION_CORRECT_ANSWER: str(question_correct_answer),
+              Storyboard.TAG_QUESTION_ANSWER: str(choice_data),
+              Storyboard.TAG_QUESTION_OBJECTIVE_ID: str(question_objective_id)}
+
+    # Render the question into the buffer; hint slots without
+    # a corresponding hint are left empty
+    question_template.render_into(question_buffer, values, hints)
 
     return True
 
 
+#############################################################################
+# Encode a string and escape the characters that would break the
+# JavaScript strings in which the SCORM template tags are enclosed
+def escape_string(text):
+    # Change symbol " to \" to avoid errors in HTML, then avoid the case \\
+    return text.encode('utf-8').replace('"','\\"').replace('\\\\','\\')
+
+
 #############################################################################
 # Build choice data appropriate for inclusion in JavaScript file
 def build_choice_data(question_choices):
@@ -200,30 +216,18 @@ def build_choice_data(question_choices):
 
 
 #############################################################################
-# Add information not related to questions to auxiliary SCORM package files
-def add_information(start_file, start_file_temp, manifest_file,
-                    manifest_file_temp, id, enable_vnc,
-                    description, header, level, session_id, config_file):
+# Add information not related to questions to auxiliary SCORM package files;
+# return the rendered content of the start file and of the manifest file
+@perf_mgmt.timed("render.add_information")
+def add_information(start_template, manifest_template, id, enable_vnc,
+                    description, header, level, port_filename, shared=False):
 
     # Write description information to template manifest_file
-    file = io.open(manifest_file,'r')
-    temp = io.open(manifest_file_temp,'ab')
-
-    content = file.read()
     idText = str(id)
-    content = content.replace(Storyboard.TAG_TRAINING_ID, idText.encode('utf-8'))
-
-    logging.debug("Content: " + content)
-    temp.write(content)
-    file.close()
-    temp.close()
+    manifest_content = manifest_template.render({Storyboard.TAG_TRAINING_ID: idText.encode('utf-8')})
+    if logging.getLogger().isEnabledFor(logging.DEBUG):
+        logging.debug("Content: " + manifest_content)
 
-    # Write description information to template start_file
-    file = io.open(start_file,'r')
-    temp = io.open(start_file_temp,'ab')
-
-    # Get file content
-    content = file.read().encode('utf-8')
     # Build the level text
     if level:
         level_text = "Level {0}: ".format(str(level).encode('utf-8'))
@@ -235,25 +239,54 @@ def add_information(start_file, start_file_temp, manifest_file,
     if DEBUG: print "---------------------------------------------------------"
     ## Show range button tag is predefined, so no encoding needed
     ## NOTE: We show the range button in SCORM if VNC access is enabled
-    content = content.replace(Storyboard.TAG_SHOW_RANGE_BUTTON, str(enable_vnc).lower())
+    show_range_button = str(enable_vnc).lower()
+    ## NOTE: For shared packages this is decided at runtime by the session file
+    if shared:
+        show_range_button = SHARED_SHOW_RANGE_BUTTON
     ## Training level is just a number, so no encoded needed
-    content = content.replace(Storyboard.TAG_TRAINING_LEVEL, level_text)
     ## Training title
     if DEBUG: print("- Training title: ORIGINAL: '{}'".format(description))
-    training_title = description.encode('utf-8').replace('"','\\"').replace('\\\\','\\')
+    training_title = escape_string(description)
     if DEBUG: print("- Training title: ENCODED : '{}'".format(training_title))
-    content = content.replace(Storyboard.TAG_TRAINING_TITLE, training_title)
     ## Training overview: need to strip trailing white spaces to make a correct HTML file
     if DEBUG: print("- Training overview: ORIGINAL: '{}'".format(header))
-    training_overview = header.rstrip().encode('utf-8').replace('"','\\"').replace('\\\\','\\')
+    training_overview = escape_string(header.rstrip())
     training_overview = '<br>'.join(training_overview.splitlines())
     if DEBUG: print("- Training overview: ENCODED : '{}'".format(training_overview))
-    content = content.replace(Storyboard.TAG_TRAINING_OVERVIEW, training_overview)
-    ## Range access information
+    ## Range access information (determined by get_port_filename())
+    if DEBUG: print("- Port & file name: '{}'".format(port_filename))
+    if DEBUG: print "---------------------------------------------------------"
+
+    start_content = start_template.render({Storyboard.TAG_SHOW_RANGE_BUTTON: show_range_button,
+                                           Storyboard.TAG_TRAINING_LEVEL: level_text,
+                                           Storyboard.TAG_TRAINING_TITLE: training_title,
+                                           Storyboard.TAG_TRAINING_OVERVIEW: training_overview,
+                                           Storyboard.TAG_PORT_FILENAME: port_filename})
+    ## The session file of shared packages is loaded before the template scripts
+    if shared:
+        head_index = start_content.lower().find("<head>")
+        if head_index >= 0:
+            head_index += len("<head>")
+        else:
+            head_index = 0
+        start_content = start_content[:head_index] + SESSION_SCRIPT_TAG + start_content[head_index:]
+    if logging.getLogger().isEnabledFor(logging.DEBUG):
+        logging.debug("Content: " + start_content)
+
+    return start_content, manifest_content
+
+
+#############################################################################
+# Get the range access information (port and file name) for a session
+def get_port_filename(enable_vnc, session_id, config_file):
+
     ### Set a default value first
     port_filename = ":{}/access_range{}.html".format(Storyboard.ACCESS_RANGE_BASE_PORT, session_id)
     ### Try to determine correct info
-    if enable_vnc and session_id.isdigit():
+    if enable_vnc and config_file and cfg_mgmt.get_cfg_manager(config_file).get_setting(Storyboard.CONFIG_VNC_PROXY):
+        # All trainees access the range via the single noVNC proxy, which also serves the file
+        port_filename = ":{}/access_range{}.html".format(Storyboard.VNC_PROXY_PORT, session_id)
+    elif enable_vnc and session_id.isdigit():
         # Create a VNC manager object
         vnc_manager = vnc_mgmt.VncManager(config_file)
         if vnc_manager:
@@ -263,216 +296,423 @@ def add_information(start_file, start_file_temp, manifest_file,
                 port_filename = ":{}/access_range{}.html".format(first_access_range_port, session_id)
             else:
                 logging.error("Failed to get cyber range info => abort VNC server stopping")
-    if DEBUG: print("- Port & file name: '{}'".format(port_filename))
-    content = content.replace(Storyboard.TAG_PORT_FILENAME, port_filename)
-    if DEBUG: print "---------------------------------------------------------"
 
-    logging.debug("Content: " + content)
-    temp.write(content)
-    file.close()
-    temp.close()
+    return port_filename
 
 
-#########################################################################
-# Convert training content description in YAML format to a SCORM package;
-# if absolute path is not provided, the SCORM file is saved in the program path
-# NOTE: Currently this function only supports YAML files with one question set
-def yaml2scorm(input_file, scorm_file, program_path, enable_vnc, session_id, config_file):
+#############################################################################
+# Get the content of the session file of a shared package for a session, that
+# is, the range access information determined for the session at conversion
+# time for other packages
+def get_session_file(enable_vnc, session_id, config_file):
+    session_parameters = {"showRangeButton": bool(enable_vnc),
+                          "portFilename": get_port_filename(enable_vnc, session_id, config_file)}
+    return SESSION_FILE_FORMAT.format(json.dumps(session_parameters, sort_keys=True))
+
+
+#############################################################################
+# Get the path of the SCORM template: the template directory is used if it
+# exists, otherwise a pre-built template ZIP archive (if any)
+def get_template_path(program_path):
+    template_path = str(program_path) + "/" + TEMPLATE_DIR
+    if not os.path.isdir(template_path) and os.path.isfile(str(program_path) + "/" + TEMPLATE_ZIP):
+        template_path = str(program_path) + "/" + TEMPLATE_ZIP
+    return template_path
+
+
+#############################################################################
+# Iterate over the trainings defined in a training content file in YAML format
+# (including files with multiple documents); the file is read lazily, so each
+# training is yielded (and can be converted) as soon as it is parsed; each
+# document is validated before its trainings are yielded; on error, None is
+# yielded and the iteration stops
+def iter_trainings(input_file):
 
     # Check whether input file was provided
     if input_file:
         logging.info("Process training content file '{}'.".format(input_file))
     else:
         logging.error("Training content file invalid: {}.".format(input_file))
-        return YAML2SCORM_ERROR
-
-    # Build sets with valid keys for training and question sections
-    valid_training_keys = set([Storyboard.KEY_ID, Storyboard.KEY_TITLE, Storyboard.KEY_RESOURCES,
-                               Storyboard.KEY_OVERVIEW, Storyboard.KEY_LEVEL, Storyboard.KEY_QUESTIONS])
-    valid_question_keys = set([Storyboard.KEY_ID, Storyboard.KEY_TYPE, Storyboard.KEY_BODY,
-                               Storyboard.KEY_CHOICES, Storyboard.KEY_ANSWER, Storyboard.KEY_HINTS])
+        yield None
+        return
 
+    training_count = 0
     try:
         with codecs.open(input_file, 'r', 'utf-8') as stream:
-            yaml_stream = yaml.load(stream, Loader=yaml.SafeLoader)
-            logging.debug("YAML stream: " + str(yaml_stream))
-            if not yaml_stream:
-                logging.error("No data in the input file: " + input_file)
-                return YAML2SCORM_ERROR
-            for top_object in yaml_stream:
-                if type(top_object) != dict:
-                    logging.error("Incorrect format in the input file: " + input_file)
-                    return YAML2SCORM_ERROR
-                for yaml_tag in top_object:
-                    # Check that top-level tag matches 'training'
-                    if yaml_tag != Storyboard.KEY_TRAINING:
-                        logging.error("Top-level section in training content does not match '{0}': {1}".format(Storyboard.KEY_TRAINING, yaml_tag))
-                        return YAML2SCORM_ERROR
-
-                    # Process tags within training section
-                    for training in top_object[yaml_tag]:
-
-                        # Check whether any unknown tags are present
-                        training_keys = set(training.keys())
-                        unknown_training_keys = training_keys.difference(valid_training_keys)
-                        if unknown_training_keys:
-                            logging.error("Unknown tags found in training content: " + repr(list(unknown_training_keys)))
-                            return YAML2SCORM_ERROR
-
-                        # Check existence of required fields in training section
-                        if Storyboard.KEY_ID not in training:
-                            logging.error("Required field in training content is missing: " + Storyboard.KEY_ID)
-                            return YAML2SCORM_ERROR
-                        if Storyboard.KEY_TITLE not in training:
-                            # Use id as title if title is not provided (we know that id must be defined at
-                            # this point, as we have checked it in the previous if statement)
-                            training[Storyboard.KEY_TITLE] = training[Storyboard.KEY_ID]
-                        if Storyboard.KEY_OVERVIEW not in training:
-                            logging.error("Required field in training content is missing: " + Storyboard.KEY_OVERVIEW)
-                            return YAML2SCORM_ERROR
-                        # Although questions are in principle not optional, we allow content descriptions without
-                        # questions in order to have more flexibility (e.g., to generate default content)
-                        #if Storyboard.KEY_QUESTIONS not in training:
-                        #    logging.error("Required field in training content is missing: " + Storyboard.KEY_QUESTIONS)
-                        #    return YAML2SCORM_ERROR
-
-                        # If optional field 'level' is not found in the input file, we provide 
-                        # a default value for it
-                        if Storyboard.KEY_LEVEL not in training:
-                            training[Storyboard.KEY_LEVEL] = None
-
-                        # Define training name and make new package folder for new SCORM package
-                        training_name = training[Storyboard.KEY_ID]
-
-                        # Change the training name to the full path directory:
-                        training_name = str(program_path) + "/" + str(training_name)
-
-                        # Get the resources directory if defined
-                        if Storyboard.KEY_RESOURCES in training:
-                            resources = training[Storyboard.KEY_RESOURCES]
-                            # Build the absolute path for the resources directory
-                            resources = os.path.abspath(resources)
-                        else:
-                            resources = None
-
-                        # Copy from the template package to the new package
-                        try:
-                            dir_util.copy_tree(str(program_path) + "/" + TEMPLATE_DIR, training_name)
-                            # If defined, copy the content of the resources directory
-                            # into the 'shared' folder inside the SCORM package
-                            if resources:
-                                dir_util.copy_tree(resources, training_name + "/shared")
-                        except DistutilsFileError as e:
-                            logging.error("Issue when copying template: " + str(e))
-                            return YAML2SCORM_ERROR
-
-                        # Add questions to temporary file
-                        # Workflow: get template from question.js, fill in the content for each question and
-                        # add one by one question into temporary file. After finish, replace question.js by
-                        # the temporary file and delete the temporary one.
-                        question_file = training_name + '/Playing/questions.js'
-                        question_file_temp = question_file + '_temp'
-
-                        # Process questions
-                        if Storyboard.KEY_QUESTIONS in training:
-                            for question in training[Storyboard.KEY_QUESTIONS]:
-
-                                # Check whether any unknown tags are present
-                                question_keys = set(question.keys())
-                                unknown_question_keys = question_keys.difference(valid_question_keys)
-                                if unknown_question_keys:
-                                    logging.error("Unknown tags found in question section: " + repr(unknown_question_keys))
-                                    return YAML2SCORM_ERROR
-
-                                # Check existence of required fields in question section
-                                if Storyboard.KEY_ID not in question:
-                                    logging.error("Required field in question section is missing: " + Storyboard.KEY_ID)
-                                    return YAML2SCORM_ERROR
-                                if Storyboard.KEY_BODY not in question:
-                                    logging.error("Required field in question '{0}' section is missing: {1}"
-                                                  .format(question[Storyboard.KEY_ID], Storyboard.KEY_BODY))
-                                    return YAML2SCORM_ERROR
-                                if Storyboard.KEY_ANSWER not in question:
-                                    logging.error("Required field in question '{0}' section is missing: {1}"
-                                                  .format(question[Storyboard.KEY_ID], Storyboard.KEY_ANSWER))
-                                    return YAML2SCORM_ERROR
-
-                                # Determine the question type if it was not set already via the optional 
-                                # field 'type' 
-                                if Storyboard.KEY_TYPE not in question:
-                                    # Question type is 'choice' if 'choices' field is present, 'fill-in' otherwise
-                                    if Storyboard.KEY_CHOICES in question:
-                                        question[Storyboard.KEY_TYPE] = Storyboard.VALUE_TYPE_CHOICE
-                                    else:
-                                        question[Storyboard.KEY_TYPE] = Storyboard.VALUE_TYPE_FILL_IN
-
-                                # Verify validity of description
-                                # Fill-in questions cannot have choices field
-                                if question[Storyboard.KEY_TYPE] == Storyboard.VALUE_TYPE_FILL_IN and Storyboard.KEY_CHOICES in question:
-                                    logging.error("Fill-in type questions cannot have a '{0}' field.".format(Storyboard.KEY_CHOICES))
-                                    return YAML2SCORM_ERROR
-                                if question[Storyboard.KEY_TYPE] == Storyboard.VALUE_TYPE_CHOICE and Storyboard.KEY_CHOICES not in question:
-                                    logging.error("Fill-in type questions must have a '{0}' field.".format(Storyboard.KEY_CHOICES))
-                                    return YAML2SCORM_ERROR
-
-                                # If a question has no 'choices' field, then we set it to 'null' 
-                                # so that it is dealt with appropriately in JavaScript
-                                if Storyboard.KEY_CHOICES not in question:
-                                    question[Storyboard.KEY_CHOICES] = "null"
-
-                                # If optional field 'hints' is not provided, we set it to ''
-                                if Storyboard.KEY_HINTS not in question:
-                                    question[Storyboard.KEY_HINTS] = ""
-
-                                # Actually add the question to the internal data structure
-                                add_question(question_file, question_file_temp, question[Storyboard.KEY_ID],
-                                             question[Storyboard.KEY_BODY], question[Storyboard.KEY_TYPE],
-                                             question[Storyboard.KEY_CHOICES], question[Storyboard.KEY_ANSWER],
-                                             question[Storyboard.KEY_HINTS])
-
-                            # Only copy the temporary question file if there were some questions to start with
-                            # Replace question.js by temporary file
-                            shutil.copy2(question_file_temp, question_file)
-                            os.remove(question_file_temp)
-
-                        # Add information about level, header and description
-                        start_file = training_name + '/shared/assessmenttemplate.html'
-                        start_file_temp = start_file + '_temp'
-                        manifest_file = training_name + '/imsmanifest.xml'
-                        manifest_file_temp = manifest_file + '_temp'
-
-                        add_information(start_file, start_file_temp, manifest_file, manifest_file_temp,
-                                        training[Storyboard.KEY_ID], enable_vnc, training[Storyboard.KEY_TITLE],
-                                        training[Storyboard.KEY_OVERVIEW], training[Storyboard.KEY_LEVEL], session_id, config_file)
-                        # Replace start.html by temporary file
-                        shutil.copy2(start_file_temp, start_file)
-                        os.remove(start_file_temp)
-                        # Replace imsmanifest.xml by temporary file
-                        shutil.copy2(manifest_file_temp, manifest_file)
-                        os.remove(manifest_file_temp)
-
-                        # Create name of SCORM package: if path is absolute we use the file name directly,
-                        # otherwise we add the program_path prefix
-                        if os.path.isabs(scorm_file):
-                            base_package_name = scorm_file
-                        else:
-                            base_package_name = program_path + "/" + scorm_file
-
-                        # Create SCORM package
-                        package_name = shutil.make_archive(base_package_name, "zip", training_name)
-                        if REMOVE_TEMP_PKG_DIR:
-                            shutil.rmtree(training_name)
-                        if package_name:
-                            logging.info("Created SCORM package '{}'.".format(package_name))
-                            return package_name, training[Storyboard.KEY_TITLE]
-                        else:
-                            logging.error("Package creation failed.")
-                            return YAML2SCORM_ERROR
+            if perf_mgmt.enabled:
+                perf_mgmt.add_bytes("content.read", os.path.getsize(input_file))
+            # Documents are parsed one at a time, so that only the current
+            # document is kept in memory; the composed document is validated
+            # (with line numbers) before being converted to Python objects
+            loader = YAML_LOADER(stream)
+            content_validator = val_mgmt.get_content_validator()
+            try:
+                while loader.check_node():
+                    with perf_mgmt.timer("content.parse"):
+                        document_node = loader.get_node()
+                    with perf_mgmt.timer("content.validate"):
+                        errors = content_validator.validate_document(document_node)
+                    if errors:
+                        for error in errors:
+                            logging.error("Invalid training content in '{}': {}".format(input_file, error))
+                        yield None
+                        return
+                    with perf_mgmt.timer("content.construct"):
+                        yaml_stream = loader.construct_document(document_node)
+                    # Only build the (potentially huge) debug string if it will be logged
+                    if logging.getLogger().isEnabledFor(logging.DEBUG):
+                        logging.debug("YAML stream: " + str(yaml_stream))
+                    # Empty documents (e.g., after a trailing '---') are ignored
+                    if not yaml_stream:
+                        continue
+                    for top_object in yaml_stream:
+                        for training in top_object[Storyboard.KEY_TRAINING]:
+                            training_count += 1
+                            yield training
+            finally:
+                loader.dispose()
 
     except (IOError, yaml.YAMLError) as e:
         logging.error("General error: " + str(e))
+        yield None
+        return
+
+    if not training_count:
+        logging.error("No data in the input file: " + input_file)
+        yield None
+
+
+#############################################################################
+# Load all the trainings in a training content file in YAML format (including
+# files with multiple documents); return the list of trainings, or None on error
+def load_trainings(input_file):
+
+    trainings = []
+    for training in iter_trainings(input_file):
+        if training is None:
+            return None
+        trainings.append(training)
+    return trainings
+
+
+#############################################################################
+# Convert one training loaded from a training content file to a SCORM package;
+# if absolute path is not provided, the SCORM file is saved in the program path;
+# if a build manifest is given, the training is only converted when its inputs
+# changed since the last build (the training is recorded in the manifest under
+# the name of the training content file it was loaded from)
+def convert_training(training, scorm_file, program_path, enable_vnc, session_id, config_file,
+                     build_manifest=None, input_file=None):
+
+    # NOTE: The training was already checked against the content schema (see
+    #       val_mgmt.py) when it was read, hence only default values are set below
+    try:
+        if Storyboard.KEY_TITLE not in training:
+            # Use id as title if title is not provided (id is a required field)
+            training[Storyboard.KEY_TITLE] = training[Storyboard.KEY_ID]
+        # Although questions are in principle not optional, we allow content descriptions without
+        # questions in order to have more flexibility (e.g., to generate default content)
+
+        # If optional field 'level' is not found in the input file, we provide 
+        # a default value for it
+        if Storyboard.KEY_LEVEL not in training:
+            training[Storyboard.KEY_LEVEL] = None
+
+        # Get the resources directory if defined
+        if Storyboard.KEY_RESOURCES in training:
+            resources = training[Storyboard.KEY_RESOURCES]
+            # Build the absolute path for the resources directory
+            resources = os.path.abspath(resources)
+        else:
+            resources = None
+
+        # Create name of SCORM package: if path is absolute we use the file name directly,
+        # otherwise we add the program_path prefix
+        if os.path.isabs(scorm_file):
+            base_package_name = scorm_file
+        else:
+            base_package_name = program_path + "/" + scorm_file
+
+        # Determine the range access information (read at runtime by shared packages)
+        shared = session_id == SHARED_SESSION_ID
+        if shared:
+            port_filename = SHARED_PORT_FILENAME
+        else:
+            port_filename = get_port_filename(enable_vnc, session_id, config_file)
+
+        # Reuse a previously created package if none of the conversion inputs changed
+        template_path = get_template_path(program_path)
+        package_manager = pkg_mgmt.PackageManager(template_path)
+        package_file = base_package_name + pkg_mgmt.PACKAGE_EXTENSION
+        if USE_CONVERSION_CACHE or build_manifest:
+            cache_key = cache_mgmt.compute_key(training, package_manager.get_template_signature(),
+                                               resources, enable_vnc, port_filename)
+        ## Check whether the package from the last build is up to date
+        if build_manifest and build_manifest.is_up_to_date(input_file, training[Storyboard.KEY_ID], cache_key, package_file):
+            logging.info("SCORM package '{}' is up to date.".format(package_file))
+            return package_file, training[Storyboard.KEY_TITLE]
+        ## Check whether the package is in the conversion cache
+        if USE_CONVERSION_CACHE:
+            cache_manager = cache_mgmt.CacheManager(str(program_path) + "/" + cache_mgmt.PACKAGE_CACHE_DIRECTORY)
+            package_name = cache_manager.get_package(cache_key, package_file)
+            if package_name:
+                logging.info("Reused cached SCORM package '{}'.".format(package_name))
+                if build_manifest:
+                    build_manifest.update(input_file, training[Storyboard.KEY_ID], cache_key, package_name)
+                return package_name, training[Storyboard.KEY_TITLE]
+
+        # Get the compiled template files (they are read only once per process)
+        with perf_mgmt.timer("template.load"):
+            template_manager = tmpl_mgmt.get_template_manager(template_path)
+
+        # Rendered files that replace the corresponding template files in the package
+        rendered_files = {}
+
+        # Add questions to question buffer
+        # Workflow: render the question template of questions.js for each question into
+        # a buffer, then use the buffer content as questions.js in the package
+        question_buffer = []
+
+        # Process questions
+        if Storyboard.KEY_QUESTIONS in training:
+            for question in training[Storyboard.KEY_QUESTIONS]:
+
+                # Determine the question type if it was not set already via the optional 
+                # field 'type' 
+                if Storyboard.KEY_TYPE not in question:
+                    # Question type is 'choice' if 'choices' field is present, 'fill-in' otherwise
+                    if Storyboard.KEY_CHOICES in question:
+                        question[Storyboard.KEY_TYPE] = Storyboard.VALUE_TYPE_CHOICE
+                    else:
+                        question[Storyboard.KEY_TYPE] = Storyboard.VALUE_TYPE_FILL_IN
+
+                # If a question has no 'choices' field, then we set it to 'null' 
+                # so that it is dealt with appropriately in JavaScript
+                if Storyboard.KEY_CHOICES not in question:
+                    question[Storyboard.KEY_CHOICES] = "null"
+
+                # If optional field 'hints' is not provided, we set it to ''
+                if Storyboard.KEY_HINTS not in question:
+                    question[Storyboard.KEY_HINTS] = ""
+
+                # Actually add the question to the internal data structure
+                if not add_question(question_buffer, template_manager.question_template,
+                                    question[Storyboard.KEY_ID],
+                                    question[Storyboard.KEY_BODY], question[Storyboard.KEY_TYPE],
+                                    question[Storyboard.KEY_CHOICES], question[Storyboard.KEY_ANSWER],
+                                    question[Storyboard.KEY_HINTS]):
+                    logging.error("Failed to add question '{}'.".format(question[Storyboard.KEY_ID]))
+                    return YAML2SCORM_ERROR
+
+            # Only replace the question file if there were some questions to start with
+            if question_buffer:
+                rendered_files[tmpl_mgmt.QUESTION_TEMPLATE_FILE] = "".join(question_buffer)
+
+        # Add information about level, header and description
+        start_content, manifest_content = add_information(
+            template_manager.start_template, template_manager.manifest_template,
+            training[Storyboard.KEY_ID], enable_vnc, training[Storyboard.KEY_TITLE],
+            training[Storyboard.KEY_OVERVIEW], training[Storyboard.KEY_LEVEL], port_filename, shared)
+        rendered_files[tmpl_mgmt.START_TEMPLATE_FILE] = start_content
+        rendered_files[tmpl_mgmt.MANIFEST_TEMPLATE_FILE] = manifest_content
+        ## Shared packages contain a default session file, which is replaced
+        ## by that of the session when the activity is added to the LMS
+        if shared:
+            rendered_files[Storyboard.SESSION_FILE] = get_session_file(False, SESSION_ID_DEFAULT, None)
+
+        # Create SCORM package by streaming the template entries into the package archive;
+        # if defined, the content of the resources directory is copied into the 'shared'
+        # folder inside the SCORM package
+        with perf_mgmt.timer("package.create"):
+            package_name = package_manager.create_package(base_package_name, rendered_files, resources)
+        if package_name:
+            if perf_mgmt.enabled:
+                perf_mgmt.add_bytes("package.write", os.path.getsize(package_name))
+            logging.info("Created SCORM package '{}'.".format(package_name))
+            if USE_CONVERSION_CACHE:
+                cache_manager.put_package(cache_key, package_name)
+            if build_manifest:
+                build_manifest.update(input_file, training[Storyboard.KEY_ID], cache_key, package_name)
+            return package_name, training[Storyboard.KEY_TITLE]
+        else:
+            logging.error("Package creation failed.")
+            return YAML2SCORM_ERROR
+
+    except (IOError, OSError) as e:
+        logging.error("General error: " + str(e))
+        return YAML2SCORM_ERROR
+
+
+#########################################################################
+# Convert training content description in YAML format to a SCORM package;
+# if absolute path is not provided, the SCORM file is saved in the program path
+# NOTE: This function only converts the first training in the file; use
+#       yaml2scorm_all() to convert all of them
+def yaml2scorm(input_file, scorm_file, program_path, enable_vnc, session_id, config_file,
+               build_manifest=None):
+
+    # Only the first training is parsed, the rest of the file is not read
+    trainings = iter_trainings(input_file)
+    training = next(trainings)
+    trainings.close()
+    if training is None:
         return YAML2SCORM_ERROR
 
+    return convert_training(training, scorm_file, program_path, enable_vnc, session_id, config_file,
+                            build_manifest, input_file)
+
+
+#########################################################################
+# Convert all the trainings in a training content file in YAML format (including
+# files with multiple documents) to SCORM packages; the name of each package is
+# built from the SCORM file name and the training id; return a list with one
+# (package name, training title) pair per training, or None if the file could
+# not be loaded; in incremental mode, only the trainings whose inputs changed
+# since the last build (as recorded in the build manifest) are converted; each
+# training is converted as soon as it is read from the file; a build manifest
+# given as argument is used instead of that of the SCORM file directory, and
+# is not saved (this is left to the caller)
+def yaml2scorm_all(input_file, scorm_file, program_path, enable_vnc, session_id, config_file,
+                   incremental=False, build_manifest=None):
+
+    save_manifest = False
+    if incremental and not build_manifest:
+        build_manifest = cache_mgmt.BuildManifest(get_manifest_file([scorm_file], program_path))
+        save_manifest = True
+
+    results = []
+    for training in iter_trainings(input_file):
+        if training is None:
+            # Keep the manifest entries of the trainings converted so far
+            if save_manifest:
+                build_manifest.save()
+            return None
+        if type(training) == dict and Storyboard.KEY_ID in training:
+            # Make sure the training id can be used as part of a file name
+            training_suffix = str(training[Storyboard.KEY_ID]).replace(os.sep, "_")
+            training_scorm_file = MULTI_PACKAGE_NAME_FORMAT.format(scorm_file, training_suffix)
+        else:
+            # The error will be reported by the conversion function
+            training_scorm_file = scorm_file
+        results.append(convert_training(training, training_scorm_file, program_path, enable_vnc, session_id, config_file,
+                                        build_manifest, input_file))
+
+    if save_manifest:
+        build_manifest.save()
+
+    return results
+
+
+#########################################################################
+# Find the training content files to be converted in batch mode; the
+# argument is either a directory or a glob pattern
+def find_content_files(path_pattern):
+
+    if os.path.isdir(path_pattern):
+        input_files = []
+        for file_pattern in BATCH_FILE_PATTERNS:
+            input_files.extend(glob.glob(os.path.join(path_pattern, file_pattern)))
+    else:
+        input_files = glob.glob(path_pattern)
+
+    return sorted([os.path.abspath(input_file) for input_file in input_files])
+
+
+#########################################################################
+# Get the name of the build manifest used for incremental conversion of the
+# given SCORM files (it is stored in their common directory)
+def get_manifest_file(scorm_files, program_path):
+    package_dirs = []
+    for scorm_file in scorm_files:
+        if not os.path.isabs(scorm_file):
+            scorm_file = str(program_path) + "/" + scorm_file
+        package_dirs.append(os.path.dirname(scorm_file))
+    # Make sure the common prefix ends at a directory boundary
+    common_dir = os.path.dirname(os.path.commonprefix([package_dir + os.sep for package_dir in package_dirs]))
+    return os.path.join(common_dir, cache_mgmt.BUILD_MANIFEST_FILE)
+
+
+#########################################################################
+# Convert all the trainings in one training content file in a worker process
+# of the batch converter; packages are assembled in memory and written via
+# temporary files, so workers never collide with each other; in incremental
+# mode the manifest entries updated by the worker are returned to the parent
+# process, which is the only one that writes the manifest file; likewise, if
+# instrumentation is enabled, the metrics recorded by the worker for the file
+# are returned to be added to those of the parent process
+def convert_file_worker(arguments):
+
+    input_file, program_path, enable_vnc, session_id, config_file, manifest_entries = arguments
+    # Workers inherit the metrics of the parent process, which must not be counted twice
+    if perf_mgmt.enabled:
+        perf_mgmt.registry.clear()
+    build_manifest = None
+    if manifest_entries is not None:
+        build_manifest = cache_mgmt.BuildManifest(entries=manifest_entries)
+    try:
+        results = yaml2scorm_all(input_file, input_file, program_path, enable_vnc, session_id, config_file,
+                                 build_manifest=build_manifest)
+    except Exception as e:
+        # Make sure a problem with one file doesn't stop the entire batch
+        logging.error("Unexpected error when converting '{}': {}".format(input_file, str(e)))
+        results = None
+    if not results:
+        results = [YAML2SCORM_ERROR]
+
+    updated_entries = None
+    if build_manifest:
+        updated_entries = build_manifest.updated_entries
+    metrics = None
+    if perf_mgmt.enabled:
+        metrics = perf_mgmt.registry.get_metrics()
+    return input_file, results, updated_entries, metrics
+
+
+#########################################################################
+# Convert a list of training content files to SCORM packages in parallel
+# by using a pool of worker processes (by default one per CPU core); all
+# the trainings in each file are converted, and packages are named as by
+# yaml2scorm_all(); return a list with one (input file, package name, training
+# title) tuple per training, where the package name is None if the conversion
+# failed (one such tuple is returned for a file that could not be loaded);
+# in incremental mode, only the trainings whose inputs changed since the last
+# build are converted
+def yaml2scorm_batch(input_files, program_path, enable_vnc, session_id, config_file, process_count=None,
+                     incremental=False):
+
+    if not process_count:
+        process_count = multiprocessing.cpu_count()
+    process_count = min(process_count, max(len(input_files), 1))
+    logging.info("Convert {} training content file(s) using {} process(es).".format(len(input_files), process_count))
+
+    build_manifest = None
+    manifest_entries = None
+    if incremental:
+        build_manifest = cache_mgmt.BuildManifest(get_manifest_file(input_files, program_path))
+        manifest_entries = build_manifest.entries
+
+    arguments = [(input_file, program_path, enable_vnc, session_id, config_file, manifest_entries)
+                 for input_file in input_files]
+    pool = multiprocessing.Pool(process_count)
+    try:
+        worker_results = pool.map(convert_file_worker, arguments)
+    finally:
+        pool.close()
+        pool.join()
+
+    results = []
+    for input_file, file_results, updated_entries, metrics in worker_results:
+        for package_name, training_title in file_results:
+            results.append((input_file, package_name, training_title))
+        if build_manifest and updated_entries:
+            build_manifest.merge(updated_entries)
+        if metrics:
+            perf_mgmt.registry.merge(metrics)
+    if build_manifest:
+        build_manifest.save()
+
+    return results
+
 
 #############################################################################
 # Main program (used for testing purposes)
@@ -5,6 +5,7 @@
 #############################################################################
 
 # External imports
+import json
 import logging
 import os
 import re
@@ -16,6 +17,9 @@ import time
 import cfg_mgmt
 import cnt2lms
 import lms_mgmt
+import perf_mgmt
+import srv_mgmt
+import val_mgmt
 import vnc_mgmt
 from storyboard import Storyboard
 
@@ -25,15 +29,24 @@ from storyboard import Storyboard
 
 # Prefix of files stored in LMS repository; actual file names will be generated
 # by appending the current training session id and the extension "zip"
-ACTIVITY_NAME_FORMAT = "Activity #{}: {}"
-ACTIVITY_DESCRIPTION_FORMAT = "Added on: {}"
-LMS_PACKAGE_FILE_FORMAT = "training_content{}.zip"
+ACTIVITY_NAME_FORMAT = Storyboard.ACTIVITY_NAME_FORMAT
+ACTIVITY_DESCRIPTION_FORMAT = Storyboard.ACTIVITY_DESCRIPTION_FORMAT
+LMS_PACKAGE_FILE_FORMAT = Storyboard.LMS_PACKAGE_FILE_FORMAT
 
 # Default value of show range button flag
 ENABLE_VNC_DEFAULT = False
 # Default value of session id to make possible convert operations for testing purposes
 SESSION_ID_DEFAULT = "N"
 
+# Name format of SCORM packages converted for each of several sessions
+# (only used when packages depend on the session, i.e., VNC is enabled),
+# or for all of them when a shared package is used
+SESSION_PACKAGE_NAME_FORMAT = "{}-{}"
+
+# Number of hexadecimal digits of the content hash used in the name of
+# shared packages stored in the LMS repository
+SHARED_PACKAGE_HASH_LENGTH = 16
+
 #############################################################################
 # Functions
 #############################################################################
@@ -45,12 +58,61 @@ def usage():
     print "OPTIONS:"
     print "-h, --help                     Display this help message and exit"
     print "-c, --convert-content <FILE>   Convert training content file to SCORM package"
+    print "-m, --convert-all <FILE>       Convert all trainings in content file to SCORM packages"
+    print "-b, --convert-batch <DIR|GLOB> Convert content files in directory or matching pattern"
+    print "                               to SCORM packages in parallel"
+    print "    --incremental              Only convert trainings that changed since the last build"
+    print "                               NOTE: Usable only with 'convert-all' and 'convert-batch'"
+    print "    --no-cache                 Always convert content, even if a cached package exists"
+    print "    --validate <FILE|DIR|GLOB> Validate training content files without converting them;"
+    print "                               additional files can be given as trailing arguments"
+    print "    --timings                  Show a summary of the time spent in each operation"
+    print "    --timings-output <FILE>    Save timings and other metrics to file, in Prometheus"
+    print "                               textfile format if the name ends in '.prom', JSON otherwise"
     print "-f, --config-file <CONFIG>     Set configuration file for LMS integration tasks"
     print "                               NOTE: Required for both actions below"
-    print "-a, --add-to-lms <SESSION_NO>  Add converted package to LMS using session number"
+    print "-a, --add-to-lms <SESSION_NO>  Add converted package to LMS using session number;"
+    print "                               several sessions can be given as a list and/or range"
+    print "                               (e.g., '1-60' or '1,3,5-8') to add them in bulk"
     print "                               NOTE: Usable only together with 'convert-content'"
+    print "    --shared-package           Convert and copy one package used by all sessions, whose"
+    print "                               range access information is set per activity at runtime"
+    print "                               NOTE: Usable only with 'add-to-lms'"
+    print "-o, --session-manifest <FILE>  Write the session to activity id map of a bulk add to file"
     print "-r, --remove-from-lms <NO,ID>  Remove session with given number and activity id"
-    print "-v, --vnc-setup <SESSION_NO>   Setup VNC service for accessing the cyber range\n"
+    print "-R, --remove-all <FILE>        Remove all sessions in session manifest file"
+    print "-v, --vnc-setup <SESSION_NO>   Setup VNC service for accessing the cyber range"
+    print "    --serve <SOCKET>           Run as a server that processes convert, add, remove and"
+    print "                               vnc-setup requests received on a local Unix socket"
+    print "                               NOTE: Requires the 'config-file' option\n"
+
+
+# Parse a session list argument of the form "1,3,5-8" into a list of
+# session ids; return None if the argument is invalid
+def parse_session_list(arg):
+    session_ids = []
+    for item in arg.split(","):
+        bounds = item.split("-")
+        if len(bounds) == 2 and bounds[0].isdigit() and bounds[1].isdigit() and int(bounds[0]) <= int(bounds[1]):
+            session_ids.extend([str(number) for number in range(int(bounds[0]), int(bounds[1]) + 1)])
+        elif len(bounds) == 1 and bounds[0]:
+            session_ids.append(bounds[0])
+        else:
+            return None
+    return session_ids
+
+# Read a session manifest file (a JSON object that maps session ids to
+# activity ids); return None on error
+def read_session_manifest(manifest_file):
+    try:
+        with open(manifest_file) as manifest_stream:
+            session_manifest = json.load(manifest_stream)
+        if isinstance(session_manifest, dict):
+            return session_manifest
+        logging.error("Invalid format of session manifest file '{}'.".format(manifest_file))
+    except (IOError, ValueError) as e:
+        logging.error("Cannot read session manifest file '{}': {}".format(manifest_file, str(e)))
+    return None
 
 
 #############################################################################
@@ -64,15 +126,29 @@ def main(args):
 
     # Program parameters and their default values
     yaml_file = None
+    batch_pattern = None
+    incremental = False
     config_file = None
     session_id = None
+    session_ids = None
     activity_id = None
+    session_manifest_file = None
+    shared_package = False
 
     # Program actions
     convert_action = False
+    convert_all_action = False
+    convert_batch_action = False
     add_to_lms_action = False
     remove_from_lms_action = False
+    remove_all_action = False
     vnc_setup_action = False
+    serve_action = False
+    socket_path = None
+    validate_action = False
+    validate_patterns = []
+    show_timings = False
+    timings_file = None
 
     # Get program directory
     dir_path = os.path.dirname(os.path.realpath(__file__))
@@ -97,9 +173,12 @@ def main(args):
     # Parse command line arguments
     try:
         # Make sure to add ':' for short-form and '=' for long-form options that require an argument
-        opts, trailing_args = getopt.getopt(args, "hc:f:a:r:v:",
-                                            ["help", "convert-content=", "config-file=",
-                                             "add-to-lms=", "remove-from-lms=", "vnc-setup="])
+        opts, trailing_args = getopt.getopt(args, "hc:m:b:f:a:o:r:R:v:",
+                                            ["help", "convert-content=", "convert-all=", "convert-batch=",
+                                             "incremental", "no-cache", "config-file=", "add-to-lms=",
+                                             "session-manifest=", "remove-from-lms=", "remove-all=",
+                                             "vnc-setup=", "serve=", "validate=", "timings",
+                                             "timings-output=", "shared-package"])
     except getopt.GetoptError as err:
         logging.error("Command-line argument error: {}".format(str(err)))
         usage()
@@ -112,11 +191,32 @@ def main(args):
         elif opt in ("-c", "--convert-content"):
             yaml_file = os.path.abspath(arg)
             convert_action = True
+        elif opt in ("-m", "--convert-all"):
+            yaml_file = os.path.abspath(arg)
+            convert_all_action = True
+        elif opt in ("-b", "--convert-batch"):
+            batch_pattern = arg
+            convert_batch_action = True
+        elif opt == "--incremental":
+            incremental = True
+        elif opt == "--no-cache":
+            cnt2lms.USE_CONVERSION_CACHE = False
         elif opt in ("-f", "--config-file"):
             config_file = os.path.abspath(arg)
         elif opt in ("-a", "--add-to-lms"):
-            session_id = arg
+            session_ids = parse_session_list(arg)
+            if not session_ids:
+                logging.error("Action 'add-to-lms' requires a session number or a list of session numbers (e.g., '1-60'),\n\t"\
+                              "but a different format was encountered: '{}'".format(arg))
+                usage()
+                sys.exit(1)
+            if len(session_ids) == 1:
+                session_id = session_ids[0]
             add_to_lms_action = True
+        elif opt == "--shared-package":
+            shared_package = True
+        elif opt in ("-o", "--session-manifest"):
+            session_manifest_file = os.path.abspath(arg)
         elif opt in ("-r", "--remove-from-lms"):
             id_list = arg.split(",")
             # Check that split resulted in exactly 2 non-empty strings
@@ -129,28 +229,51 @@ def main(args):
                               "but a different format was encountered: '{}'".format(arg))
                 usage()
                 sys.exit(1)
+        elif opt in ("-R", "--remove-all"):
+            session_manifest_file = os.path.abspath(arg)
+            remove_all_action = True
         elif opt in ("-v", "--vnc-setup"):
             session_id = arg
             vnc_setup_action = True
+        elif opt == "--serve":
+            socket_path = os.path.abspath(arg)
+            serve_action = True
+        elif opt == "--validate":
+            validate_patterns.append(arg)
+            validate_action = True
+        elif opt == "--timings":
+            show_timings = True
+        elif opt == "--timings-output":
+            timings_file = os.path.abspath(arg)
         else:
             # Nothing to be done on else, since unrecognized options are caught by
             # the getopt.GetoptError exception above
             pass
 
-    if trailing_args:
+    # Trailing arguments are additional files to validate (e.g., when
+    # used as a pre-commit check), and are not accepted otherwise
+    if trailing_args and validate_action:
+        validate_patterns.extend(trailing_args)
+    elif trailing_args:
         logging.error("Unrecognized trailing arguments {} => abort execution.".format(trailing_args))
         usage()
         sys.exit(1)
 
+    # Enable instrumentation if requested (metrics are reported at exit)
+    if show_timings or timings_file:
+        perf_mgmt.report_at_exit(show_timings, timings_file)
+
     # Initialize additional variables
     if config_file:
-        cfg_manager = cfg_mgmt.CfgManager(config_file)
+        cfg_manager = cfg_mgmt.get_cfg_manager(config_file)
     else:
         cfg_manager = None
     scorm_file = None
 
     # Check that at least one action is enabled
-    if not (convert_action or add_to_lms_action or remove_from_lms_action or vnc_setup_action):
+    if not (convert_action or convert_all_action or convert_batch_action
+            or add_to_lms_action or remove_from_lms_action or remove_all_action or vnc_setup_action
+            or serve_action or validate_action):
         logging.error("No action argument was provided => abort execution.")
         usage()
         sys.exit(1)
@@ -160,6 +283,38 @@ def main(args):
         logging.error("The actions 'convert-content' and 'remove-from-lms' are not compatible => abort execution.")
         usage()
         sys.exit(1)
+    if serve_action and (convert_action or convert_all_action or convert_batch_action or add_to_lms_action
+                         or remove_from_lms_action or remove_all_action or vnc_setup_action):
+        logging.error("The action 'serve' cannot be used together with other actions => abort execution.")
+        usage()
+        sys.exit(1)
+    if validate_action and (convert_action or convert_all_action or convert_batch_action or add_to_lms_action
+                            or remove_from_lms_action or remove_all_action or vnc_setup_action or serve_action):
+        logging.error("The action 'validate' cannot be used together with other actions => abort execution.")
+        usage()
+        sys.exit(1)
+    if remove_all_action and (convert_action or add_to_lms_action or remove_from_lms_action or vnc_setup_action):
+        logging.error("The action 'remove-all' cannot be used together with other actions => abort execution.")
+        usage()
+        sys.exit(1)
+    if add_to_lms_action and len(session_ids) > 1 and vnc_setup_action:
+        logging.error("The action 'vnc-setup' cannot be used together with a bulk 'add-to-lms' => abort execution.")
+        usage()
+        sys.exit(1)
+    if shared_package and (not add_to_lms_action or vnc_setup_action):
+        logging.error("The option 'shared-package' can only be used with 'add-to-lms' (without 'vnc-setup') => abort execution.")
+        usage()
+        sys.exit(1)
+    if convert_all_action and (convert_action or add_to_lms_action or remove_from_lms_action or remove_all_action
+                               or vnc_setup_action):
+        logging.error("The action 'convert-all' cannot be used together with other actions => abort execution.")
+        usage()
+        sys.exit(1)
+    if convert_batch_action and (convert_action or convert_all_action or add_to_lms_action
+                                 or remove_from_lms_action or remove_all_action or vnc_setup_action):
+        logging.error("The action 'convert-batch' cannot be used together with other actions => abort execution.")
+        usage()
+        sys.exit(1)
 
     # Set show range flag from configuration file or default value
     if cfg_manager:
@@ -172,6 +327,48 @@ def main(args):
         logging.debug("Use default value of enable_vnc flag: {}".format(ENABLE_VNC_DEFAULT))
         enable_vnc = ENABLE_VNC_DEFAULT
 
+    # Proceed with the validate action
+    if validate_action:
+        input_files = []
+        for validate_pattern in validate_patterns:
+            content_files = cnt2lms.find_content_files(validate_pattern)
+            if not content_files:
+                logging.error("No training content files found for '{}'.".format(validate_pattern))
+                sys.exit(1)
+            input_files.extend(content_files)
+        # Report all the errors in all the files, and a summary
+        content_validator = val_mgmt.get_content_validator()
+        failure_count = 0
+        for input_file in input_files:
+            errors = content_validator.validate_file(input_file)
+            if errors:
+                logging.error("- INVALID: '{}'".format(input_file))
+                for error in errors:
+                    logging.error("    {}".format(error))
+                failure_count += 1
+            else:
+                logging.info("- OK: '{}'".format(input_file))
+        if failure_count:
+            logging.error("Found errors in {} out of {} training content file(s)."
+                          .format(failure_count, len(input_files)))
+            sys.exit(1)
+        logging.info("Validated {} training content file(s) successfully.".format(len(input_files)))
+        sys.exit()
+
+    # Proceed with the serve action
+    if serve_action:
+        if not config_file:
+            logging.error("Configuration file name is undefined => abort execution.\n\t (Note that the 'serve' action requires the 'config-file' option.)")
+            usage()
+            sys.exit(1)
+        try:
+            server = srv_mgmt.CylmsServer(socket_path, config_file, dir_path)
+        except (IOError, OSError) as e:
+            logging.error("Cannot serve requests on socket '{}': {}".format(socket_path, str(e)))
+            sys.exit(1)
+        server.run()
+        sys.exit()
+
     # Proceed with the convert-content action
     if convert_action:
         logging.info("Convert training content file '{}' to SCORM package.".format(yaml_file))
@@ -180,7 +377,33 @@ def main(args):
         # Convert content to SCORM package
         if not session_id:
             session_id = SESSION_ID_DEFAULT
-        scorm_file, training_title = cnt2lms.yaml2scorm(yaml_file, scorm_file_base, dir_path, enable_vnc, session_id, config_file)
+        if shared_package:
+            # Convert content once for all sessions, since shared packages don't depend on the session
+            scorm_file_base = SESSION_PACKAGE_NAME_FORMAT.format(yaml_file, cnt2lms.SHARED_SESSION_ID)
+            scorm_file, training_title = cnt2lms.yaml2scorm(yaml_file, scorm_file_base, dir_path, enable_vnc,
+                                                            cnt2lms.SHARED_SESSION_ID, config_file)
+        elif session_ids and len(session_ids) > 1:
+            # Convert content once per session if packages depend on the session
+            # (i.e., VNC is enabled), otherwise the same package is used for all
+            # sessions; it is then converted with the default session id rather
+            # than that of any of the sessions, since its range access information
+            # is not used (the range button is hidden)
+            scorm_files = {}
+            if not enable_vnc:
+                scorm_file, training_title = cnt2lms.yaml2scorm(yaml_file, scorm_file_base, dir_path, enable_vnc,
+                                                                SESSION_ID_DEFAULT, config_file)
+                if scorm_file:
+                    scorm_files = dict([(bulk_session_id, scorm_file) for bulk_session_id in session_ids])
+            else:
+                for bulk_session_id in session_ids:
+                    scorm_file_base = SESSION_PACKAGE_NAME_FORMAT.format(yaml_file, bulk_session_id)
+                    scorm_file, training_title = cnt2lms.yaml2scorm(yaml_file, scorm_file_base, dir_path, enable_vnc,
+                                                                    bulk_session_id, config_file)
+                    if not scorm_file:
+                        break
+                    scorm_files[bulk_session_id] = scorm_file
+        else:
+            scorm_file, training_title = cnt2lms.yaml2scorm(yaml_file, scorm_file_base, dir_path, enable_vnc, session_id, config_file)
         # Check whether the conversion was successful
         if scorm_file:
             logging.debug("Converted training content file '{}' successfully.".format(yaml_file))
@@ -188,6 +411,118 @@ def main(args):
             logging.error("Failed to convert training content file '{}'.".format(yaml_file))
             sys.exit(1)
 
+    # Proceed with the convert-all action
+    if convert_all_action:
+        logging.info("Convert all trainings in content file '{}' to SCORM packages.".format(yaml_file))
+        if not session_id:
+            session_id = SESSION_ID_DEFAULT
+        results = cnt2lms.yaml2scorm_all(yaml_file, yaml_file, dir_path, enable_vnc, session_id, config_file,
+                                         incremental)
+        if not results:
+            logging.error("Failed to convert training content file '{}'.".format(yaml_file))
+            sys.exit(1)
+        failure_count = 0
+        for scorm_file, training_title in results:
+            if not scorm_file:
+                failure_count += 1
+        if failure_count:
+            logging.error("Failed to convert {} out of {} training(s) in file '{}'."
+                          .format(failure_count, len(results), yaml_file))
+            sys.exit(1)
+        logging.info("Converted {} training(s) in file '{}' successfully.".format(len(results), yaml_file))
+        sys.exit()
+
+    # Proceed with the convert-batch action
+    if convert_batch_action:
+        input_files = cnt2lms.find_content_files(batch_pattern)
+        if not input_files:
+            logging.error("No training content files found for '{}'.".format(batch_pattern))
+            sys.exit(1)
+        logging.info("Convert training content files for '{}' to SCORM packages.".format(batch_pattern))
+        if not session_id:
+            session_id = SESSION_ID_DEFAULT
+        results = cnt2lms.yaml2scorm_batch(input_files, dir_path, enable_vnc, session_id, config_file,
+                                           incremental=incremental)
+        # Report the result for each file, and a summary
+        failure_count = 0
+        for input_file, scorm_file, training_title in results:
+            if scorm_file:
+                logging.info("- OK: '{}' => '{}'".format(input_file, scorm_file))
+            else:
+                logging.error("- FAILED: '{}'".format(input_file))
+                failure_count += 1
+        if failure_count:
+            logging.error("Failed to convert {} out of {} training(s) in {} training content file(s)."
+                          .format(failure_count, len(results), len(input_files)))
+            sys.exit(1)
+        logging.info("Converted {} training(s) in {} training content file(s) successfully."
+                     .format(len(results), len(input_files)))
+        sys.exit()
+
+    # Proceed with the add-to-lms action for several sessions (or for a shared package)
+    if add_to_lms_action and (len(session_ids) > 1 or shared_package):
+        if not scorm_file:
+            logging.error("SCORM package file name is undefined => abort execution.\n\t (Note that the 'add-to-lms' action can only be used together with 'convert-content'.)")
+            usage()
+            sys.exit(1)
+        if not config_file:
+            logging.error("Configuration file name is undefined => abort execution.\n\t (Note that the 'add-to-lms' action requires the 'config-file' option.)")
+            usage()
+            sys.exit(1)
+        logging.info("Add converted SCORM packages to LMS for {} sessions.".format(len(session_ids)))
+        lms_manager = lms_mgmt.LmsManager(config_file)
+
+        # Copy all packages in one transfer, then add all activities at once; a
+        # shared package is copied only once (under a name derived from its content),
+        # and the session file of each activity is given instead
+        if shared_package:
+            target_file = Storyboard.LMS_SHARED_PACKAGE_FILE_FORMAT.format(
+                lms_mgmt.get_file_hash(scorm_file)[:SHARED_PACKAGE_HASH_LENGTH])
+            packages = [(scorm_file, target_file)]
+            target_files = dict([(bulk_session_id, target_file) for bulk_session_id in session_ids])
+            session_files = dict([(bulk_session_id, cnt2lms.get_session_file(enable_vnc, bulk_session_id, config_file))
+                                  for bulk_session_id in session_ids])
+        else:
+            target_files = dict([(bulk_session_id, LMS_PACKAGE_FILE_FORMAT.format(bulk_session_id))
+                                 for bulk_session_id in session_ids])
+            packages = [(scorm_files[bulk_session_id], target_files[bulk_session_id]) for bulk_session_id in session_ids]
+            session_files = None
+        if not lms_manager.copy_packages(packages):
+            logging.error("SCORM package copy to LMS repository failed => abort execution.")
+            sys.exit(1)
+        activity_description = ACTIVITY_DESCRIPTION_FORMAT.format(time.strftime("%Y-%m-%d %H:%M:%S"))
+        activities = [(bulk_session_id,
+                       ACTIVITY_NAME_FORMAT.format(bulk_session_id, training_title.encode('utf-8')),
+                       activity_description, target_files[bulk_session_id])
+                      for bulk_session_id in session_ids]
+        activity_ids = lms_manager.add_activities(activities, session_files)
+        if not activity_ids:
+            logging.error("Failed to add converted SCORM packages to LMS.")
+            sys.exit(1)
+
+        # Report the activity id of each session, and save them if requested
+        failure_count = 0
+        for bulk_session_id in session_ids:
+            if activity_ids[bulk_session_id]:
+                logging.info("- Session #{} => activity_id={}".format(bulk_session_id, activity_ids[bulk_session_id]))
+            else:
+                logging.error("- Session #{} => FAILED".format(bulk_session_id))
+                failure_count += 1
+        if session_manifest_file:
+            session_manifest = dict([(bulk_session_id, activity_id) for bulk_session_id, activity_id
+                                     in activity_ids.items() if activity_id])
+            try:
+                with open(session_manifest_file, "w") as manifest_stream:
+                    json.dump(session_manifest, manifest_stream, indent=2, sort_keys=True, separators=(",", ": "))
+            except IOError as e:
+                logging.error("Cannot write session manifest file '{}': {}".format(session_manifest_file, str(e)))
+                sys.exit(1)
+        if failure_count:
+            logging.error("Failed to add {} out of {} session(s) to LMS.".format(failure_count, len(session_ids)))
+            sys.exit(1)
+        logging.info("Added {} session(s) to LMS successfully.".format(len(session_ids)))
+        sys.exit()
+
     # Proceed with the add-to-lms action
     if add_to_lms_action:
         # Check whether the SCORM package name is defined
@@ -269,7 +604,7 @@ def main(args):
                 # Create a VNC manager object
                 vnc_manager = vnc_mgmt.VncManager(config_file)
                 if vnc_manager:
-                    vnc_ports = vnc_manager.get_range_info(session_id)
+                    vnc_ports = vnc_manager.get_session_ports(session_id)
                     if vnc_ports:
                         if vnc_manager.stop_novnc_servers(session_id, vnc_ports):
                             logging.debug("Stopped VNC servers for session #{} successfully.".format(session_id))
@@ -288,6 +623,35 @@ def main(args):
                 usage()
                 sys.exit(1)
 
+    # Proceed with the remove-all action
+    if remove_all_action:
+        if not config_file:
+            logging.error("Configuration file name is undefined => abort execution.\n\t (Note that the 'remove-all' action requires the 'config-file' option.)")
+            usage()
+            sys.exit(1)
+        session_manifest = read_session_manifest(session_manifest_file)
+        if session_manifest is None:
+            sys.exit(1)
+        logging.info("Remove {} session(s) in file '{}' from LMS.".format(len(session_manifest), session_manifest_file))
+
+        # Delete all activities at once
+        lms_manager = lms_mgmt.LmsManager(config_file)
+        activities = [(bulk_session_id, activity_id, LMS_PACKAGE_FILE_FORMAT.format(bulk_session_id))
+                      for bulk_session_id, activity_id in sorted(session_manifest.items())]
+        status = lms_manager.delete_activities(activities)
+        failure_count = len([bulk_session_id for bulk_session_id in status if not status[bulk_session_id]])
+        if failure_count:
+            logging.error("Failed to remove {} out of {} session(s) from LMS.".format(failure_count, len(status)))
+
+        # Stop the noVNC servers of all sessions (if enabled)
+        if enable_vnc:
+            vnc_manager = vnc_mgmt.VncManager(config_file)
+            for bulk_session_id, activity_id in sorted(session_manifest.items()):
+                vnc_ports = vnc_manager.get_session_ports(bulk_session_id)
+                if not vnc_ports or not vnc_manager.stop_novnc_servers(bulk_session_id, vnc_ports):
+                    logging.error("Failed to stop VNC servers for session #{}.".format(bulk_session_id))
+        sys.exit()  # Not fatal error anymore, as for 'remove-from-lms'
+
     # Proceed with the vnc-setup action
     if vnc_setup_action:
         if session_id :
@@ -305,7 +669,7 @@ def main(args):
                     vnc_ports = vnc_manager.get_range_info(session_id)
                     if vnc_ports:
                         if vnc_manager.create_access_file(session_id, vnc_ports):
-                            if vnc_manager.start_novnc_servers(vnc_ports):
+                            if vnc_manager.start_novnc_servers(vnc_ports, session_id):
                                 logging.debug("Started VNC servers for session #{} successfully.".format(session_id))
                                 sys.exit()  # It is OK to exit here as no command chaining is possible
                             else:
@@ -0,0 +1,276 @@
+#############################################################################
+# Job queue management for CyLMS
+#############################################################################
+
+# External imports
+import itertools
+import logging
+import Queue
+import random
+import subprocess
+import sys
+import threading
+import time
+
+#############################################################################
+# Constants
+#############################################################################
+
+# Default number of jobs that run concurrently; note that SSH servers limit
+# the number of sessions per multiplexed connection (MaxSessions, 10 by default)
+DEFAULT_CONCURRENCY = 8
+
+# Retry settings: number of retries after the first attempt, delay before the
+# first retry (seconds), factor by which the delay grows for each retry, and
+# maximum random fraction added to the delay so that retries are spread out
+DEFAULT_MAX_RETRIES = 3
+DEFAULT_RETRY_DELAY = 1.0
+RETRY_BACKOFF_FACTOR = 2
+RETRY_JITTER = 0.25
+
+# Time (in seconds) during which finished jobs are kept so that their
+# status can be retrieved
+JOB_RETENTION_TIME = 3600
+
+# Job states
+JOB_PENDING = "pending"
+JOB_RUNNING = "running"
+JOB_RETRYING = "retrying"
+JOB_SUCCEEDED = "succeeded"
+JOB_FAILED = "failed"
+
+#############################################################################
+# Class that represents a job, i.e., a function call run by the job manager
+#############################################################################
+class Job:
+
+    # Constructor
+    def __init__(self, job_id, name, function, args):
+        self.job_id = job_id
+        self.name = name
+        self.function = function
+        self.args = args
+        self.status = JOB_PENDING
+        self.result = None
+        self.error = None
+        self.attempts = 0
+        self.submit_time = time.time()
+        self.end_time = None
+        self.done_event = threading.Event()
+
+    # Check whether the job has finished (successfully or not)
+    def is_done(self):
+        return self.done_event.is_set()
+
+    # Get the job information as a dictionary
+    def get_info(self):
+        info = {"id": self.job_id, "name": self.name, "status": self.status, "attempts": self.attempts,
+                "result": self.result, "error": self.error}
+        if self.end_time:
+            info["duration"] = round(self.end_time - self.submit_time, 3)
+        return info
+
+
+#############################################################################
+# Class that runs jobs concurrently using a pool of worker threads; a job
+# fails if its function returns None or False (the error convention used by
+# the managers) or raises an exception; failed jobs are retried with
+# exponential backoff, but only if a transient error (see below) occurred,
+# since other errors would happen again
+#############################################################################
+class JobManager:
+
+    # Constructor
+    def __init__(self, concurrency=DEFAULT_CONCURRENCY, max_retries=DEFAULT_MAX_RETRIES,
+                 retry_delay=DEFAULT_RETRY_DELAY):
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self.jobs = {}
+        self.jobs_lock = threading.Lock()
+        self.job_ids = itertools.count(1)
+        self.job_queue = Queue.Queue()
+        self.workers = []
+        for index in range(max(1, concurrency)):
+            worker = threading.Thread(target=self.run_worker, name="cylms-job-worker-{}".format(index + 1))
+            worker.daemon = True
+            worker.start()
+            self.workers.append(worker)
+
+    # Submit a job that calls the function with the given arguments;
+    # return the job id
+    def submit(self, name, function, *args):
+        self.purge()
+        with self.jobs_lock:
+            job = Job(next(self.job_ids), name, function, args)
+            self.jobs[job.job_id] = job
+        logging.debug("Submit job #{}: {}".format(job.job_id, name))
+        self.job_queue.put(job)
+        return job.job_id
+
+    # Get the job with given id (or None if there is no such job)
+    def get_job(self, job_id):
+        with self.jobs_lock:
+            return self.jobs.get(job_id)
+
+    # Get the information about the job with given id (or None if there is no such job)
+    def get_status(self, job_id):
+        job = self.get_job(job_id)
+        if job:
+            return job.get_info()
+        return None
+
+    # Wait until the given jobs (all jobs if none are given) are done, or the
+    # timeout (in seconds) expires; return the list of jobs
+    def wait(self, job_ids=None, timeout=None):
+        with self.jobs_lock:
+            if job_ids is None:
+                job_ids = sorted(self.jobs)
+            jobs = [self.jobs[job_id] for job_id in job_ids if job_id in self.jobs]
+        end_time = None
+        if timeout is not None:
+            end_time = time.time() + timeout
+        for job in jobs:
+            if end_time is None:
+                # Waiting without a timeout cannot be interrupted in Python 2,
+                # hence we wait in steps
+                while not job.done_event.wait(1):
+                    pass
+            else:
+                job.done_event.wait(max(0, end_time - time.time()))
+        return jobs
+
+    # Remove the jobs that finished more than the given time ago (in seconds)
+    # from the job list, so that they don't accumulate in long-running processes
+    def purge(self, max_age=JOB_RETENTION_TIME):
+        current_time = time.time()
+        with self.jobs_lock:
+            for job_id in [job_id for job_id, job in self.jobs.items()
+                           if job.is_done() and current_time - job.end_time >= max_age]:
+                del self.jobs[job_id]
+
+    # Stop the worker threads after the queued jobs are done
+    def shutdown(self):
+        for worker in self.workers:
+            self.job_queue.put(None)
+        for worker in self.workers:
+            worker.join()
+        self.workers = []
+
+    # Run jobs from the queue until a stop request (None) is received
+    def run_worker(self):
+        while True:
+            job = self.job_queue.get()
+            if job is None:
+                break
+            self.run_job(job)
+
+    # Run a job, retrying it if it fails because of a transient error
+    def run_job(self, job):
+        while True:
+            job.attempts += 1
+            job.status = JOB_RUNNING
+            pop_transient_error()
+            try:
+                job.result = job.function(*job.args)
+                job.error = None
+                if job.result is not None and job.result is not False:
+                    job.status = JOB_SUCCEEDED
+                    break
+                job.error = "Operation failed"
+            except subprocess.CalledProcessError as error:
+                job.error = "Command failed: {}".format(error.output.rstrip() if error.output else error.returncode)
+            except Exception as error:
+                job.error = "{}: {}".format(type(error).__name__, str(error))
+
+            if pop_transient_error() is None:
+                job.status = JOB_FAILED
+                logging.error("Job #{} ({}) failed (not retried, as the error is not transient): {}"
+                              .format(job.job_id, job.name, job.error))
+                break
+            if job.attempts > self.max_retries:
+                job.status = JOB_FAILED
+                logging.error("Job #{} ({}) failed after {} attempt(s): {}"
+                              .format(job.job_id, job.name, job.attempts, job.error))
+                break
+
+            # Wait before retrying, with exponential backoff
+            delay = self.retry_delay * (RETRY_BACKOFF_FACTOR ** (job.attempts - 1))
+            delay *= 1 + random.uniform(0, RETRY_JITTER)
+            logging.warning("Job #{} ({}) failed => retry in {:.1f} s: {}".format(job.job_id, job.name, delay, job.error))
+            job.status = JOB_RETRYING
+            time.sleep(delay)
+
+        job.end_time = time.time()
+        job.done_event.set()
+
+
+#############################################################################
+# Functions
+#############################################################################
+
+# Transient errors (e.g., connection failures) are recorded by the managers
+# when handling the errors of their transports, since managers report errors
+# via their return value; they are recorded per thread, i.e., for the job
+# that runs in the thread
+transient_errors = threading.local()
+
+# Record a transient error, that is, an error that may not happen again when
+# retrying, and after which the operation can safely be run again
+def record_transient_error(error):
+    transient_errors.error = error
+
+# Record the error of a transport (e.g., SSH or web services) as transient
+# error if the transport determined that the failed operation can safely be
+# run again (see its 'retryable' attribute)
+def record_error(error):
+    if getattr(error, "retryable", False):
+        record_transient_error(error)
+
+# Get and clear the transient error recorded for the current thread (if any)
+def pop_transient_error():
+    error = getattr(transient_errors, "error", None)
+    transient_errors.error = None
+    return error
+
+
+#############################################################################
+# Main program (used for testing purposes)
+#############################################################################
+def main(args):
+
+    # Configure logging level for running the tests below
+    logging.basicConfig(level=logging.INFO,
+                        format='* %(levelname)s: %(filename)s: %(message)s')
+
+    # Run a number of simulated operations that take some time, some of which
+    # fail once because of a transient error and are then retried, while others
+    # fail because of a permanent error
+    job_count = 20
+    if args:
+        job_count = int(args[0])
+    failures = set(range(0, job_count, 5))
+    def simulated_operation(index):
+        time.sleep(0.5)
+        if index in failures:
+            failures.remove(index)
+            record_transient_error(IOError("Simulated connection failure"))
+            return None
+        if index % 7 == 6:
+            return None
+        return index * 10
+
+    job_manager = JobManager(retry_delay=0.1)
+    start_time = time.time()
+    job_ids = [job_manager.submit("Operation #{}".format(index), simulated_operation, index) for index in range(job_count)]
+    jobs = job_manager.wait(job_ids)
+    logging.info("Ran {} job(s) in {:.2f} s:".format(len(jobs), time.time() - start_time))
+    for job in jobs:
+        logging.info("  - {}".format(job.get_info()))
+    job_manager.shutdown()
+
+
+#############################################################################
+# Run main program
+#############################################################################
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -6,24 +6,51 @@
 # External imports
 import subprocess
 import logging
+import csv
+import base64
+import hashlib
+import json
 import os
+import pipes
+import re
+import shutil
 import sys
+import tempfile
+import time
 
 # Internal imports
 import cfg_mgmt
+import job_mgmt
+import perf_mgmt
+import sim_mgmt
+import ssh_mgmt
+import ws_mgmt
 from storyboard import Storyboard
 
 #############################################################################
 # Constants
 #############################################################################
 
-## Simulation mode flag for testing purposes
+## Simulation mode flag for testing purposes (operations do nothing and
+## return fixed values; use the local backend to simulate an actual LMS)
 SIMULATION_MODE = False
 
-## ssh connection options (need to be separated because of limitations on how
-## options are passed to subprocess.check_output() calls)
-SSH_OPT1 = "-o UserKnownHostsFile=/dev/null"
-SSH_OPT2 = "-o StrictHostKeyChecking=no"
+## LMS backends: moosh commands run on the LMS host via SSH, or on a local
+## stand-in LMS (see sim_mgmt.py) whose database is relative to the program path;
+## alternatively, the Moodle web services are called over HTTP
+LMS_BACKEND_MOOSH = "moosh"
+LMS_BACKEND_LOCAL = "local"
+LMS_BACKEND_REST = "rest"
+LOCAL_DATABASE_FILE = "cache/lms_sim.db"
+LOCAL_HOST_PREFIX = "local:"
+
+## Web service-related constants
+### Course listing and module deletion are done by Moodle core functions,
+### while SCORM activities are added by the CyLMS plugin of Moodle (see
+### the directory moodle_plugin)
+WS_GET_COURSES_FUNCTION = "core_course_get_courses"
+WS_ADD_ACTIVITIES_FUNCTION = "local_cylms_add_scorm_activities"
+WS_DELETE_MODULES_FUNCTION = "core_course_delete_modules"
 
 ## Moosh-related constants
 MOOSH_COMMAND = "/root/moosh/moosh.php -p /var/www/html/moodle/"
@@ -37,11 +64,111 @@ UPDATE_FREQUENCY_OPTION = "updatefreq"
 SCORM_UPDATE_NEVER = 0
 #SCORM_UPDATE_EVERYTIME = 3
 
+## Bulk operation-related constants
+### Bulk operations run a single PHP script on the LMS host, so that Moodle
+### is bootstrapped only once for all the activities
+MOODLE_PATH = "/var/www/html/moodle/"
+PHP_COMMAND = "php"
+### The script request is embedded as base64-encoded JSON, and the results are
+### printed as JSON on a line starting with the marker below
+SCRIPT_REQUEST_TAG = "%REQUEST%"
+SCRIPT_MOODLE_PATH_TAG = "%MOODLE_PATH%"
+SCRIPT_RESULT_MARKER = "CYLMS_RESULT:"
+SCRIPT_HEADER = """<?php
+define('CLI_SCRIPT', true);
+require('%MOODLE_PATH%config.php');
+require_once($CFG->dirroot . '/course/lib.php');
+\\core\\session\\manager::set_user(get_admin());
+$request = json_decode(base64_decode('%REQUEST%'), true);
+$results = array();
+"""
+SCRIPT_FOOTER = """
+echo "\\nCYLMS_RESULT:" . json_encode((object) $results) . "\\n";
+"""
+ADD_ACTIVITIES_SCRIPT = SCRIPT_HEADER + """
+require_once($CFG->libdir . '/testing/generator/data_generator.php');
+$generator = new testing_data_generator();
+foreach ($request['activities'] as $activity) {
+    try {
+        $moduledata = new stdClass();
+        $moduledata->course = $request['course'];
+        $moduledata->section = $request['section'];
+        foreach ($activity['options'] as $key => $value) {
+            $moduledata->$key = $value;
+        }
+        $record = $generator->create_module('scorm', $moduledata);
+        if (isset($activity['sessionfile'])) {
+            // Replace the default session file of the extracted shared package
+            $fs = get_file_storage();
+            $fileinfo = array('contextid' => context_module::instance($record->cmid)->id,
+                              'component' => 'mod_scorm', 'filearea' => 'content', 'itemid' => 0,
+                              'filepath' => $request['sessionfilepath'], 'filename' => $request['sessionfilename']);
+            if ($file = $fs->get_file($fileinfo['contextid'], $fileinfo['component'], $fileinfo['filearea'],
+                                      $fileinfo['itemid'], $fileinfo['filepath'], $fileinfo['filename'])) {
+                $file->delete();
+            }
+            $fs->create_file_from_string($fileinfo, $activity['sessionfile']);
+        }
+        $results[$activity['session']] = array('id' => $record->cmid);
+    } catch (Exception $e) {
+        $results[$activity['session']] = array('error' => $e->getMessage());
+    }
+}
+""" + SCRIPT_FOOTER
+DELETE_ACTIVITIES_SCRIPT = SCRIPT_HEADER + """
+foreach ($request['activities'] as $activity) {
+    try {
+        // Shared packages are removed once no remaining activity uses them
+        $cm = get_coursemodule_from_id('scorm', $activity['id']);
+        $reference = $cm ? $DB->get_field('scorm', 'reference', array('id' => $cm->instance)) : false;
+        course_delete_module($activity['id']);
+        @unlink($activity['package']);
+        if ($reference && strpos($reference, $request['sharedprefix']) === 0
+                && !$DB->record_exists('scorm', array('reference' => $reference))) {
+            @unlink($request['repository'] . basename($reference));
+        }
+        $results[$activity['session']] = array('id' => $activity['id']);
+    } catch (Exception $e) {
+        $results[$activity['session']] = array('error' => $e->getMessage());
+    }
+}
+""" + SCRIPT_FOOTER
+NAME_OPTION = "name"
+SHOW_DESCRIPTION_OPTION = "showdescription"
+STAGING_DIR_PREFIX = "cylms-upload-"
+### Prefix of the names of shared packages (used by the activities of several
+### sessions), which Moodle stores as reference of the SCORM activities
+SHARED_PACKAGE_PREFIX = Storyboard.LMS_SHARED_PACKAGE_FILE_FORMAT.split("{}")[0]
+
+## Package transfer-related constants
+### Packages whose content hash is the same as that of the file in the repository
+### are not transferred again; hashes of repository files are computed on the host
+HASH_COMMAND = "sha256sum"
+HASH_OUTPUT_REGEX = re.compile(r"^([0-9a-f]{64}) [ *](.+)$")
+HASH_CHUNK_SIZE = 64 * 1024
+
+## Course list-related constants
+### Columns in moosh course-list output lines of form "2","Top/CROND","CyTrONE","CyTrONE Training","1"
+COURSE_ID_COLUMN = 0
+COURSE_SHORTNAME_COLUMN = 2
+COURSE_FULLNAME_COLUMN = 3
+### Course id disk cache file (relative to the program path); it is only used when
+### the cache time to live (in seconds) is set in the configuration file
+COURSE_CACHE_FILE = "cache/course_ids.json"
+TEMP_CACHE_PREFIX = ".cylms-"
+
 ## Test action-related constants
 GET_ID_ACTION = 0
 ADD_ACTION = 1
 DELETE_ACTION = 2
 COPY_ACTION = 3
+INVALIDATE_ACTION = 4
+BULK_ADD_ACTION = 5
+BULK_DELETE_ACTION = 6
+
+# Course name to id indexes built from the course list, indexed by LMS host,
+# so that the course list is retrieved only once per process
+course_indexes = {}
 
 
 #############################################################################
@@ -52,23 +179,73 @@ class LmsManager:
     # Constructor
     def __init__(self, config_file):
 
-        # Initialize configuration manager
-        self.cfg_manager = cfg_mgmt.CfgManager(config_file)
+        # Initialize configuration manager (shared with other managers)
+        self.cfg_manager = cfg_mgmt.get_cfg_manager(config_file)
 
         # Initialize internal variables
         self.lms_host = self.cfg_manager.get_setting(Storyboard.CONFIG_LMS_HOST)
         self.lms_repository = self.cfg_manager.get_setting(Storyboard.CONFIG_LMS_REPOSITORY)
         self.course_name = self.cfg_manager.get_setting(Storyboard.CONFIG_COURSE_NAME)
         self.section_id = self.cfg_manager.get_setting(Storyboard.CONFIG_SECTION_ID)
+        course_cache_ttl = self.cfg_manager.get_setting(Storyboard.CONFIG_COURSE_CACHE_TTL)
+        self.course_cache_ttl = int(course_cache_ttl) if course_cache_ttl else 0
+        self.course_cache_file = os.path.join(os.path.dirname(os.path.realpath(__file__)), COURSE_CACHE_FILE)
+        self.lms_backend = self.cfg_manager.get_setting(Storyboard.CONFIG_LMS_BACKEND) or LMS_BACKEND_MOOSH
+
+        # All commands and file transfers go through the same connection, either
+        # to the LMS host or to the local stand-in LMS; with the REST backend,
+        # all requests go through the same web service client instead
+        self.connection = None
+        self.ws_client = None
+        # Draft area ids of the packages uploaded via web services, indexed by target file
+        self.draft_item_ids = {}
+        if self.lms_backend == LMS_BACKEND_MOOSH:
+            self.connection = ssh_mgmt.get_connection(self.lms_host)
+        elif self.lms_backend == LMS_BACKEND_LOCAL:
+            # Relative paths of the database are relative to the program path
+            database_file = self.cfg_manager.get_setting(Storyboard.CONFIG_LMS_DATABASE) or LOCAL_DATABASE_FILE
+            database_file = os.path.join(os.path.dirname(os.path.realpath(__file__)), database_file)
+            try:
+                latency = sim_mgmt.parse_latency(self.cfg_manager.get_setting(Storyboard.CONFIG_LMS_LATENCY))
+                failure_rate = float(self.cfg_manager.get_setting(Storyboard.CONFIG_LMS_FAILURE_RATE) or 0)
+            except ValueError as e:
+                logging.error("Invalid setting for the local LMS backend: {} => abort execution.".format(str(e)))
+                sys.exit(1)
+            course_names = [self.course_name] if self.course_name else []
+            self.connection = sim_mgmt.get_connection(database_file, latency, failure_rate, course_names)
+            # Course ids of the stand-in LMS are cached separately from those of the LMS host
+            self.lms_host = LOCAL_HOST_PREFIX + os.path.abspath(database_file)
+        elif self.lms_backend == LMS_BACKEND_REST:
+            lms_url = self.cfg_manager.get_setting(Storyboard.CONFIG_LMS_URL)
+            lms_token = self.cfg_manager.get_setting(Storyboard.CONFIG_LMS_TOKEN)
+            if not lms_url or not lms_token:
+                logging.error("Settings '{}' and '{}' are required for the REST LMS backend => abort execution."
+                              .format(Storyboard.CONFIG_LMS_URL, Storyboard.CONFIG_LMS_TOKEN))
+                sys.exit(1)
+            try:
+                self.ws_client = ws_mgmt.get_client(lms_url, lms_token)
+            except ValueError as e:
+                logging.error("{} => abort execution.".format(str(e)))
+                sys.exit(1)
+            # Course ids are cached by Moodle site
+            self.lms_host = lms_url
+        else:
+            logging.error("Unknown LMS backend '{}' => abort execution.".format(self.lms_backend))
+            sys.exit(1)
 
         # Display debug info
         logging.debug("LMS manager settings:")
+        logging.debug("  - LMS backend: {}".format(self.lms_backend))
         logging.debug("  - LMS host: {}".format(self.lms_host))
         logging.debug("  - LMS repository: {}".format(self.lms_repository))
         logging.debug("  - Course name: {}".format(self.course_name))
         logging.debug("  - Section id: {}".format(self.section_id))
+        logging.debug("  - Course cache TTL: {}".format(self.course_cache_ttl))
 
-    # Get the id of the course with given name
+    # Get the id of the course with given name; the id is looked up in the
+    # in-process index first, then in the disk cache (if enabled), and only
+    # then the course list is retrieved from the LMS
+    @perf_mgmt.timed("lms.get_course_id")
     def get_course_id(self):
 
         if SIMULATION_MODE:
@@ -76,34 +253,90 @@ class LmsManager:
             logging.debug("Simulation mode: Matching course id: {}".format(course_id))
             return course_id
         else:
+            # Check the in-process index and the disk cache
+            course_index = course_indexes.get(self.lms_host)
+            if course_index and self.course_name in course_index:
+                return course_index[self.course_name]
+            course_id = self.load_cached_course_id()
+            if course_id:
+                logging.debug("Use cached id of course '{}': {}".format(self.course_name, course_id))
+                return course_id
+
             # Get course list
-            ssh_output = subprocess.check_output(["ssh", SSH_OPT1, SSH_OPT2, self.lms_host, MOOSH_COMMAND,
-                                                  "course-list"], stderr=subprocess.STDOUT)
-            logging.debug("Course list output: {}".format(ssh_output.rstrip()))
-
-            # Find the appropriate course
-            for output_line in ssh_output.splitlines():
-                # Extract the course id
-                if self.course_name in output_line:
-                    logging.debug("Matching course info: {}".format(output_line.rstrip()))
-                    # Split line of form "2","Top/CROND","CyTrONE Training","CyTrONE Training","1"
-                    course_id = output_line.split(",")[0]
-                    # Split id string of form "2"
-                    course_id = course_id.split('"')[1]
-                    logging.debug("Extracted id of matching course: {}".format(course_id))
-                    return course_id
+            if self.ws_client:
+                courses = self.call_function(WS_GET_COURSES_FUNCTION)
+                if courses is None:
+                    return None
+                logging.debug("Course list: {} course(s)".format(len(courses)))
+                rows = [(str(course["id"]), course["shortname"].encode("utf-8"), course["fullname"].encode("utf-8"))
+                        for course in courses]
+            else:
+                try:
+                    cmd_output = self.connection.run([MOOSH_COMMAND, "course-list"], idempotent=True)
+                except subprocess.CalledProcessError as error:
+                    job_mgmt.record_error(error)
+                    logging.error("Error when retrieving the course list\n  Error message: {}"
+                                  .format(error.output.rstrip()))
+                    return None
+                logging.debug("Course list output: {} line(s)".format(len(cmd_output.splitlines())))
+                rows = parse_course_list(cmd_output)
+
+            # Find the appropriate course by exact match on its full or short name
+            course_index = get_course_index(rows)
+            course_indexes[self.lms_host] = course_index
+            course_id = course_index.get(self.course_name)
+            if course_id:
+                logging.debug("Extracted id of matching course: {}".format(course_id))
+                self.save_cached_course_id(course_id)
+                return course_id
 
             # If we reach this point, it means the course name was not found
             logging.error("No matching record for course '{}'".format(self.course_name))
             return None
 
+    # Invalidate the cached id of the course (e.g., after the course was
+    # recreated or renamed on the LMS)
+    def invalidate_course_id(self):
+        course_indexes.pop(self.lms_host, None)
+        course_cache = load_course_cache(self.course_cache_file)
+        if course_cache.get(self.lms_host, {}).pop(self.course_name, None):
+            save_course_cache(self.course_cache_file, course_cache)
+        logging.debug("Invalidated cached id of course '{}'.".format(self.course_name))
+
+    # Get the course id from the disk cache; return None if the disk cache is
+    # disabled, or the id is not cached or has expired
+    def load_cached_course_id(self):
+        if self.course_cache_ttl <= 0:
+            return None
+        course_cache = load_course_cache(self.course_cache_file)
+        cache_entry = course_cache.get(self.lms_host, {}).get(self.course_name)
+        if cache_entry and time.time() - cache_entry.get("time", 0) <= self.course_cache_ttl:
+            return cache_entry.get("id")
+        return None
+
+    # Store the course id in the disk cache (if enabled)
+    def save_cached_course_id(self, course_id):
+        if self.course_cache_ttl <= 0:
+            return
+        course_cache = load_course_cache(self.course_cache_file)
+        course_cache.setdefault(self.lms_host, {})[self.course_name] = {"id": course_id, "time": time.time()}
+        save_course_cache(self.course_cache_file, course_cache)
+
     # Add an activity based on course id, section id and package file
+    @perf_mgmt.timed("lms.add_activity")
     def add_activity(self, activity_name, activity_description, package_file):
 
         if SIMULATION_MODE:
             logging.debug("Simulation mode: Add activity '{}'.".format(activity_name))
             activity_id = 99
             return activity_id
+        elif self.ws_client:
+            # Web service requests are the same for one or several activities
+            activity_ids = self.add_activities([(0, activity_name, activity_description, package_file)])
+            if activity_ids and activity_ids[0]:
+                return activity_ids[0]
+            logging.error("Failed to add activity for course '{}'.".format(self.course_name))
+            return None
         else:
             # Get the course id
             course_id = self.get_course_id()
@@ -120,15 +353,14 @@ class LmsManager:
                     logging.debug("Options string: {}".format(options_string))
                     logging.debug("Options string: {}".format(activity_name))
                     # NOTE: Quoting style changed below for activity name, as the name itself may include single quotes
-                    ssh_output = subprocess.check_output(
-                        ["ssh", SSH_OPT1, SSH_OPT2, self.lms_host, MOOSH_COMMAND, "activity-add",
+                    cmd_output = self.connection.run(
+                        [MOOSH_COMMAND, "activity-add",
                          "--section " + self.section_id, '--name "' + activity_name + '"',
-                         "--options " + options_string, "scorm", course_id],
-                        stderr=subprocess.STDOUT)
-                    logging.debug("Add activity output: {}".format(ssh_output.rstrip()))
+                         "--options " + options_string, "scorm", course_id])
+                    logging.debug("Add activity output: {}".format(cmd_output.rstrip()))
 
                     # Determine the activity id
-                    for output_line in ssh_output.splitlines():
+                    for output_line in cmd_output.splitlines():
                         # Extract the activity id from cmid line
                         if ACTIVITY_ID_FIELD in output_line:
                             activity_id = output_line.split("=")[1]
@@ -138,13 +370,16 @@ class LmsManager:
                                 return activity_id
 
                     # If we reach this point, it means an error occurred
-                    logging.error("Error when determining the activity id\n  Command output: {}".format(ssh_output))
+                    logging.error("Error when determining the activity id\n  Command output: {}".format(cmd_output))
                     return None
 
                 # Any execution error will lead to an exception, which we handle below
                 except subprocess.CalledProcessError as error:
+                    job_mgmt.record_error(error)
                     logging.error("Error when adding activity for course id '{}' section id '{}'\n  Error message: {}"
                                   .format(course_id, self.section_id, error.output))
+                    # The course id may be outdated, so it will be retrieved again next time
+                    self.invalidate_course_id()
 
                     return None
 
@@ -153,35 +388,23 @@ class LmsManager:
             return None
 
     # Delete an activity with given id
+    @perf_mgmt.timed("lms.delete_activity")
     def delete_activity(self, activity_id, package_file):
         if SIMULATION_MODE:
             logging.debug("Simulation mode: Delete activity with id '{}'.".format(activity_id))
             return True
         else:
-            # Delete activity
-            try:
-                ssh_output = subprocess.check_output(["ssh", SSH_OPT1, SSH_OPT2, self.lms_host, MOOSH_COMMAND,
-                                                      "activity-delete", str(activity_id)],
-                                                     stderr=subprocess.STDOUT)
-                logging.debug("Delete activity output: {}".format(ssh_output.rstrip()))
-
-                # If deletion succeeds, we also remove the associated package file
-                package_file = "-f " + self.lms_repository + package_file
-                subprocess.check_output(["ssh", SSH_OPT1, SSH_OPT2, self.lms_host, "rm", package_file],
-                                        stderr=subprocess.STDOUT)
-
-                # If we reach this point, it means no error occured
-                return True
-
-            # Any execution error will lead to an exception, which we handle below
-            except subprocess.CalledProcessError as error:
-                logging.error("Error when deleting activity with id '{}'\n  Error message: {}"
-                              .format(activity_id, error.output.rstrip()))
-                return False
+            # The deletion script also removes shared packages that are no longer used
+            return self.delete_activities([(0, activity_id, package_file)])[0]
 
     # Copy the SCORM package to Moodle according to configuration file options
+    @perf_mgmt.timed("lms.copy_package")
     def copy_package(self, package_file, target_file):
 
+        # Packages are uploaded to Moodle when using web services
+        if self.ws_client and not SIMULATION_MODE:
+            return self.upload_packages([(package_file, target_file)])
+
         # Add repository prefix to target file
         target_file = self.lms_repository + target_file
         
@@ -191,17 +414,363 @@ class LmsManager:
         else:
             # Display operation info
             logging.info("Copy package '{}' to\n\tTarget '{}' on {}.".format(package_file, target_file, self.lms_host))
-            command = "scp -q {} {} {} {}:{}".format(SSH_OPT1, SSH_OPT2, package_file, self.lms_host, target_file)
-            logging.debug("Copy command: {}".format(command))
-            return_value = os.system(command)
-            exit_status = os.WEXITSTATUS(return_value)
-            if exit_status != 0:
-                logging.error("Copy package operation failed.")
+            try:
+                if self.get_remote_hashes([target_file]).get(target_file) == get_file_hash(package_file):
+                    logging.info("Identical package already in repository => skip transfer.")
+                    perf_mgmt.add_bytes("lms.copy_skipped", os.path.getsize(package_file))
+                    return True
+                byte_count, duration = self.transfer_files([package_file], target_file)
+            except (IOError, OSError) as e:
+                logging.error("Copy package operation failed.\n  Error message: {}".format(str(e)))
+                return False
+            except subprocess.CalledProcessError as error:
+                job_mgmt.record_error(error)
+                logging.error("Copy package operation failed.\n  Error message: {}".format(error.output.rstrip()))
                 return False
 
+            logging.info("Transferred {} byte(s) in {:.3f} s.".format(byte_count, duration))
             return True
 
 
+    # Copy several SCORM packages to Moodle in a single transfer; packages
+    # is a list of (package file, target file) pairs
+    @perf_mgmt.timed("lms.copy_packages")
+    def copy_packages(self, packages):
+
+        if SIMULATION_MODE:
+            logging.info("Simulation mode: Copy {} package(s) to {}.".format(len(packages), self.lms_host))
+            return True
+        if self.ws_client:
+            return self.upload_packages(packages)
+
+        # Stage the packages under their target names (as links to the local
+        # package files), so that they can all be copied with one command
+        logging.info("Copy {} package(s) to\n\tRepository '{}' on {}.".format(len(packages), self.lms_repository, self.lms_host))
+        staging_dir = tempfile.mkdtemp(prefix=STAGING_DIR_PREFIX)
+        try:
+            # Skip the packages that are already in the repository
+            remote_hashes = self.get_remote_hashes([self.lms_repository + target_file
+                                                    for package_file, target_file in packages])
+            staged_files = []
+            for package_file, target_file in packages:
+                if remote_hashes.get(self.lms_repository + target_file) == get_file_hash(package_file):
+                    perf_mgmt.add_bytes("lms.copy_skipped", os.path.getsize(package_file))
+                    continue
+                staged_file = os.path.join(staging_dir, target_file)
+                os.symlink(os.path.abspath(package_file), staged_file)
+                staged_files.append(staged_file)
+            if len(staged_files) < len(packages):
+                logging.info("Identical package(s) already in repository => skip {} transfer(s)."
+                             .format(len(packages) - len(staged_files)))
+
+            # With rsync, the first package is sent on its own, so that only
+            # its differences with the first one are sent for the others
+            if len(staged_files) > 1 and getattr(self.connection, "rsync_supported", False):
+                transfers = [self.transfer_files(staged_files[:1], self.lms_repository),
+                             self.transfer_files(staged_files[1:], self.lms_repository)]
+            elif staged_files:
+                transfers = [self.transfer_files(staged_files, self.lms_repository)]
+            else:
+                transfers = []
+        except (IOError, OSError) as e:
+            logging.error("Copy packages operation failed.\n  Error message: {}".format(str(e)))
+            return False
+        except subprocess.CalledProcessError as error:
+            job_mgmt.record_error(error)
+            logging.error("Copy packages operation failed.\n  Error message: {}".format(error.output.rstrip()))
+            return False
+        finally:
+            shutil.rmtree(staging_dir, ignore_errors=True)
+
+        if transfers:
+            logging.info("Transferred {} byte(s) for {} package(s) in {:.3f} s."
+                         .format(sum([byte_count for byte_count, duration in transfers]), len(staged_files),
+                                 sum([duration for byte_count, duration in transfers])))
+        return True
+
+    # Get the content hashes of files on the LMS host, indexed by file path;
+    # files whose hash cannot be determined (e.g., missing ones) are omitted
+    def get_remote_hashes(self, remote_files):
+        try:
+            cmd_output = self.connection.run([HASH_COMMAND] + [pipes.quote(remote_file) for remote_file in remote_files],
+                                             idempotent=True)
+        except subprocess.CalledProcessError as error:
+            # Missing files are reported as errors, but the other hashes are output
+            cmd_output = error.output or ""
+        remote_hashes = {}
+        for output_line in cmd_output.splitlines():
+            match = HASH_OUTPUT_REGEX.match(output_line)
+            if match:
+                remote_hashes[match.group(2)] = match.group(1)
+        return remote_hashes
+
+    # Transfer local files to the LMS host; remote_path is the target file (for
+    # a single file) or directory; rsync is used if possible, so that only the
+    # differences with similar files in the target directory are sent; return
+    # the number of bytes sent and the duration of the transfer
+    def transfer_files(self, local_files, remote_path):
+        if getattr(self.connection, "rsync_supported", False):
+            try:
+                byte_count, duration = self.connection.sync_files(local_files, remote_path)
+                perf_mgmt.add_bytes("lms.copy_sent", byte_count)
+                return byte_count, duration
+            except subprocess.CalledProcessError:
+                # Other transfers are used if rsync is not available on the host
+                if self.connection.rsync_supported:
+                    raise
+        if len(local_files) == 1 and not remote_path.endswith("/"):
+            byte_count, duration = self.connection.send_file(local_files[0], remote_path)
+        else:
+            start_time = time.time()
+            self.connection.copy(local_files, remote_path)
+            byte_count = sum([os.path.getsize(local_file) for local_file in local_files])
+            duration = time.time() - start_time
+        perf_mgmt.add_bytes("lms.copy_sent", byte_count)
+        return byte_count, duration
+
+    # Add several activities with a single remote script invocation; activities
+    # is a list of (session id, activity name, activity description, package file)
+    # tuples, and session_files (for shared packages) maps session ids to the
+    # content of their session file; return a dictionary that maps session ids
+    # to activity ids (None for activities that could not be added), or None on error
+    @perf_mgmt.timed("lms.add_activities")
+    def add_activities(self, activities, session_files=None):
+
+        if SIMULATION_MODE:
+            logging.debug("Simulation mode: Add {} activities.".format(len(activities)))
+            return dict([(session_id, 99) for session_id, name, description, package_file in activities])
+
+        # Get the course id
+        course_id = self.get_course_id()
+        if not course_id:
+            logging.error("Failed to add activities for course '{}'.".format(self.course_name))
+            return None
+
+        if self.ws_client:
+            results = self.add_ws_activities(course_id, activities, session_files)
+        else:
+            # Build the request for the script
+            request_activities = []
+            for session_id, activity_name, activity_description, package_file in activities:
+                options = {NAME_OPTION: activity_name,
+                           DESCRIPTION_OPTION: activity_description,
+                           SHOW_DESCRIPTION_OPTION: 1,
+                           PACKAGE_FILEPATH_OPTION: self.lms_repository + package_file,
+                           UPDATE_FREQUENCY_OPTION: SCORM_UPDATE_NEVER}
+                request_activities.append({"session": str(session_id), "options": options})
+                if session_files:
+                    request_activities[-1]["sessionfile"] = session_files[session_id]
+            request = {"course": int(course_id), "section": int(self.section_id), "activities": request_activities,
+                       "sessionfilepath": "/" + os.path.dirname(Storyboard.SESSION_FILE) + "/",
+                       "sessionfilename": os.path.basename(Storyboard.SESSION_FILE)}
+            results = self.run_script(ADD_ACTIVITIES_SCRIPT, request)
+        if results is None:
+            logging.error("Failed to add activities for course id '{}' section id '{}'.".format(course_id, self.section_id))
+            # The course id may be outdated, so it will be retrieved again next time
+            self.invalidate_course_id()
+            return None
+
+        # Build the session to activity id map
+        activity_ids = {}
+        for session_id, activity_name, activity_description, package_file in activities:
+            result = results.get(str(session_id), {})
+            activity_ids[session_id] = result.get("id")
+            if activity_ids[session_id]:
+                logging.info("Added activity '{}' with id '{}' for course '{}' section '{}'."
+                             .format(activity_name, activity_ids[session_id], course_id, self.section_id))
+            else:
+                logging.error("Error when adding activity '{}'\n  Error message: {}"
+                              .format(activity_name, result.get("error")))
+        return activity_ids
+
+    # Delete several activities and their package files with a single remote script
+    # invocation; activities is a list of (session id, activity id, package file)
+    # tuples; return a dictionary that maps session ids to deletion status
+    @perf_mgmt.timed("lms.delete_activities")
+    def delete_activities(self, activities):
+
+        if SIMULATION_MODE:
+            logging.debug("Simulation mode: Delete {} activities.".format(len(activities)))
+            return dict([(session_id, True) for session_id, activity_id, package_file in activities])
+
+        if self.ws_client:
+            # Packages are deleted by Moodle together with the modules; all the
+            # modules are deleted, or none of them if an error occurs
+            if self.call_function(WS_DELETE_MODULES_FUNCTION,
+                                  {"cmids": [int(activity_id) for session_id, activity_id, package_file in activities]}) \
+                    is None:
+                return dict([(session_id, False) for session_id, activity_id, package_file in activities])
+            return dict([(session_id, True) for session_id, activity_id, package_file in activities])
+
+        request_activities = []
+        for session_id, activity_id, package_file in activities:
+            request_activities.append({"session": str(session_id), "id": int(activity_id),
+                                       "package": self.lms_repository + package_file})
+        results = self.run_script(DELETE_ACTIVITIES_SCRIPT, {"activities": request_activities,
+                                                             "repository": self.lms_repository,
+                                                             "sharedprefix": SHARED_PACKAGE_PREFIX})
+        if results is None:
+            return dict([(session_id, False) for session_id, activity_id, package_file in activities])
+
+        status = {}
+        for session_id, activity_id, package_file in activities:
+            result = results.get(str(session_id), {})
+            status[session_id] = "id" in result
+            if not status[session_id]:
+                logging.error("Error when deleting activity with id '{}'\n  Error message: {}"
+                              .format(activity_id, result.get("error")))
+        return status
+
+    # Run a PHP script on the LMS host with the given request (a dictionary
+    # passed to the script as JSON); return the results printed by the script,
+    # or None on error
+    @perf_mgmt.timed("lms.run_script")
+    def run_script(self, script, request):
+        script = script.replace(SCRIPT_MOODLE_PATH_TAG, MOODLE_PATH)
+        script = script.replace(SCRIPT_REQUEST_TAG, base64.b64encode(json.dumps(request)))
+        try:
+            cmd_output = self.connection.run([PHP_COMMAND], input_data=script)
+        except subprocess.CalledProcessError as error:
+            # Scripts add or delete activities, hence they are only run again
+            # if they were not started
+            job_mgmt.record_error(error)
+            logging.error("Error when running script on '{}'\n  Error message: {}"
+                          .format(self.lms_host, error.output.rstrip()))
+            return None
+        logging.debug("Script output: {}".format(cmd_output.rstrip()))
+        for output_line in cmd_output.splitlines():
+            if output_line.startswith(SCRIPT_RESULT_MARKER):
+                try:
+                    return json.loads(output_line[len(SCRIPT_RESULT_MARKER):])
+                except ValueError:
+                    break
+        logging.error("Error when determining the script results\n  Command output: {}".format(cmd_output))
+        return None
+
+    # Upload packages to draft areas of Moodle via web services; packages is a
+    # list of (package file, target file) pairs, and the draft area of each
+    # package is used later on to add the activity with the target file
+    def upload_packages(self, packages):
+        logging.info("Upload {} package(s) to {}.".format(len(packages), self.lms_host))
+        for package_file, target_file in packages:
+            try:
+                self.draft_item_ids[target_file] = self.ws_client.upload(package_file, target_file)
+            except (ws_mgmt.WsError, IOError, OSError) as e:
+                job_mgmt.record_error(e)
+                logging.error("Upload package operation failed.\n  Error message: {}".format(str(e)))
+                return False
+        return True
+
+    # Add activities via web services, using the draft areas of their
+    # uploaded packages; return the results indexed by session id (as
+    # those printed by the scripts), or None on error
+    def add_ws_activities(self, course_id, activities, session_files=None):
+        results = {}
+        request_activities = []
+        for session_id, activity_name, activity_description, package_file in activities:
+            if package_file in self.draft_item_ids:
+                request_activities.append({"key": str(session_id), "name": activity_name,
+                                           "intro": activity_description,
+                                           "draftitemid": self.draft_item_ids[package_file]})
+                if session_files:
+                    request_activities[-1]["sessionfile"] = session_files[session_id]
+            else:
+                results[str(session_id)] = {"error": "Package '{}' was not uploaded".format(package_file)}
+        if request_activities:
+            response = self.call_function(WS_ADD_ACTIVITIES_FUNCTION,
+                                          {"courseid": int(course_id), "section": int(self.section_id),
+                                           "activities": request_activities})
+            if response is None:
+                return None
+            for result in response:
+                results[result["key"]] = result
+        # Draft areas are only used once
+        for session_id, activity_name, activity_description, package_file in activities:
+            if "id" in results.get(str(session_id), {}):
+                self.draft_item_ids.pop(package_file, None)
+        return results
+
+    # Call a web service function; return its result, or None on error
+    @perf_mgmt.timed("lms.call_function")
+    def call_function(self, function, parameters={}):
+        try:
+            result = self.ws_client.call(function, parameters)
+        except ws_mgmt.WsError as e:
+            job_mgmt.record_error(e)
+            logging.error("Error when calling function '{}' on '{}'\n  Error message: {}"
+                          .format(function, self.lms_host, str(e)))
+            return None
+        # Functions without return value return null
+        if result is None:
+            return {}
+        return result
+
+
+#############################################################################
+# Functions
+#############################################################################
+
+# Get the content hash of a local file
+def get_file_hash(file_name):
+    file_hash = hashlib.sha256()
+    with open(file_name, "rb") as file_stream:
+        while True:
+            chunk = file_stream.read(HASH_CHUNK_SIZE)
+            if not chunk:
+                break
+            file_hash.update(chunk)
+    return file_hash.hexdigest()
+
+# Get the (id, short name, full name) rows of the CSV output of moosh course-list
+def parse_course_list(course_list):
+    rows = []
+    for row in csv.reader(course_list.splitlines()):
+        if len(row) <= COURSE_FULLNAME_COLUMN or not row[COURSE_ID_COLUMN].isdigit():
+            # Skip header and malformed lines
+            continue
+        rows.append((row[COURSE_ID_COLUMN], row[COURSE_SHORTNAME_COLUMN], row[COURSE_FULLNAME_COLUMN]))
+    return rows
+
+# Build a course name to id index from (id, short name, full name) rows; both
+# full names and short names are indexed, full names taking precedence
+def get_course_index(rows):
+    course_index = {}
+    shortname_index = {}
+    for course_id, shortname, fullname in rows:
+        course_index.setdefault(fullname, course_id)
+        shortname_index.setdefault(shortname, course_id)
+    for shortname, course_id in shortname_index.items():
+        course_index.setdefault(shortname, course_id)
+    return course_index
+
+# Load the course id disk cache; a missing or unreadable cache is treated as empty
+def load_course_cache(cache_file):
+    if not os.path.isfile(cache_file):
+        return {}
+    try:
+        with open(cache_file) as cache_stream:
+            return json.load(cache_stream)
+    except (IOError, ValueError) as e:
+        logging.warning("Cannot read course cache '{}' => ignore it: {}".format(cache_file, str(e)))
+        return {}
+
+# Save the course id disk cache via a temporary file
+def save_course_cache(cache_file, course_cache):
+    temp_name = None
+    try:
+        cache_dir = os.path.dirname(cache_file)
+        if not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+        temp_fd, temp_name = tempfile.mkstemp(prefix=TEMP_CACHE_PREFIX, dir=cache_dir)
+        with os.fdopen(temp_fd, "w") as cache_stream:
+            json.dump(course_cache, cache_stream)
+        os.rename(temp_name, cache_file)
+    except (IOError, OSError) as e:
+        logging.warning("Cannot write course cache '{}': {}".format(cache_file, str(e)))
+        if temp_name and os.path.exists(temp_name):
+            os.remove(temp_name)
+
+
 #############################################################################
 # Main program (used for testing purposes)
 #############################################################################
@@ -219,6 +788,9 @@ def main():
     #action = ADD_ACTION
     #action = DELETE_ACTION
     #action = COPY_ACTION
+    #action = INVALIDATE_ACTION
+    #action = BULK_ADD_ACTION
+    #action = BULK_DELETE_ACTION
     
     # Perform actions
     ## Get course id
@@ -264,6 +836,27 @@ def main():
             logging.error("Failed to copy package '{}'.".format(package_file))
             sys.exit(1)
     
+    ## Bulk add/delete activities
+    elif action == BULK_ADD_ACTION or action == BULK_DELETE_ACTION:
+        package_file = "training_example.yml.zip"
+        session_ids = [1, 2, 3]
+        if action == BULK_ADD_ACTION:
+            packages = [(package_file, "training_content{}.zip".format(session_id)) for session_id in session_ids]
+            if not lms_manager.copy_packages(packages):
+                logging.error("Failed to copy packages.")
+                sys.exit(1)
+            activities = [(session_id, "Activity #{}: Training name".format(session_id), "Created on YYYY-MM-DD hh:mm:ss",
+                           "training_content{}.zip".format(session_id)) for session_id in session_ids]
+            logging.info("Added activities: {}".format(lms_manager.add_activities(activities)))
+        else:
+            activities = [(session_id, 99, "training_content{}.zip".format(session_id)) for session_id in session_ids]
+            logging.info("Deleted activities: {}".format(lms_manager.delete_activities(activities)))
+
+    ## Invalidate cached course id
+    elif action == INVALIDATE_ACTION:
+        lms_manager.invalidate_course_id()
+        logging.info("Invalidated cached id for course with name '{}'.".format(lms_manager.course_name))
+
     else:
         logging.error("No action was selected => do nothing.")
 
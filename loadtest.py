@@ -0,0 +1,388 @@
+#!/usr/bin/env python
+
+#############################################################################
+# Load test for the LMS operations of CyLMS
+#############################################################################
+
+# External imports
+import getopt
+import json
+import logging
+import math
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+# Internal imports
+import lms_mgmt
+import sim_mgmt
+
+#############################################################################
+# Constants
+#############################################################################
+
+# Version of the results file format
+RESULTS_VERSION = 1
+
+# Default load: number of add/remove cycles, number of concurrent workers, and
+# number of activities per cycle (cycles with several activities use the bulk
+# operations of the LMS manager)
+DEFAULT_CYCLES = 1000
+DEFAULT_WORKERS = 1
+DEFAULT_BATCH = 1
+DEFAULT_PACKAGE_SIZE = 64 # KB
+
+# Default settings of the local stand-in LMS used if no configuration file is
+# given; the stand-in is used via moosh commands, or via web services (in which
+# case it runs in this process and its settings are given by parameters)
+DEFAULT_LATENCY = "0"
+DEFAULT_FAILURE_RATE = 0.0
+COURSE_NAME = "CyLMS Load Test"
+CONFIG_TEMPLATE = """[config]
+lms_host = localhost
+lms_repository = /var/moodledata/repository/training_content/
+course_name = CyLMS Load Test
+section_id = 0
+lms_backend = {}
+lms_database = {}
+lms_latency = {}
+lms_failure_rate = {}
+lms_url = {}
+lms_token = {}
+"""
+
+# Names of generated files
+CONFIG_FILE_NAME = "config_loadtest"
+DATABASE_FILE_NAME = "lms_sim.db"
+PACKAGE_FILE_NAME = "loadtest.zip"
+TARGET_FILE_TEMPLATE = "loadtest-{}-{}.zip"
+
+# Measured operations, and the percentiles reported for their latency
+OPERATION_COPY = "copy"
+OPERATION_ADD = "add"
+OPERATION_DELETE = "delete"
+OPERATION_CYCLE = "cycle"
+OPERATIONS = [OPERATION_COPY, OPERATION_ADD, OPERATION_DELETE, OPERATION_CYCLE]
+PERCENTILES = [50, 95, 99]
+
+#############################################################################
+# Class that runs add/remove cycles concurrently and records the latency
+# of each operation
+#############################################################################
+class LoadTest:
+
+    # Constructor
+    def __init__(self, lms_manager, package_file, cycles, workers, batch):
+        self.lms_manager = lms_manager
+        self.package_file = package_file
+        self.cycles = cycles
+        self.workers = workers
+        self.batch = batch
+        self.lock = threading.Lock()
+        self.next_cycle = 0
+        # Latencies of successful operations, and number of failed operations
+        self.latencies = dict([(operation, []) for operation in OPERATIONS])
+        self.failures = dict([(operation, 0) for operation in OPERATIONS])
+
+    # Record the outcome of an operation
+    def record(self, operation, start_time, success):
+        duration = time.time() - start_time
+        with self.lock:
+            if success:
+                self.latencies[operation].append(duration)
+            else:
+                self.failures[operation] += 1
+
+    # Run an operation and record its outcome; return its result
+    def run_operation(self, operation, function, *args):
+        start_time = time.time()
+        result = function(*args)
+        self.record(operation, start_time, bool(result))
+        return result
+
+    # Run one add/remove cycle; return True on success
+    def run_cycle(self, cycle):
+        if self.batch == 1:
+            target_file = TARGET_FILE_TEMPLATE.format(cycle, 0)
+            if not self.run_operation(OPERATION_COPY, self.lms_manager.copy_package, self.package_file, target_file):
+                return False
+            activity_id = self.run_operation(OPERATION_ADD, self.lms_manager.add_activity,
+                                             "Load test #{}".format(cycle), "Load test cycle", target_file)
+            if not activity_id:
+                return False
+            return self.run_operation(OPERATION_DELETE, self.lms_manager.delete_activity, activity_id, target_file)
+
+        # Bulk operations succeed only if all the activities are processed
+        target_files = [TARGET_FILE_TEMPLATE.format(cycle, index) for index in range(self.batch)]
+        if not self.run_operation(OPERATION_COPY, self.lms_manager.copy_packages,
+                                  [(self.package_file, target_file) for target_file in target_files]):
+            return False
+        activities = [(index, "Load test #{}-{}".format(cycle, index), "Load test cycle", target_files[index])
+                      for index in range(self.batch)]
+        activity_ids = self.run_operation(OPERATION_ADD, lambda: self.add_activities(activities))
+        if not activity_ids:
+            return False
+        status = self.run_operation(OPERATION_DELETE, lambda: self.delete_activities(
+            [(index, activity_ids[index], target_files[index]) for index in range(self.batch)]))
+        return bool(status)
+
+    # Add activities in bulk; return the activity ids, or None if any failed
+    def add_activities(self, activities):
+        activity_ids = self.lms_manager.add_activities(activities)
+        if not activity_ids or not all(activity_ids.values()):
+            return None
+        return activity_ids
+
+    # Delete activities in bulk; return False if any failed
+    def delete_activities(self, activities):
+        return all(self.lms_manager.delete_activities(activities).values())
+
+    # Run cycles until all of them were started
+    def run_worker(self):
+        while True:
+            with self.lock:
+                if self.next_cycle >= self.cycles:
+                    return
+                cycle = self.next_cycle
+                self.next_cycle += 1
+            start_time = time.time()
+            self.record(OPERATION_CYCLE, start_time, self.run_cycle(cycle))
+
+    # Run all the cycles; return the elapsed time
+    def run(self):
+        start_time = time.time()
+        threads = [threading.Thread(target=self.run_worker) for index in range(self.workers)]
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+        for thread in threads:
+            # Joining without a timeout cannot be interrupted in Python 2
+            while thread.is_alive():
+                thread.join(1)
+        return time.time() - start_time
+
+
+#############################################################################
+# Functions
+#############################################################################
+
+# Print usage information
+def usage():
+    print "\nOVERVIEW: Load test for the LMS operations of CyLMS.\n"
+    print "USAGE: loadtest.py [options]\n"
+    print "OPTIONS:"
+    print "-h, --help                     Display this help message and exit"
+    print "-n, --cycles <NUMBER>          Number of add/remove cycles (default: {})".format(DEFAULT_CYCLES)
+    print "-w, --workers <NUMBER>         Number of concurrent workers (default: {})".format(DEFAULT_WORKERS)
+    print "-b, --batch <NUMBER>           Number of activities per cycle; several activities are added"
+    print "                               and removed using bulk operations (default: {})".format(DEFAULT_BATCH)
+    print "-s, --package-size <KB>        Size of the package file (default: {} KB)".format(DEFAULT_PACKAGE_SIZE)
+    print "-l, --latency <SECONDS>        Latency of the local stand-in LMS per command, given as a fixed"
+    print "                               value or as a MIN-MAX range (default: {})".format(DEFAULT_LATENCY)
+    print "-f, --failure-rate <RATIO>     Fraction of the commands that fail in the local stand-in LMS"
+    print "                               (default: {})".format(DEFAULT_FAILURE_RATE)
+    print "-r, --rest                     Use the web services of the local stand-in LMS (over HTTP)"
+    print "                               instead of its moosh commands"
+    print "-c, --config-file <CONFIG>     Use the LMS backend of a configuration file instead of a"
+    print "                               temporary local stand-in LMS (latency and failures are then real)"
+    print "-o, --output <FILE>            Save the results to file in JSON format"
+    print "-v, --verbose                  Display the errors of failed operations"
+    print "    --keep                     Keep the generated files\n"
+
+# Get a percentile of a sorted list of values (nearest-rank method)
+def get_percentile(values, percentile):
+    return values[max(0, int(math.ceil(percentile / 100.0 * len(values))) - 1)]
+
+# Compute the latency statistics of an operation
+def get_statistics(latencies, failures):
+    statistics = {"count": len(latencies), "failures": failures}
+    if latencies:
+        latencies = sorted(latencies)
+        statistics["mean"] = round(sum(latencies) / len(latencies), 6)
+        for percentile in PERCENTILES:
+            statistics["p{}".format(percentile)] = round(get_percentile(latencies, percentile), 6)
+        statistics["max"] = round(latencies[-1], 6)
+    return statistics
+
+# Run the load test and return the results as a dictionary
+def run_load_test(parameters, config_file=None, keep_files=False):
+
+    work_dir = tempfile.mkdtemp(prefix="cylms-loadtest-")
+    http_server = None
+    try:
+        if not config_file:
+            database_file = os.path.join(work_dir, DATABASE_FILE_NAME)
+            lms_backend = lms_mgmt.LMS_BACKEND_LOCAL
+            lms_url = ""
+            if parameters["rest"]:
+                lms_backend = lms_mgmt.LMS_BACKEND_REST
+                connection = sim_mgmt.get_connection(database_file, sim_mgmt.parse_latency(parameters["latency"]),
+                                                     parameters["failure_rate"], [COURSE_NAME])
+                http_server = sim_mgmt.start_http_server(connection)
+                lms_url = http_server.get_url()
+            config_file = os.path.join(work_dir, CONFIG_FILE_NAME)
+            with open(config_file, "w") as config_stream:
+                config_stream.write(CONFIG_TEMPLATE.format(lms_backend, database_file, parameters["latency"],
+                                                           parameters["failure_rate"], lms_url,
+                                                           sim_mgmt.DEFAULT_TOKEN))
+        package_file = os.path.join(work_dir, PACKAGE_FILE_NAME)
+        with open(package_file, "wb") as package_stream:
+            package_stream.write(os.urandom(parameters["package_size"] * 1024))
+
+        # The course id is retrieved before measuring
+        lms_manager = lms_mgmt.LmsManager(config_file)
+        if not lms_manager.get_course_id():
+            return None
+
+        logging.info("Run {} add/remove cycle(s) of {} activity(ies) with {} worker(s) using the '{}' LMS backend."
+                     .format(parameters["cycles"], parameters["batch"], parameters["workers"], lms_manager.lms_backend))
+        load_test = LoadTest(lms_manager, package_file, parameters["cycles"], parameters["workers"],
+                             parameters["batch"])
+        # Failures are counted rather than logged, unless requested
+        logger = logging.getLogger()
+        log_level = logger.level
+        if not parameters["verbose"]:
+            logger.setLevel(logging.CRITICAL)
+        try:
+            elapsed_time = load_test.run()
+        finally:
+            logger.setLevel(log_level)
+
+        # Activities left by failed cycles are reported for the local stand-in LMS
+        remaining_activities = None
+        if hasattr(lms_manager.connection, "get_counts"):
+            remaining_activities = lms_manager.connection.get_counts()[1]
+        elif http_server:
+            remaining_activities = http_server.connection.get_counts()[1]
+    finally:
+        if http_server:
+            if lms_manager.ws_client:
+                lms_manager.ws_client.close()
+            http_server.shutdown()
+            http_server.server_close()
+        if keep_files:
+            logging.info("Generated files were kept in '{}'.".format(work_dir))
+        else:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    successful_cycles = len(load_test.latencies[OPERATION_CYCLE])
+    return {"version": RESULTS_VERSION,
+            "date": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "python": platform.python_version(),
+            "backend": lms_manager.lms_backend,
+            "parameters": parameters,
+            "elapsed": round(elapsed_time, 6),
+            "throughput": {"cycles_per_second": round(successful_cycles / elapsed_time, 1),
+                           "activities_per_second": round(successful_cycles * parameters["batch"] / elapsed_time, 1)},
+            "operations": dict([(operation, get_statistics(load_test.latencies[operation], load_test.failures[operation]))
+                                for operation in OPERATIONS]),
+            "remaining_activities": remaining_activities}
+
+# Show the results of a load test
+def show_results(results):
+    cycle_statistics = results["operations"][OPERATION_CYCLE]
+    logging.info("Completed {} of {} cycle(s) in {:.3f} s:".format(cycle_statistics["count"],
+                                                                   results["parameters"]["cycles"], results["elapsed"]))
+    logging.info("  - Throughput: {} cycle(s)/s, {} activity(ies)/s"
+                 .format(results["throughput"]["cycles_per_second"], results["throughput"]["activities_per_second"]))
+    for operation in OPERATIONS:
+        statistics = results["operations"][operation]
+        if statistics["count"]:
+            latencies = ", ".join(["p{} {:.1f} ms".format(percentile, statistics["p{}".format(percentile)] * 1000)
+                                   for percentile in PERCENTILES])
+            logging.info("  - Latency of {:<7} mean {:.1f} ms, {}, max {:.1f} ms ({} failure(s))"
+                         .format(operation + ":", statistics["mean"] * 1000, latencies, statistics["max"] * 1000,
+                                 statistics["failures"]))
+        else:
+            logging.info("  - Latency of {:<7} n/a ({} failure(s))".format(operation + ":", statistics["failures"]))
+    if results["remaining_activities"] is not None:
+        logging.info("  - Activities remaining in the stand-in LMS: {}".format(results["remaining_activities"]))
+
+
+#############################################################################
+# Main program
+#############################################################################
+def main(args):
+
+    # Configure logging
+    logging.basicConfig(level=logging.INFO,
+                        format='* %(levelname)s: %(filename)s: %(message)s')
+
+    # Program parameters and their default values
+    parameters = {"cycles": DEFAULT_CYCLES, "workers": DEFAULT_WORKERS, "batch": DEFAULT_BATCH,
+                  "package_size": DEFAULT_PACKAGE_SIZE, "latency": DEFAULT_LATENCY,
+                  "failure_rate": DEFAULT_FAILURE_RATE, "rest": False, "verbose": False}
+    config_file = None
+    output_file = None
+    keep_files = False
+
+    # Parse command line arguments
+    try:
+        opts, trailing_args = getopt.getopt(args, "hn:w:b:s:l:f:rc:o:v",
+                                            ["help", "cycles=", "workers=", "batch=", "package-size=", "latency=",
+                                             "failure-rate=", "rest", "config-file=", "output=", "verbose", "keep"])
+        for opt, arg in opts:
+            if opt in ("-h", "--help"):
+                usage()
+                sys.exit()
+            elif opt in ("-n", "--cycles"):
+                parameters["cycles"] = int(arg)
+            elif opt in ("-w", "--workers"):
+                parameters["workers"] = int(arg)
+            elif opt in ("-b", "--batch"):
+                parameters["batch"] = int(arg)
+            elif opt in ("-s", "--package-size"):
+                parameters["package_size"] = int(arg)
+            elif opt in ("-l", "--latency"):
+                parameters["latency"] = arg
+            elif opt in ("-f", "--failure-rate"):
+                parameters["failure_rate"] = float(arg)
+            elif opt in ("-r", "--rest"):
+                parameters["rest"] = True
+            elif opt in ("-c", "--config-file"):
+                config_file = os.path.abspath(arg)
+            elif opt in ("-o", "--output"):
+                output_file = arg
+            elif opt in ("-v", "--verbose"):
+                parameters["verbose"] = True
+            elif opt == "--keep":
+                keep_files = True
+    except (getopt.GetoptError, ValueError) as err:
+        logging.error("Command-line argument error: {}".format(str(err)))
+        usage()
+        sys.exit(1)
+
+    if trailing_args:
+        logging.error("Unrecognized trailing arguments {} => abort execution.".format(trailing_args))
+        usage()
+        sys.exit(1)
+    if parameters["cycles"] < 1 or parameters["workers"] < 1 or parameters["batch"] < 1:
+        logging.error("At least one cycle, worker and activity per cycle are required => abort execution.")
+        sys.exit(1)
+
+    # Run the load test
+    results = run_load_test(parameters, config_file, keep_files)
+    if not results:
+        logging.error("Failed to get the course id => abort load test.")
+        sys.exit(1)
+    show_results(results)
+
+    if output_file:
+        try:
+            with open(output_file, "w") as output_stream:
+                json.dump(results, output_stream, indent=2, sort_keys=True, separators=(",", ": "))
+            logging.info("Saved results to '{}'.".format(output_file))
+        except IOError as e:
+            logging.error("Cannot save results to '{}': {}".format(output_file, str(e)))
+            sys.exit(1)
+
+
+#############################################################################
+# Run program
+#############################################################################
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,15 @@
+<?php
+// Web service functions of the CyLMS plugin
+
+defined('MOODLE_INTERNAL') || die();
+
+$functions = array(
+    'local_cylms_add_scorm_activities' => array(
+        'classname' => 'local_cylms_external',
+        'methodname' => 'add_scorm_activities',
+        'classpath' => 'local/cylms/externallib.php',
+        'description' => 'Add SCORM activities to a course section from packages uploaded to draft areas.',
+        'type' => 'write',
+        'capabilities' => 'moodle/course:manageactivities',
+    ),
+);
@@ -0,0 +1,86 @@
+<?php
+// Implementation of the web service functions of the CyLMS plugin
+
+defined('MOODLE_INTERNAL') || die();
+
+require_once($CFG->libdir . '/externallib.php');
+
+class local_cylms_external extends external_api {
+
+    // Session file of shared packages (see Storyboard.SESSION_FILE of CyLMS)
+    const SESSION_FILE_PATH = '/shared/';
+    const SESSION_FILE_NAME = 'session.js';
+
+    // Parameters of add_scorm_activities
+    public static function add_scorm_activities_parameters() {
+        return new external_function_parameters(array(
+            'courseid' => new external_value(PARAM_INT, 'Course id'),
+            'section' => new external_value(PARAM_INT, 'Section number'),
+            'activities' => new external_multiple_structure(new external_single_structure(array(
+                'key' => new external_value(PARAM_RAW, 'Key that identifies the activity in the results'),
+                'name' => new external_value(PARAM_TEXT, 'Activity name'),
+                'intro' => new external_value(PARAM_RAW, 'Activity description'),
+                'draftitemid' => new external_value(PARAM_INT, 'Draft area that contains the SCORM package'),
+                'sessionfile' => new external_value(PARAM_RAW, 'Content of the session file of a shared package',
+                                                    VALUE_OPTIONAL),
+            ))),
+        ));
+    }
+
+    // Add SCORM activities; activities are created in the same manner as by
+    // the bulk add script of CyLMS, so that their settings are the same
+    public static function add_scorm_activities($courseid, $section, $activities) {
+        global $CFG;
+        require_once($CFG->libdir . '/testing/generator/data_generator.php');
+
+        $params = self::validate_parameters(self::add_scorm_activities_parameters(),
+            array('courseid' => $courseid, 'section' => $section, 'activities' => $activities));
+        $context = context_course::instance($params['courseid']);
+        self::validate_context($context);
+        require_capability('moodle/course:manageactivities', $context);
+
+        $generator = new testing_data_generator();
+        $results = array();
+        foreach ($params['activities'] as $activity) {
+            try {
+                $moduledata = new stdClass();
+                $moduledata->course = $params['courseid'];
+                $moduledata->section = $params['section'];
+                $moduledata->name = $activity['name'];
+                $moduledata->intro = $activity['intro'];
+                $moduledata->showdescription = 1;
+                $moduledata->packagefile = $activity['draftitemid'];
+                $moduledata->updatefreq = 0; // SCORM_UPDATE_NEVER
+                $record = $generator->create_module('scorm', $moduledata);
+                if (isset($activity['sessionfile'])) {
+                    self::write_session_file($record->cmid, $activity['sessionfile']);
+                }
+                $results[] = array('key' => $activity['key'], 'id' => $record->cmid);
+            } catch (Exception $e) {
+                $results[] = array('key' => $activity['key'], 'error' => $e->getMessage());
+            }
+        }
+        return $results;
+    }
+
+    // Replace the default session file of the extracted package of an activity
+    protected static function write_session_file($cmid, $content) {
+        $fs = get_file_storage();
+        $contextid = context_module::instance($cmid)->id;
+        if ($file = $fs->get_file($contextid, 'mod_scorm', 'content', 0, self::SESSION_FILE_PATH, self::SESSION_FILE_NAME)) {
+            $file->delete();
+        }
+        $fs->create_file_from_string(array('contextid' => $contextid, 'component' => 'mod_scorm', 'filearea' => 'content',
+                                           'itemid' => 0, 'filepath' => self::SESSION_FILE_PATH,
+                                           'filename' => self::SESSION_FILE_NAME), $content);
+    }
+
+    // Return value of add_scorm_activities
+    public static function add_scorm_activities_returns() {
+        return new external_multiple_structure(new external_single_structure(array(
+            'key' => new external_value(PARAM_RAW, 'Key that identifies the activity'),
+            'id' => new external_value(PARAM_INT, 'Course module id of the added activity', VALUE_OPTIONAL),
+            'error' => new external_value(PARAM_RAW, 'Error message if the activity could not be added', VALUE_OPTIONAL),
+        )));
+    }
+}
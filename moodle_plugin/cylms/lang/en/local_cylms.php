@@ -0,0 +1,4 @@
+<?php
+// Strings of the CyLMS plugin
+
+$string['pluginname'] = 'CyLMS web services';
@@ -0,0 +1,14 @@
+<?php
+// CyLMS web service functions for Moodle, used by the REST LMS backend of
+// CyLMS (lms_backend = rest); to install the plugin, copy this directory to
+// <moodle>/local/cylms and upgrade Moodle, then enable the REST protocol,
+// add the functions local_cylms_add_scorm_activities, core_course_get_courses
+// and core_course_delete_modules to an external service, and create a token
+// for that service (setting lms_token)
+
+defined('MOODLE_INTERNAL') || die();
+
+$plugin->component = 'local_cylms';
+$plugin->version = 2026101801;
+$plugin->requires = 2015111600; // Moodle 3.0
+$plugin->maturity = MATURITY_STABLE;
@@ -0,0 +1,295 @@
+#############################################################################
+# Performance instrumentation for CyLMS
+#############################################################################
+
+# External imports
+import atexit
+import functools
+import json
+import logging
+import os
+import sys
+import tempfile
+import threading
+import time
+
+#############################################################################
+# Constants
+#############################################################################
+
+# Version of the JSON export format
+METRICS_VERSION = 1
+
+# Prometheus textfile export settings: metric name prefix, and extension of
+# the output file that selects this format (JSON is used otherwise)
+PROMETHEUS_PREFIX = "cylms_"
+PROMETHEUS_EXTENSION = ".prom"
+
+# Prefix of temporary files used while exporting metrics
+TEMP_FILE_PREFIX = ".cylms-"
+
+#############################################################################
+# Class that records the metrics of instrumented operations: durations,
+# byte counts, and number of subprocesses run
+#############################################################################
+class MetricsRegistry:
+
+    # Constructor
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.start_time = time.time()
+        # Durations: operation name => [call count, total, minimum, maximum]
+        self.durations = {}
+        # Byte counts: name => total bytes
+        self.byte_counts = {}
+        # Subprocess counts: command => number of runs
+        self.subprocess_counts = {}
+
+    # Record the duration of an operation (in seconds)
+    def add_duration(self, name, duration):
+        with self.lock:
+            entry = self.durations.get(name)
+            if entry is None:
+                self.durations[name] = [1, duration, duration, duration]
+            else:
+                entry[0] += 1
+                entry[1] += duration
+                entry[2] = min(entry[2], duration)
+                entry[3] = max(entry[3], duration)
+
+    # Record a number of bytes processed by an operation
+    def add_bytes(self, name, byte_count):
+        with self.lock:
+            self.byte_counts[name] = self.byte_counts.get(name, 0) + byte_count
+
+    # Record that a subprocess was run
+    def add_subprocess(self, command):
+        with self.lock:
+            self.subprocess_counts[command] = self.subprocess_counts.get(command, 0) + 1
+
+    # Add the metrics recorded by another registry (as returned by its
+    # get_metrics() method, e.g., in another process) to those of this one
+    def merge(self, metrics):
+        with self.lock:
+            for name, entry in metrics["durations"].items():
+                current_entry = self.durations.get(name)
+                if current_entry is None:
+                    self.durations[name] = [entry["count"], entry["total"], entry["min"], entry["max"]]
+                else:
+                    current_entry[0] += entry["count"]
+                    current_entry[1] += entry["total"]
+                    current_entry[2] = min(current_entry[2], entry["min"])
+                    current_entry[3] = max(current_entry[3], entry["max"])
+            for name, byte_count in metrics["bytes"].items():
+                self.byte_counts[name] = self.byte_counts.get(name, 0) + byte_count
+            for command, count in metrics["subprocesses"].items():
+                self.subprocess_counts[command] = self.subprocess_counts.get(command, 0) + count
+
+    # Remove all the recorded metrics
+    def clear(self):
+        with self.lock:
+            self.start_time = time.time()
+            self.durations.clear()
+            self.byte_counts.clear()
+            self.subprocess_counts.clear()
+
+    # Get the recorded metrics as a dictionary
+    def get_metrics(self):
+        with self.lock:
+            durations = {}
+            for name, (count, total, minimum, maximum) in self.durations.items():
+                durations[name] = {"count": count, "total": round(total, 6), "min": round(minimum, 6),
+                                   "max": round(maximum, 6)}
+            return {"version": METRICS_VERSION,
+                    "elapsed": round(time.time() - self.start_time, 6),
+                    "durations": durations,
+                    "bytes": dict(self.byte_counts),
+                    "subprocesses": dict(self.subprocess_counts)}
+
+    # Get a summary of the metrics as a list of lines
+    def get_summary(self):
+        metrics = self.get_metrics()
+        lines = ["Timings summary ({:.3f} s elapsed):".format(metrics["elapsed"])]
+        # Slowest operations first (durations of nested operations are included)
+        for name, entry in sorted(metrics["durations"].items(), key=lambda item: item[1]["total"], reverse=True):
+            lines.append("  - {}: {} call(s), total {:.3f} s (min {:.3f} s, avg {:.3f} s, max {:.3f} s)"
+                         .format(name, entry["count"], entry["total"], entry["min"],
+                                 entry["total"] / entry["count"], entry["max"]))
+        for name, byte_count in sorted(metrics["bytes"].items()):
+            lines.append("  - {}: {} byte(s)".format(name, byte_count))
+        if metrics["subprocesses"]:
+            lines.append("  - Subprocesses: {}".format(", ".join(["{}: {}".format(command, count) for command, count
+                                                                 in sorted(metrics["subprocesses"].items())])))
+        return lines
+
+    # Get the metrics in the Prometheus text exposition format
+    def get_prometheus_text(self):
+        metrics = self.get_metrics()
+        lines = []
+        def add_metric(name, metric_type, description, label, values):
+            lines.append("# HELP {}{} {}".format(PROMETHEUS_PREFIX, name, description))
+            lines.append("# TYPE {}{} {}".format(PROMETHEUS_PREFIX, name, metric_type))
+            for label_value, value in sorted(values.items()):
+                lines.append('{}{}{{{}="{}"}} {}'.format(PROMETHEUS_PREFIX, name, label, label_value, value))
+        add_metric("operation_calls_total", "counter", "Number of calls of each instrumented operation.",
+                   "operation", dict([(name, entry["count"]) for name, entry in metrics["durations"].items()]))
+        add_metric("operation_duration_seconds_total", "counter", "Total time spent in each instrumented operation.",
+                   "operation", dict([(name, entry["total"]) for name, entry in metrics["durations"].items()]))
+        add_metric("operation_duration_seconds_max", "gauge", "Maximum duration of each instrumented operation.",
+                   "operation", dict([(name, entry["max"]) for name, entry in metrics["durations"].items()]))
+        add_metric("bytes_total", "counter", "Number of bytes processed by instrumented operations.",
+                   "name", metrics["bytes"])
+        add_metric("subprocesses_total", "counter", "Number of subprocesses run for each command.",
+                   "command", metrics["subprocesses"])
+        lines.append("# HELP {0}elapsed_seconds Time since the metrics were reset.".format(PROMETHEUS_PREFIX))
+        lines.append("# TYPE {0}elapsed_seconds gauge".format(PROMETHEUS_PREFIX))
+        lines.append("{}elapsed_seconds {}".format(PROMETHEUS_PREFIX, metrics["elapsed"]))
+        return "\n".join(lines) + "\n"
+
+    # Save the metrics to file, in Prometheus textfile format if the file has
+    # the corresponding extension, in JSON format otherwise; the file is
+    # replaced atomically so that collectors never read a partial file
+    def save(self, output_file):
+        if output_file.endswith(PROMETHEUS_EXTENSION):
+            content = self.get_prometheus_text()
+        else:
+            content = json.dumps(self.get_metrics(), indent=2, sort_keys=True, separators=(",", ": ")) + "\n"
+        temp_fd, temp_name = tempfile.mkstemp(prefix=TEMP_FILE_PREFIX, dir=os.path.dirname(os.path.abspath(output_file)))
+        try:
+            with os.fdopen(temp_fd, "w") as output_stream:
+                output_stream.write(content)
+            os.chmod(temp_name, 0o644)
+            os.rename(temp_name, output_file)
+        except (IOError, OSError) as e:
+            logging.error("Cannot save metrics to '{}': {}".format(output_file, str(e)))
+            if os.path.exists(temp_name):
+                os.remove(temp_name)
+            return False
+        return True
+
+
+#############################################################################
+# Class used as context manager to measure the duration of an operation
+#############################################################################
+class Timer:
+
+    # Constructor
+    def __init__(self, name):
+        self.name = name
+        self.start_time = None
+
+    # Start measuring
+    def __enter__(self):
+        self.start_time = time.time()
+        return self
+
+    # Stop measuring and record the duration (even if an exception was raised)
+    def __exit__(self, exc_type, exc_value, traceback):
+        registry.add_duration(self.name, time.time() - self.start_time)
+        return False
+
+
+#############################################################################
+# Class used as context manager when instrumentation is disabled
+#############################################################################
+class NullTimer:
+
+    # Do nothing
+    def __enter__(self):
+        return self
+
+    # Do nothing
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+#############################################################################
+# Functions
+#############################################################################
+
+# Metrics of the process; they are only recorded if instrumentation is
+# enabled, so that the overhead is negligible otherwise
+registry = MetricsRegistry()
+enabled = False
+null_timer = NullTimer()
+
+# Enable the instrumentation (the metrics recorded so far are removed)
+def enable():
+    global enabled
+    registry.clear()
+    enabled = True
+
+# Get a context manager that records the duration of an operation
+def timer(name):
+    if enabled:
+        return Timer(name)
+    return null_timer
+
+# Decorator that records the duration of each call of a function
+def timed(name):
+    def decorator(function):
+        @functools.wraps(function)
+        def timed_function(*args, **kwargs):
+            if not enabled:
+                return function(*args, **kwargs)
+            with Timer(name):
+                return function(*args, **kwargs)
+        return timed_function
+    return decorator
+
+# Record a number of bytes processed by an operation
+def add_bytes(name, byte_count):
+    if enabled:
+        registry.add_bytes(name, byte_count)
+
+# Record that a subprocess was run
+def add_subprocess(command):
+    if enabled:
+        registry.add_subprocess(command)
+
+# Report the metrics: show the summary and/or save them to file
+def report(show_summary=True, output_file=None):
+    if show_summary:
+        for line in registry.get_summary():
+            logging.info(line)
+    if output_file and registry.save(output_file):
+        logging.info("Saved metrics to '{}'.".format(output_file))
+
+# Enable the instrumentation and report the metrics when the program ends
+def report_at_exit(show_summary=True, output_file=None):
+    enable()
+    atexit.register(report, show_summary, output_file)
+
+
+#############################################################################
+# Main program (used for testing purposes)
+#############################################################################
+def main(args):
+
+    # Configure logging level for running the tests below
+    logging.basicConfig(level=logging.INFO,
+                        format='* %(levelname)s: %(filename)s: %(message)s')
+
+    # Record a few simulated operations, then report the metrics (and save
+    # them to the file given as argument, if any)
+    enable()
+    @timed("simulated.operation")
+    def simulated_operation(duration):
+        time.sleep(duration)
+    for index in range(5):
+        simulated_operation(0.01 * (index + 1))
+        add_bytes("simulated.bytes", 1024 * (index + 1))
+        add_subprocess("simulated")
+    with timer("simulated.block"):
+        time.sleep(0.02)
+    output_file = None
+    if args:
+        output_file = args[0]
+    report(True, output_file)
+
+
+#############################################################################
+# Run main program
+#############################################################################
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,301 @@
+#############################################################################
+# SCORM package management for CyLMS
+#############################################################################
+
+# External imports
+import hashlib
+import glob
+import logging
+import os
+import platform
+import struct
+import sys
+import tempfile
+import zipfile
+
+#############################################################################
+# Constants
+#############################################################################
+
+# Directory inside the SCORM package into which resources are copied
+RESOURCES_PACKAGE_DIR = "shared"
+
+# Extension of SCORM package files
+PACKAGE_EXTENSION = ".zip"
+
+# Prefix of temporary files used while a package is being written
+TEMP_PACKAGE_PREFIX = ".cylms-"
+
+# Constants regarding the pre-compressed template cache
+## Use the cache by default (template entries are then compressed only once)
+TEMPLATE_CACHE_ENABLED = True
+## Cache directory (created next to the template) and cache file names
+CACHE_DIRECTORY = "cache"
+TEMPLATE_CACHE_FILE_TEMPLATE = "template-{}.zip"
+## Size of local file headers in ZIP archives (without file name and extra field),
+## offset of the file name and extra field lengths, and copy buffer size
+ZIP_LOCAL_HEADER_SIZE = 30
+ZIP_LOCAL_HEADER_LENGTHS_OFFSET = 26
+ZIP_COPY_BUFFER_SIZE = 65536
+## Attributes of archives open for writing that are used to copy entries without
+## decompressing them; these internals of the zipfile module were tested with
+## CPython 2.7.18, and the cache is not used if they are missing
+ZIP_RAW_COPY_ATTRIBUTES = ["fp", "filelist", "NameToInfo", "_didModify"]
+
+#############################################################################
+# Class that creates SCORM packages by streaming the entries of a template
+# (directory or ZIP archive) directly into the package archive
+#############################################################################
+class PackageManager:
+
+    # Constructor
+    def __init__(self, template_path, use_cache=None):
+        self.template_path = template_path
+        self.template_is_zip = os.path.isfile(template_path)
+        if use_cache is None:
+            use_cache = TEMPLATE_CACHE_ENABLED
+        self.use_cache = use_cache
+        self.cache_dir = os.path.join(os.path.dirname(os.path.abspath(template_path)), CACHE_DIRECTORY)
+
+    # Compute a signature of the template that changes whenever any of its
+    # files is added, removed or modified (based on names, sizes and mtimes)
+    def get_template_signature(self):
+        signature = hashlib.sha1()
+        if self.template_is_zip:
+            file_list = [(os.path.basename(self.template_path), self.template_path)]
+        else:
+            file_list = get_directory_entries(self.template_path, "")
+        for arcname, file_path in file_list:
+            file_stat = os.stat(file_path)
+            signature.update("{}\0{}\0{}\0".format(arcname, file_stat.st_size, file_stat.st_mtime))
+        return signature.hexdigest()
+
+    # Get the pre-compressed template cache (a ZIP archive with all the template
+    # entries already deflated), building it if it doesn't exist or is outdated;
+    # return the cache file name, or None if the cache cannot be used
+    def get_template_cache(self):
+        try:
+            cache_name = os.path.join(self.cache_dir, TEMPLATE_CACHE_FILE_TEMPLATE.format(self.get_template_signature()))
+            if os.path.isfile(cache_name):
+                return cache_name
+
+            logging.debug("Build template cache '{}'.".format(cache_name))
+            if not os.path.isdir(self.cache_dir):
+                os.makedirs(self.cache_dir)
+            temp_fd, temp_name = tempfile.mkstemp(prefix=TEMP_PACKAGE_PREFIX, suffix=PACKAGE_EXTENSION, dir=self.cache_dir)
+            os.close(temp_fd)
+            try:
+                with zipfile.ZipFile(temp_name, "w", zipfile.ZIP_DEFLATED) as cache_zip:
+                    self.write_template_entries(cache_zip, self.get_template_entries(), set())
+                os.rename(temp_name, cache_name)
+            finally:
+                if os.path.exists(temp_name):
+                    os.remove(temp_name)
+
+            # Remove outdated cache files
+            for old_cache_name in glob.glob(os.path.join(self.cache_dir, TEMPLATE_CACHE_FILE_TEMPLATE.format("*"))):
+                if old_cache_name != cache_name:
+                    os.remove(old_cache_name)
+
+            return cache_name
+
+        except (IOError, OSError, zipfile.BadZipfile) as e:
+            logging.warning("Cannot use template cache in '{}' => compress template directly: {}"
+                            .format(self.cache_dir, str(e)))
+            return None
+
+    # Get the list of template entries as (archive name, source) pairs; the
+    # source is a file path for template directories, and the entry name for
+    # template ZIP archives
+    def get_template_entries(self):
+        if self.template_is_zip:
+            with zipfile.ZipFile(self.template_path) as template_zip:
+                return [(name, name) for name in template_zip.namelist() if not name.endswith("/")]
+        else:
+            return get_directory_entries(self.template_path, "")
+
+    # Create a SCORM package with the given base name (the extension is added
+    # automatically); rendered files (a dictionary of archive names and content)
+    # replace the corresponding template entries, and the files in the resources
+    # directory (if any) are added under the 'shared' folder; return the package
+    # file name, or None on error
+    def create_package(self, base_package_name, rendered_files, resources=None):
+
+        package_name = base_package_name + PACKAGE_EXTENSION
+
+        # Collect the entries of the package; rendered files take precedence over
+        # resources, which in turn take precedence over template entries
+        template_entries = []
+        for arcname, source in self.get_template_entries():
+            if arcname not in rendered_files:
+                template_entries.append((arcname, source))
+        resource_entries = []
+        if resources:
+            if not os.path.isdir(resources):
+                logging.error("Resources directory not found: {}".format(resources))
+                return None
+            for arcname, source in get_directory_entries(resources, RESOURCES_PACKAGE_DIR):
+                if arcname not in rendered_files:
+                    resource_entries.append((arcname, source))
+        resource_names = set([arcname for arcname, source in resource_entries])
+
+        # Write the package to a temporary file first, so that an existing package
+        # is only replaced once the new one is complete
+        package_dir = os.path.dirname(os.path.abspath(package_name))
+        temp_name = None
+        try:
+            temp_fd, temp_name = tempfile.mkstemp(prefix=TEMP_PACKAGE_PREFIX, suffix=PACKAGE_EXTENSION, dir=package_dir)
+            os.close(temp_fd)
+            with zipfile.ZipFile(temp_name, "w", zipfile.ZIP_DEFLATED) as package_zip:
+                # Copy template entries; when the template cache is available its entries
+                # are copied as they are, without being decompressed and compressed again
+                cache_name = None
+                if self.use_cache:
+                    if raw_copy_supported(package_zip):
+                        cache_name = self.get_template_cache()
+                    else:
+                        logging.debug("Raw copy of ZIP entries not supported => compress template directly.")
+                if cache_name:
+                    with open(cache_name, "rb") as cache_file:
+                        cache_zip = zipfile.ZipFile(cache_file)
+                        for cache_info in cache_zip.infolist():
+                            if cache_info.filename not in resource_names and cache_info.filename not in rendered_files:
+                                copy_raw_entry(cache_file, cache_info, package_zip)
+                else:
+                    self.write_template_entries(package_zip, template_entries, resource_names)
+
+                # Copy resources
+                for arcname, source in resource_entries:
+                    package_zip.write(source, arcname)
+
+                # Add rendered files
+                for arcname in sorted(rendered_files):
+                    package_zip.writestr(arcname, rendered_files[arcname])
+
+            os.chmod(temp_name, 0o644)
+            os.rename(temp_name, package_name)
+
+        except (IOError, OSError, zipfile.BadZipfile) as e:
+            logging.error("Issue when creating package '{}': {}".format(package_name, str(e)))
+            if temp_name and os.path.exists(temp_name):
+                os.remove(temp_name)
+            return None
+
+        return package_name
+
+
+    # Write the given template entries to a ZIP archive, except for those
+    # whose names are in the set of excluded names
+    def write_template_entries(self, package_zip, template_entries, excluded_names):
+        if self.template_is_zip:
+            with zipfile.ZipFile(self.template_path) as template_zip:
+                for arcname, source in template_entries:
+                    if arcname not in excluded_names:
+                        source_info = template_zip.getinfo(source)
+                        zinfo = zipfile.ZipInfo(arcname, source_info.date_time)
+                        zinfo.external_attr = source_info.external_attr
+                        zinfo.compress_type = zipfile.ZIP_DEFLATED
+                        package_zip.writestr(zinfo, template_zip.read(source))
+        else:
+            for arcname, source in template_entries:
+                if arcname not in excluded_names:
+                    package_zip.write(source, arcname)
+
+
+#############################################################################
+# Functions
+#############################################################################
+
+# Check whether entries can be copied without being decompressed into the
+# given archive open for writing (see copy_raw_entry()); this relies on
+# internals of the zipfile module, which were tested with CPython 2.7.18
+def raw_copy_supported(package_zip):
+    return (platform.python_implementation() == "CPython" and sys.version_info[:2] == (2, 7)
+            and hasattr(zipfile.ZipInfo, "FileHeader")
+            and all([hasattr(package_zip, attribute) for attribute in ZIP_RAW_COPY_ATTRIBUTES]))
+
+# Copy an entry of a ZIP archive (given its open file and entry info) to
+# another archive open for writing, without decompressing its data; use
+# raw_copy_supported() first to check that this is possible
+def copy_raw_entry(source_file, source_info, package_zip):
+
+    # Locate the compressed data after the local file header of the entry
+    source_file.seek(source_info.header_offset)
+    local_header = source_file.read(ZIP_LOCAL_HEADER_SIZE)
+    name_length, extra_length = struct.unpack(
+        "<HH", local_header[ZIP_LOCAL_HEADER_LENGTHS_OFFSET:ZIP_LOCAL_HEADER_SIZE])
+    source_file.seek(source_info.header_offset + ZIP_LOCAL_HEADER_SIZE + name_length + extra_length)
+
+    # Build the entry info for the target archive; sizes and CRC are known,
+    # so they are written directly in the local file header
+    zinfo = zipfile.ZipInfo(source_info.filename, source_info.date_time)
+    zinfo.compress_type = source_info.compress_type
+    zinfo.external_attr = source_info.external_attr
+    zinfo.CRC = source_info.CRC
+    zinfo.compress_size = source_info.compress_size
+    zinfo.file_size = source_info.file_size
+
+    # Write local file header and compressed data
+    zinfo.header_offset = package_zip.fp.tell()
+    package_zip.fp.write(zinfo.FileHeader())
+    remaining_size = zinfo.compress_size
+    while remaining_size > 0:
+        data = source_file.read(min(remaining_size, ZIP_COPY_BUFFER_SIZE))
+        if not data:
+            raise IOError("Unexpected end of file when copying entry '{}'".format(zinfo.filename))
+        package_zip.fp.write(data)
+        remaining_size -= len(data)
+
+    # Register the entry so that it is included in the central directory
+    package_zip.filelist.append(zinfo)
+    package_zip.NameToInfo[zinfo.filename] = zinfo
+    package_zip._didModify = True
+    if hasattr(package_zip, "start_dir"):
+        package_zip.start_dir = package_zip.fp.tell()
+
+
+# Get the files in a directory tree as (archive name, file path) pairs,
+# where archive names are prefixed by the given archive directory
+def get_directory_entries(directory, archive_dir):
+    entries = []
+    for dirpath, dirnames, filenames in os.walk(directory):
+        dirnames.sort()
+        for filename in sorted(filenames):
+            file_path = os.path.join(dirpath, filename)
+            if os.path.isfile(file_path):
+                arcname = os.path.relpath(file_path, directory).replace(os.sep, "/")
+                if archive_dir:
+                    arcname = archive_dir + "/" + arcname
+                entries.append((arcname, file_path))
+    return entries
+
+
+#############################################################################
+# Main program (used for testing purposes)
+#############################################################################
+def main(args):
+
+    # Configure logging level for running the tests below
+    logging.basicConfig(level=logging.INFO,
+                        format='* %(levelname)s: %(filename)s: %(message)s')
+
+    # Create a package from the template located in the program directory
+    # (or the template given as argument) without any rendered files
+    if len(args) >= 1:
+        template_path = args[0]
+    else:
+        template_path = os.path.dirname(os.path.realpath(__file__)) + "/Template"
+    package_manager = PackageManager(template_path)
+    package_name = package_manager.create_package("template_copy", {})
+    if package_name:
+        logging.info("Created package '{}'.".format(package_name))
+    else:
+        logging.error("Failed to create package from template '{}'.".format(template_path))
+        sys.exit(1)
+
+
+#############################################################################
+# Run main program
+#############################################################################
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,187 @@
+#############################################################################
+# Cyber range information management for CyLMS
+#############################################################################
+
+# External imports
+import collections
+import logging
+import os
+import re
+import sys
+import threading
+
+#############################################################################
+# Constants
+#############################################################################
+
+# Default range directory and range id (if not provided as arguments)
+RANGE_DIRECTORY_DEFAULT = "/home/cyuser/cyris/cyber_range"
+RANGE_ID_DEFAULT = 1
+
+# Files created by CyRIS for each range
+TUNNEL_FILENAME_TEMPLATE = "{}/{}/create_tunnels.sh"
+DETAILS_FILENAME_TEMPLATE = "{}/{}/range_details-cr{}.yml"
+
+# Tunnel creation file settings: tunnels are created by ssh commands with a local
+# port forwarding option of the form "-L [bind_address:]port:host:hostport", where
+# host is the IP address of an entry point
+SSH_TAG = "ssh"
+TUNNEL_REGEX = re.compile(r"(?:^|\s)-L\s*(?:\S+?:)?\d+:([^:\s]+):\d+")
+## Position of the forwarding option in the ssh command (used if the regular
+## expression above doesn't match)
+TUNNEL_UNIT_INDEX = 12
+TUNNEL_IP_INDEX = 2
+
+# Range details file settings: each domain is described by its KVM domain
+# name followed by the IP addresses of its interfaces
+KVM_DOMAIN_REGEX = re.compile(r"^\s*-?\s*kvm_domain\s*:\s*(\S+)")
+INTERFACE_REGEX = re.compile(r"^\s*-?\s*eth0\s*:\s*(\S+)")
+
+#############################################################################
+# Class that contains the information about a cyber range
+#############################################################################
+class RangeInfo:
+
+    # Constructor
+    def __init__(self, range_id, tunnel_ip_addresses, entry_points):
+        self.range_id = range_id
+        # IP addresses of the entry points, in tunnel creation order
+        self.tunnel_ip_addresses = tunnel_ip_addresses
+        # Entry point KVM domain names mapped to their IP addresses,
+        # in range details order
+        self.entry_points = entry_points
+
+    # Get the KVM domain names of the entry points
+    def get_kvm_domains(self):
+        return list(self.entry_points.keys())
+
+
+#############################################################################
+# Class that parses the files created by CyRIS for the ranges in a directory,
+# and caches the results until the files are modified
+#############################################################################
+class RangeManager:
+
+    # Constructor
+    def __init__(self, range_dir):
+        self.range_dir = range_dir
+        self.range_infos = {}
+        self.lock = threading.Lock()
+
+    # Get the information about a range; return None on error
+    def get_range_info(self, range_id):
+
+        tunnel_filename = TUNNEL_FILENAME_TEMPLATE.format(self.range_dir, range_id)
+        details_filename = DETAILS_FILENAME_TEMPLATE.format(self.range_dir, range_id, range_id)
+        try:
+            file_mtimes = (os.path.getmtime(tunnel_filename), os.path.getmtime(details_filename))
+        except OSError as e:
+            logging.error("I/O Error: " + str(e))
+            return None
+
+        # Use the cached information if the files weren't modified since they were parsed
+        range_key = str(range_id)
+        with self.lock:
+            cached_entry = self.range_infos.get(range_key)
+        if cached_entry and cached_entry[0] == file_mtimes:
+            logging.debug("Use cached info about range #{}".format(range_id))
+            return cached_entry[1]
+
+        try:
+            logging.debug("  - Get entry point IP(s)")
+            tunnel_ip_addresses = parse_tunnel_file(tunnel_filename)
+            logging.debug("  - Get entry point domain name(s)")
+            entry_points = parse_details_file(details_filename, set(tunnel_ip_addresses))
+        except IOError as e:
+            logging.error("I/O Error: " + str(e))
+            return None
+
+        range_info = RangeInfo(range_id, tunnel_ip_addresses, entry_points)
+        with self.lock:
+            self.range_infos[range_key] = (file_mtimes, range_info)
+        return range_info
+
+
+#############################################################################
+# Functions
+#############################################################################
+
+# Get the IP addresses of the entry points from a tunnel creation file
+def parse_tunnel_file(tunnel_filename):
+    tunnel_ip_addresses = []
+    with open(tunnel_filename) as tunnel_file:
+        for line in tunnel_file:
+            if SSH_TAG not in line:
+                continue
+            match = TUNNEL_REGEX.search(line)
+            if match:
+                tunnel_ip_addresses.append(match.group(1))
+            else:
+                try:
+                    tunnel_ip_addresses.append(line.split(" ")[TUNNEL_UNIT_INDEX].split(":")[TUNNEL_IP_INDEX])
+                except IndexError:
+                    logging.warning("Unrecognized tunnel creation command: {}".format(line.rstrip()))
+    return tunnel_ip_addresses
+
+# Get the KVM domain names of the domains whose IP addresses are in the given set
+# from a range details file, as an ordered mapping from domain name to IP address
+def parse_details_file(details_filename, ip_address_set):
+    entry_points = collections.OrderedDict()
+    kvm_domain = None
+    with open(details_filename) as details_file:
+        for line in details_file:
+            match = KVM_DOMAIN_REGEX.match(line)
+            if match:
+                kvm_domain = match.group(1)
+                continue
+            match = INTERFACE_REGEX.match(line)
+            if match and kvm_domain and match.group(1) in ip_address_set and kvm_domain not in entry_points:
+                entry_points[kvm_domain] = match.group(1)
+    return entry_points
+
+# Range managers indexed by range directory, so that range files are parsed
+# only once per process (or again after they are modified)
+range_managers = {}
+range_managers_lock = threading.Lock()
+
+# Get the manager for the given range directory (create it if needed)
+def get_range_manager(range_dir):
+    range_dir = os.path.abspath(range_dir)
+    with range_managers_lock:
+        if range_dir not in range_managers:
+            range_managers[range_dir] = RangeManager(range_dir)
+        return range_managers[range_dir]
+
+
+#############################################################################
+# Main program (used for testing purposes)
+#############################################################################
+def main(args):
+
+    # Configure logging level for running the tests below
+    logging.basicConfig(level=logging.INFO,
+                        format='* %(levelname)s: %(filename)s: %(message)s')
+
+    # Get arguments (if any)
+    range_dir = RANGE_DIRECTORY_DEFAULT
+    range_id = RANGE_ID_DEFAULT
+    if len(args) >= 1:
+        range_dir = args[0]
+    if len(args) >= 2:
+        range_id = args[1]
+
+    # Show the entry points of the range
+    range_info = get_range_manager(range_dir).get_range_info(range_id)
+    if not range_info:
+        logging.error("Failed to get info about range #{}.".format(range_id))
+        sys.exit(1)
+    logging.info("Entry points of range #{}:".format(range_id))
+    for kvm_domain, ip_address in range_info.entry_points.items():
+        logging.info("  - {}: {}".format(kvm_domain, ip_address))
+
+
+#############################################################################
+# Run main program
+#############################################################################
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,611 @@
+#############################################################################
+# Local stand-in LMS for CyLMS (used for testing and load testing)
+#############################################################################
+
+# External imports
+import base64
+import BaseHTTPServer
+import cgi
+import contextlib
+import csv
+import hashlib
+import json
+import logging
+import os
+import random
+import re
+import shlex
+import shutil
+import SocketServer
+import sqlite3
+import StringIO
+import subprocess
+import sys
+import threading
+import time
+import urlparse
+
+# Internal imports
+import perf_mgmt
+import ws_mgmt
+
+#############################################################################
+# Constants
+#############################################################################
+
+# Commands understood by the stand-in; moosh is recognized by the name of
+# its script, whatever its installation path on the LMS host is
+MOOSH_SCRIPT_NAME = "moosh.php"
+MOOSH_PATH_OPTION = "-p"
+PHP_COMMAND = "php"
+REMOVE_COMMAND = "rm"
+HASH_COMMAND = "sha256sum"
+HASH_CHUNK_SIZE = 64 * 1024
+
+# Exit codes and messages of failed commands
+ERROR_EXIT_CODE = 1
+UNKNOWN_COMMAND_EXIT_CODE = 127
+INJECTED_FAILURE_EXIT_CODE = 255
+INJECTED_FAILURE_MESSAGE = "Simulated failure of command: {}"
+
+# Markers used to recognize the PHP scripts run by the LMS manager, and to
+# return their results (same as in the real scripts)
+ADD_SCRIPT_MARKER = "create_module("
+DELETE_SCRIPT_MARKER = "course_delete_module("
+SCRIPT_REQUEST_REGEX = re.compile(r"base64_decode\('([^']*)'\)")
+SCRIPT_RESULT_MARKER = "CYLMS_RESULT:"
+
+# Option of SCORM activities that contains the package file path
+PACKAGE_FILEPATH_OPTION = "packagefilepath"
+
+# Path on the LMS host of the session files written for activities of shared
+# packages (standing in for the extracted package content of the activity)
+SESSION_FILE_PATH_TEMPLATE = "/content/{}/session.js"
+
+# Header of moosh course-list output
+COURSE_LIST_HEADER = ["id", "category", "shortname", "fullname", "visible"]
+COURSE_CATEGORY = "Top"
+
+# Database schema; files copied to the LMS host are stored in a directory
+# next to the database, under their path on the host
+DATABASE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS courses (id INTEGER PRIMARY KEY AUTOINCREMENT, shortname TEXT, fullname TEXT UNIQUE);
+CREATE TABLE IF NOT EXISTS activities (id INTEGER PRIMARY KEY AUTOINCREMENT, course INTEGER, section INTEGER,
+                                       name TEXT, intro TEXT, package TEXT);
+CREATE TABLE IF NOT EXISTS drafts (id INTEGER PRIMARY KEY AUTOINCREMENT, filename TEXT);
+"""
+DATABASE_TIMEOUT = 30 # seconds
+FILES_DIR_SUFFIX = "_files"
+
+# Web service stand-in settings: files uploaded to draft areas are stored
+# under the path below, and the functions are those called by the LMS manager
+HTTP_ADDRESS = "127.0.0.1"
+DEFAULT_TOKEN = "cylms"
+DRAFT_DIR = "/draft/"
+DRAFT_PATH_TEMPLATE = "/draft/{}/{}"
+UPLOAD_FILE_FIELD = "file_1"
+WS_GET_COURSES_FUNCTION = "core_course_get_courses"
+WS_ADD_ACTIVITIES_FUNCTION = "local_cylms_add_scorm_activities"
+WS_DELETE_MODULES_FUNCTION = "core_course_delete_modules"
+ARRAY_PARAMETER_REGEX = re.compile(r"^(\w+)\[(\d+)\](?:\[(\w+)\])?$")
+
+#############################################################################
+# Class that stands in for the connection to the LMS host: it runs the moosh
+# commands and PHP scripts used by the LMS manager against a local SQLite
+# database, with configurable latency and failure injection
+#############################################################################
+class SimConnection:
+
+    # Constructor; latency is a (minimum, maximum) pair of seconds added to
+    # each command, and failure_rate the fraction of commands that fail
+    def __init__(self, database_file, latency=(0.0, 0.0), failure_rate=0.0, course_names=[]):
+        self.database_file = os.path.abspath(database_file)
+        self.files_dir = os.path.splitext(self.database_file)[0] + FILES_DIR_SUFFIX
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.lock = threading.Lock()
+        if not os.path.isdir(self.files_dir):
+            os.makedirs(self.files_dir)
+        with self.get_database() as database:
+            database.executescript(DATABASE_SCHEMA)
+            for course_name in course_names:
+                database.execute("INSERT OR IGNORE INTO courses (shortname, fullname) VALUES (?, ?)",
+                                 (course_name, course_name))
+
+    # Get a database connection, used as context manager for a transaction
+    # (connections cannot be shared between threads); text is exchanged as
+    # UTF-8 encoded strings, as in command lines
+    @contextlib.contextmanager
+    def get_database(self):
+        with self.lock:
+            database = sqlite3.connect(self.database_file, timeout=DATABASE_TIMEOUT)
+            database.text_factory = str
+            try:
+                with database:
+                    yield database
+            finally:
+                database.close()
+
+    # Get the local path of a file on the LMS host
+    def get_local_path(self, remote_path):
+        return os.path.join(self.files_dir, remote_path.lstrip("/"))
+
+    # Wait for the simulated latency, then fail if a failure is injected
+    def simulate_command(self, command):
+        if self.latency[1] > 0:
+            time.sleep(random.uniform(self.latency[0], self.latency[1]))
+        if self.failure_rate > 0 and random.random() < self.failure_rate:
+            raise subprocess.CalledProcessError(INJECTED_FAILURE_EXIT_CODE, command,
+                                                INJECTED_FAILURE_MESSAGE.format(" ".join(command)))
+
+    # Run a command and return its output, as for an SSH connection; the
+    # arguments are split as the remote shell would do it; failures are not
+    # retryable, hence whether the command is idempotent doesn't matter
+    @perf_mgmt.timed("sim.run")
+    def run(self, command, background=False, input_data=None, idempotent=False):
+        perf_mgmt.add_subprocess("sim")
+        self.simulate_command(command)
+        arguments = shlex.split(" ".join(command))
+        if arguments and os.path.basename(arguments[0]) == MOOSH_SCRIPT_NAME:
+            arguments = arguments[1:]
+            if arguments[:1] == [MOOSH_PATH_OPTION]:
+                arguments = arguments[2:]
+            output, exit_code = self.run_moosh(arguments)
+        elif arguments == [PHP_COMMAND]:
+            output, exit_code = self.run_script(input_data or "")
+        elif arguments and arguments[0] == REMOVE_COMMAND:
+            for argument in arguments[1:]:
+                if not argument.startswith("-") and os.path.isfile(self.get_local_path(argument)):
+                    os.remove(self.get_local_path(argument))
+            output, exit_code = "", 0
+        elif arguments and arguments[0] == HASH_COMMAND:
+            output, exit_code = self.run_hash(arguments[1:])
+        else:
+            output, exit_code = "{}: command not found\n".format(" ".join(arguments[:1])), UNKNOWN_COMMAND_EXIT_CODE
+        if exit_code != 0:
+            raise subprocess.CalledProcessError(exit_code, command, output)
+        return output
+
+    # Copy local files to the given path on the LMS host, as for an SSH
+    # connection (the path is a directory if several files are copied)
+    @perf_mgmt.timed("sim.copy")
+    def copy(self, local_files, remote_path):
+        perf_mgmt.add_subprocess("sim")
+        self.simulate_command(["scp"] + local_files + [remote_path])
+        target_path = self.get_local_path(remote_path)
+        try:
+            if len(local_files) > 1 or remote_path.endswith("/"):
+                if not os.path.isdir(target_path):
+                    os.makedirs(target_path)
+            elif not os.path.isdir(os.path.dirname(target_path)):
+                os.makedirs(os.path.dirname(target_path))
+            for local_file in local_files:
+                shutil.copy(local_file, target_path)
+        except (IOError, OSError) as e:
+            raise subprocess.CalledProcessError(ERROR_EXIT_CODE, ["scp"] + local_files + [remote_path], str(e) + "\n")
+        return ""
+
+    # Send a local file to the given file path on the LMS host, as for an SSH
+    # connection; return the number of bytes sent and the transfer duration
+    @perf_mgmt.timed("sim.send_file")
+    def send_file(self, local_file, remote_file):
+        perf_mgmt.add_subprocess("sim")
+        start_time = time.time()
+        self.simulate_command(["ssh", "cat", ">", remote_file])
+        target_path = self.get_local_path(remote_file)
+        try:
+            if not os.path.isdir(os.path.dirname(target_path)):
+                os.makedirs(os.path.dirname(target_path))
+            shutil.copyfile(local_file, target_path)
+        except (IOError, OSError) as e:
+            raise subprocess.CalledProcessError(ERROR_EXIT_CODE, ["ssh", "cat", ">", remote_file], str(e) + "\n")
+        return os.path.getsize(target_path), time.time() - start_time
+
+    # Nothing to close (database connections are not kept)
+    def close(self):
+        pass
+
+    # Output the SHA-256 hashes of files on the LMS host, as sha256sum does
+    # (missing files are reported as errors, after the other hashes)
+    def run_hash(self, remote_files):
+        output = ""
+        errors = ""
+        for remote_file in remote_files:
+            local_path = self.get_local_path(remote_file)
+            if not os.path.isfile(local_path):
+                errors += "{}: {}: No such file or directory\n".format(HASH_COMMAND, remote_file)
+                continue
+            file_hash = hashlib.sha256()
+            with open(local_path, "rb") as file_stream:
+                for chunk in iter(lambda: file_stream.read(HASH_CHUNK_SIZE), ""):
+                    file_hash.update(chunk)
+            output += "{}  {}\n".format(file_hash.hexdigest(), remote_file)
+        return output + errors, ERROR_EXIT_CODE if errors else 0
+
+    # Run a moosh command; return its output and exit code
+    def run_moosh(self, arguments):
+        if arguments == ["course-list"]:
+            output = StringIO.StringIO()
+            writer = csv.writer(output, quoting=csv.QUOTE_ALL, lineterminator="\n")
+            writer.writerow(COURSE_LIST_HEADER)
+            with self.get_database() as database:
+                for course_id, shortname, fullname in database.execute(
+                        "SELECT id, shortname, fullname FROM courses ORDER BY id"):
+                    writer.writerow([course_id, COURSE_CATEGORY, shortname, fullname, 1])
+            return output.getvalue(), 0
+
+        if arguments[:1] == ["activity-add"]:
+            # Options are parsed as by the patched moosh (see moosh_patch.txt)
+            options = {}
+            positional_arguments = []
+            index = 1
+            while index < len(arguments):
+                if arguments[index].startswith("--") and index + 1 < len(arguments):
+                    options[arguments[index][2:]] = arguments[index + 1]
+                    index += 2
+                else:
+                    positional_arguments.append(arguments[index])
+                    index += 1
+            if len(positional_arguments) != 2:
+                return "Usage: activity-add [options] <module> <course id>\n", ERROR_EXIT_CODE
+            module_options = {"name": options.get("name", "")}
+            for option in options.get("options", "").split(","):
+                if "=" in option:
+                    key, value = option.split("=", 1)
+                    module_options[key] = value
+            result = self.add_activity(positional_arguments[1], options.get("section", 0), module_options)
+            if "error" in result:
+                return result["error"] + "\n", ERROR_EXIT_CODE
+            return "\n{}\ncmid={}\n".format(result["id"], result["id"]), 0
+
+        if arguments[:1] == ["activity-delete"] and len(arguments) == 2:
+            result = self.delete_activity(arguments[1])
+            if "error" in result:
+                return result["error"] + "\n", ERROR_EXIT_CODE
+            return "", 0
+
+        return "Unknown moosh command: {}\n".format(" ".join(arguments)), ERROR_EXIT_CODE
+
+    # Run one of the PHP scripts of the LMS manager; return its output and exit code
+    def run_script(self, script):
+        match = SCRIPT_REQUEST_REGEX.search(script)
+        if not match:
+            return "PHP Parse error: unrecognized script\n", ERROR_EXIT_CODE
+        request = json.loads(base64.b64decode(match.group(1)))
+        results = {}
+        if ADD_SCRIPT_MARKER in script:
+            for activity in request["activities"]:
+                results[activity["session"]] = self.add_activity(request["course"], request["section"],
+                                                                 activity["options"], activity.get("sessionfile"))
+        elif DELETE_SCRIPT_MARKER in script:
+            for activity in request["activities"]:
+                shared_package = self.get_activity_package(activity["id"])
+                result = self.delete_activity(activity["id"])
+                if "error" not in result:
+                    package_file = self.get_local_path(activity["package"])
+                    if os.path.isfile(package_file):
+                        os.remove(package_file)
+                    # Shared packages are removed once no remaining activity uses them
+                    if shared_package and os.path.basename(shared_package).startswith(request["sharedprefix"]) \
+                            and not self.get_package_activities(shared_package):
+                        shared_package = self.get_local_path(request["repository"] + os.path.basename(shared_package))
+                        if os.path.isfile(shared_package):
+                            os.remove(shared_package)
+                results[activity["session"]] = result
+        else:
+            return "PHP Parse error: unrecognized script\n", ERROR_EXIT_CODE
+        return "\n{}{}\n".format(SCRIPT_RESULT_MARKER, json.dumps(results)), 0
+
+    # Add a SCORM activity to a course, with its session file if given; return
+    # a dictionary with either the id of the activity or an error message (as
+    # in the PHP scripts)
+    def add_activity(self, course_id, section_id, options, session_file=None):
+        package_file = options.get(PACKAGE_FILEPATH_OPTION, "")
+        if not os.path.isfile(self.get_local_path(package_file)):
+            return {"error": "Package file not found: {}".format(package_file)}
+        with self.get_database() as database:
+            if not str(course_id).isdigit() or \
+               not database.execute("SELECT id FROM courses WHERE id = ?", (int(course_id),)).fetchone():
+                return {"error": "Can't find data record in database table course."}
+            cursor = database.execute("INSERT INTO activities (course, section, name, intro, package) "
+                                      "VALUES (?, ?, ?, ?, ?)", (int(course_id), section_id, options.get("name"),
+                                                                 options.get("intro"), package_file))
+            activity_id = cursor.lastrowid
+        if session_file is not None:
+            session_path = self.get_local_path(SESSION_FILE_PATH_TEMPLATE.format(activity_id))
+            if not os.path.isdir(os.path.dirname(session_path)):
+                os.makedirs(os.path.dirname(session_path))
+            with open(session_path, "w") as session_stream:
+                session_stream.write(session_file)
+        return {"id": activity_id}
+
+    # Delete an activity; return a dictionary with either the id of the
+    # activity or an error message (as in the PHP scripts)
+    def delete_activity(self, activity_id):
+        if not str(activity_id).isdigit():
+            return {"error": "Invalid activity id: {}".format(activity_id)}
+        with self.get_database() as database:
+            cursor = database.execute("DELETE FROM activities WHERE id = ?", (int(activity_id),))
+            if cursor.rowcount == 0:
+                return {"error": "Can't find data record in database table course_modules."}
+        self.remove_session_file(activity_id)
+        return {"id": activity_id}
+
+    # Delete several activities at once (none of them if any doesn't exist),
+    # together with their package files (unless other activities use them, as
+    # for shared packages); return an error message, or None
+    def delete_activities(self, activity_ids):
+        package_files = set()
+        with self.get_database() as database:
+            for activity_id in activity_ids:
+                row = database.execute("SELECT package FROM activities WHERE id = ?", (activity_id,)).fetchone()
+                if not row:
+                    return "Can't find data record in database table course_modules."
+                package_files.add(row[0])
+            database.executemany("DELETE FROM activities WHERE id = ?", [(activity_id,) for activity_id in activity_ids])
+            for package_file in list(package_files):
+                if database.execute("SELECT id FROM activities WHERE package = ?", (package_file,)).fetchone():
+                    package_files.discard(package_file)
+        for activity_id in activity_ids:
+            self.remove_session_file(activity_id)
+        for package_file in package_files:
+            if package_file and os.path.isfile(self.get_local_path(package_file)):
+                os.remove(self.get_local_path(package_file))
+                if package_file.startswith(DRAFT_DIR):
+                    os.rmdir(os.path.dirname(self.get_local_path(package_file)))
+        return None
+
+    # Get the package file of an activity (None if there is no such activity)
+    def get_activity_package(self, activity_id):
+        with self.get_database() as database:
+            row = database.execute("SELECT package FROM activities WHERE id = ?", (activity_id,)).fetchone()
+        if row:
+            return row[0]
+        return None
+
+    # Get the ids of the activities that use a package file
+    def get_package_activities(self, package_file):
+        with self.get_database() as database:
+            return [row[0] for row in database.execute("SELECT id FROM activities WHERE package = ?", (package_file,))]
+
+    # Remove the session file of an activity (if any)
+    def remove_session_file(self, activity_id):
+        session_path = self.get_local_path(SESSION_FILE_PATH_TEMPLATE.format(activity_id))
+        if os.path.isfile(session_path):
+            os.remove(session_path)
+            os.rmdir(os.path.dirname(session_path))
+
+    # Store an uploaded file in a new draft area; return the draft area id
+    def add_draft(self, file_name, data):
+        file_name = os.path.basename(file_name)
+        with self.get_database() as database:
+            item_id = database.execute("INSERT INTO drafts (filename) VALUES (?)", (file_name,)).lastrowid
+        draft_file = self.get_local_path(DRAFT_PATH_TEMPLATE.format(item_id, file_name))
+        os.makedirs(os.path.dirname(draft_file))
+        with open(draft_file, "wb") as draft_stream:
+            draft_stream.write(data)
+        return item_id
+
+    # Get the path of the file in a draft area (None if there is no such area)
+    def get_draft_path(self, item_id):
+        with self.get_database() as database:
+            row = database.execute("SELECT filename FROM drafts WHERE id = ?", (item_id,)).fetchone()
+        if row:
+            return DRAFT_PATH_TEMPLATE.format(item_id, row[0])
+        return None
+
+    # Get the courses as returned by Moodle web services
+    def get_courses(self):
+        with self.get_database() as database:
+            return [{"id": course_id, "shortname": shortname, "fullname": fullname} for course_id, shortname, fullname
+                    in database.execute("SELECT id, shortname, fullname FROM courses ORDER BY id")]
+
+    # Get the number of courses and activities in the database
+    def get_counts(self):
+        with self.get_database() as database:
+            return (database.execute("SELECT COUNT(*) FROM courses").fetchone()[0],
+                    database.execute("SELECT COUNT(*) FROM activities").fetchone()[0])
+
+
+#############################################################################
+# Class that handles the web service requests of the HTTP stand-in LMS
+#############################################################################
+class SimRequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+
+    # Keep connections alive, as Moodle does, and send responses at once
+    protocol_version = "HTTP/1.1"
+    wbufsize = -1
+    disable_nagle_algorithm = True
+
+    # Process a POST request (the only method used by web service clients)
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.getheader("Content-Length", 0)))
+        path = urlparse.urlsplit(self.path).path
+        try:
+            if path.endswith(ws_mgmt.UPLOAD_PATH):
+                self.server.connection.simulate_command([path])
+                result = self.process_upload(body)
+            elif path.endswith(ws_mgmt.REST_PATH):
+                self.server.connection.simulate_command([path])
+                result = self.process_call(body)
+            else:
+                self.send_error(404)
+                return
+        except subprocess.CalledProcessError as error:
+            if path.endswith(ws_mgmt.UPLOAD_PATH):
+                result = {ws_mgmt.ERROR_FIELD: error.output}
+            else:
+                result = get_exception(error.output)
+        data = json.dumps(result)
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    # Process an upload request; return the draft file records
+    def process_upload(self, body):
+        form = cgi.FieldStorage(fp=StringIO.StringIO(body), headers=self.headers,
+                                environ={"REQUEST_METHOD": "POST", "CONTENT_TYPE": self.headers.getheader("Content-Type"),
+                                         "CONTENT_LENGTH": str(len(body))})
+        if form.getfirst("token") != self.server.token:
+            return {ws_mgmt.ERROR_FIELD: "Invalid token - token not found"}
+        if UPLOAD_FILE_FIELD not in form or not form[UPLOAD_FILE_FIELD].filename:
+            return {ws_mgmt.ERROR_FIELD: "No file was uploaded"}
+        file_field = form[UPLOAD_FILE_FIELD]
+        item_id = self.server.connection.add_draft(file_field.filename, file_field.value)
+        return [{"component": "user", "filearea": "draft", "itemid": item_id, "filepath": "/",
+                 "filename": os.path.basename(file_field.filename)}]
+
+    # Process a web service function call; return its result
+    def process_call(self, body):
+        parameters = dict(urlparse.parse_qsl(body, keep_blank_values=True))
+        if parameters.get("wstoken") != self.server.token:
+            return get_exception("Invalid token - token not found", "invalidtoken")
+        connection = self.server.connection
+        function = parameters.get("wsfunction")
+
+        if function == WS_GET_COURSES_FUNCTION:
+            return connection.get_courses()
+
+        if function == WS_ADD_ACTIVITIES_FUNCTION:
+            results = []
+            for activity in get_array_parameter(parameters, "activities"):
+                package_file = connection.get_draft_path(activity.get("draftitemid"))
+                if package_file is None:
+                    result = {"error": "Draft area {} not found".format(activity.get("draftitemid"))}
+                else:
+                    result = connection.add_activity(parameters.get("courseid"), parameters.get("section"),
+                                                     {"name": activity.get("name"), "intro": activity.get("intro"),
+                                                      PACKAGE_FILEPATH_OPTION: package_file},
+                                                     activity.get("sessionfile"))
+                result["key"] = activity.get("key")
+                results.append(result)
+            return results
+
+        if function == WS_DELETE_MODULES_FUNCTION:
+            error = connection.delete_activities([int(cmid) for cmid in get_array_parameter(parameters, "cmids")])
+            if error:
+                return get_exception(error, "invalidrecord")
+            return None
+
+        return get_exception("Can't find data record in database table external_functions.", "invalidrecord")
+
+    # Log requests as debug messages
+    def log_message(self, format, *args):
+        logging.debug("HTTP stand-in LMS: " + format % args)
+
+
+#############################################################################
+# Class that serves the web services of the stand-in LMS over HTTP (each
+# request is processed in its own thread)
+#############################################################################
+class SimHttpServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+
+    daemon_threads = True
+
+    # Constructor
+    def __init__(self, connection, token=DEFAULT_TOKEN, port=0):
+        self.connection = connection
+        self.token = token
+        BaseHTTPServer.HTTPServer.__init__(self, (HTTP_ADDRESS, port), SimRequestHandler)
+
+    # Get the URL of the stand-in LMS
+    def get_url(self):
+        return "http://{}:{}".format(*self.server_address)
+
+
+#############################################################################
+# Functions
+#############################################################################
+
+# Get a web service exception response
+def get_exception(message, error_code="simulatedfailure"):
+    return {ws_mgmt.EXCEPTION_FIELD: "moodle_exception", "errorcode": error_code, ws_mgmt.MESSAGE_FIELD: message}
+
+# Get an array parameter of a web service call from the parameters encoded
+# in the "name[index]" or "name[index][key]" format
+def get_array_parameter(parameters, name):
+    items = {}
+    for parameter, value in parameters.items():
+        match = ARRAY_PARAMETER_REGEX.match(parameter)
+        if match and match.group(1) == name:
+            index = int(match.group(2))
+            if match.group(3):
+                items.setdefault(index, {})[match.group(3)] = value
+            else:
+                items[index] = value
+    return [items[index] for index in sorted(items)]
+
+# Start serving the web services of the stand-in LMS in the background;
+# return the server
+def start_http_server(connection, token=DEFAULT_TOKEN, port=0):
+    http_server = SimHttpServer(connection, token, port)
+    server_thread = threading.Thread(target=http_server.serve_forever)
+    server_thread.daemon = True
+    server_thread.start()
+    return http_server
+
+# Parse a latency setting of the form "SECONDS" or "MINIMUM-MAXIMUM" (in
+# seconds); return a (minimum, maximum) pair
+def parse_latency(setting):
+    if not setting:
+        return (0.0, 0.0)
+    values = [float(value) for value in setting.split("-", 1)]
+    return (values[0], values[-1])
+
+# Connections indexed by database file, so that each database is only
+# initialized once per process
+connections = {}
+connections_lock = threading.Lock()
+
+# Get the connection to the stand-in LMS with the given database (created
+# if needed)
+def get_connection(database_file, latency=(0.0, 0.0), failure_rate=0.0, course_names=[]):
+    database_file = os.path.abspath(database_file)
+    with connections_lock:
+        if database_file not in connections:
+            database_dir = os.path.dirname(database_file)
+            if not os.path.isdir(database_dir):
+                os.makedirs(database_dir)
+            connections[database_file] = SimConnection(database_file, latency, failure_rate, course_names)
+        return connections[database_file]
+
+
+#############################################################################
+# Main program (used for testing purposes)
+#############################################################################
+def main(args):
+
+    # Configure logging level for running the tests below
+    logging.basicConfig(level=logging.INFO,
+                        format='* %(levelname)s: %(filename)s: %(message)s')
+
+    # Run a few commands against the database given as argument, or serve
+    # its web services on the given port
+    if not args:
+        logging.error("Usage: sim_mgmt.py <DATABASE> [PORT]")
+        sys.exit(1)
+    connection = get_connection(args[0], course_names=["CyTrONE Training"])
+    if len(args) >= 2:
+        http_server = SimHttpServer(connection, DEFAULT_TOKEN, int(args[1]))
+        logging.info("Serve web services at '{}' with token '{}'.".format(http_server.get_url(), DEFAULT_TOKEN))
+        try:
+            http_server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        return
+    try:
+        logging.info("Course list:\n{}".format(connection.run(["/root/moosh/moosh.php", "course-list"]).rstrip()))
+        logging.info("Remove missing file: '{}'".format(connection.run(["rm", "-f /tmp/missing.zip"])))
+        connection.run(["/root/moosh/moosh.php", "activity-delete", "0"])
+    except subprocess.CalledProcessError as error:
+        logging.info("Command failed as expected\n  Error message: {}".format(error.output.rstrip()))
+    logging.info("Database contains {} course(s) and {} activity(ies).".format(*connection.get_counts()))
+
+
+#############################################################################
+# Run main program
+#############################################################################
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,367 @@
+#############################################################################
+# Server functionality for CyLMS (long-running daemon with a local API)
+#############################################################################
+
+# External imports
+import json
+import logging
+import os
+import socket
+import SocketServer
+import sys
+import threading
+import time
+
+# Internal imports
+import cfg_mgmt
+import cnt2lms
+import job_mgmt
+import lms_mgmt
+import perf_mgmt
+import vnc_mgmt
+from storyboard import Storyboard
+
+#############################################################################
+# Constants
+#############################################################################
+
+# Request-related constants; requests and responses are JSON objects,
+# one per line, exchanged over a Unix domain socket
+KEY_ACTION = "action"
+KEY_FILE = "file"
+KEY_SESSION = "session"
+KEY_ACTIVITY_ID = "activity_id"
+KEY_STATUS = "status"
+KEY_MESSAGE = "message"
+KEY_ASYNC = "async"
+KEY_JOB_ID = "job_id"
+KEY_JOB_IDS = "job_ids"
+KEY_JOB = "job"
+KEY_JOBS = "jobs"
+KEY_TIMEOUT = "timeout"
+KEY_METRICS = "metrics"
+STATUS_OK = "ok"
+STATUS_ERROR = "error"
+
+## Supported actions
+ACTION_PING = "ping"
+ACTION_CONVERT = "convert"
+ACTION_ADD = "add"
+ACTION_REMOVE = "remove"
+ACTION_VNC_SETUP = "vnc-setup"
+ACTION_JOB_STATUS = "job-status"
+ACTION_JOB_WAIT = "job-wait"
+ACTION_METRICS = "metrics"
+
+## Actions that can be run asynchronously as jobs (when the request
+## contains "async": true); the response then contains the job id
+ASYNC_ACTIONS = [ACTION_ADD, ACTION_REMOVE, ACTION_VNC_SETUP]
+
+# Default value of session id for convert requests
+SESSION_ID_DEFAULT = "N"
+
+# Name format of the SCORM package converted for a session (content file name
+# and session id), so that concurrent requests for different sessions never
+# use each other's package, which contains the range access information
+SESSION_PACKAGE_NAME_FORMAT = "{}-{}"
+
+# Maximum size of a request line in bytes
+MAX_REQUEST_SIZE = 65536
+
+#############################################################################
+# Class that handles the requests of one client connection
+#############################################################################
+class RequestHandler(SocketServer.StreamRequestHandler):
+
+    # Process requests until the client closes the connection
+    def handle(self):
+        while True:
+            request_line = self.rfile.readline(MAX_REQUEST_SIZE)
+            if not request_line:
+                break
+            if not request_line.strip():
+                continue
+            start_time = time.time()
+            try:
+                request = json.loads(request_line)
+                if not isinstance(request, dict):
+                    raise ValueError("Request is not a JSON object")
+                response = self.server.process_request_data(request)
+            except ValueError as e:
+                response = {KEY_STATUS: STATUS_ERROR, KEY_MESSAGE: "Invalid request: {}".format(str(e))}
+            logging.debug("Processed request in {:.3f} s: {}".format(time.time() - start_time, request_line.rstrip()))
+            self.wfile.write(json.dumps(response) + "\n")
+            self.wfile.flush()
+
+
+#############################################################################
+# Class that implements the CyLMS server; state such as the parsed
+# configuration, compiled templates, SSH connections and course ids is
+# kept across requests
+#############################################################################
+class CylmsServer(SocketServer.ThreadingMixIn, SocketServer.UnixStreamServer):
+
+    daemon_threads = True
+
+    # Constructor
+    def __init__(self, socket_path, config_file, program_path):
+        self.socket_path = socket_path
+        self.config_file = config_file
+        self.program_path = program_path
+
+        # Check the number of concurrent jobs before the socket is created
+        cfg_manager = cfg_mgmt.get_cfg_manager(config_file)
+        concurrency = cfg_manager.get_setting(Storyboard.CONFIG_LMS_CONCURRENCY)
+        if concurrency is None:
+            concurrency = job_mgmt.DEFAULT_CONCURRENCY
+        elif not concurrency.strip().isdigit() or int(concurrency) < 1:
+            logging.error("Setting '{}' must be a positive integer (not '{}') => abort execution."
+                          .format(Storyboard.CONFIG_LMS_CONCURRENCY, concurrency))
+            sys.exit(1)
+
+        # Conversions write files next to the content files, hence they are
+        # serialized; LMS and VNC operations can run concurrently
+        self.conversion_lock = threading.Lock()
+
+        # Remove a stale socket file left by a previous server
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        SocketServer.UnixStreamServer.__init__(self, socket_path, RequestHandler)
+
+        # Warm up the state used by requests
+        self.lms_manager = lms_mgmt.LmsManager(config_file)
+
+        # Create the job manager that runs asynchronous requests
+        self.job_manager = job_mgmt.JobManager(int(concurrency))
+
+    # Determine whether VNC is enabled from the (possibly modified) configuration
+    def get_enable_vnc(self):
+        return bool(cfg_mgmt.get_cfg_manager(self.config_file).get_setting(Storyboard.CONFIG_ENABLE_VNC))
+
+    # Process a request and return the response (both are dictionaries); when
+    # the request is run as a job, progress records the steps that succeeded,
+    # so that they are not run again if the job is retried
+    def process_request_data(self, request, progress=None):
+        action = request.get(KEY_ACTION)
+        if request.get(KEY_ASYNC) and action in ASYNC_ACTIONS:
+            # Invalid requests are rejected right away, as retrying them is useless
+            if not request.get(KEY_SESSION):
+                return get_error_response("Session id is undefined")
+            request = dict(request)
+            del request[KEY_ASYNC]
+            job_name = "{} session #{}".format(action, request.get(KEY_SESSION))
+            job_id = self.job_manager.submit(job_name, self.run_job_request, request, {})
+            return {KEY_STATUS: STATUS_OK, KEY_JOB_ID: job_id}
+        try:
+            if action == ACTION_PING:
+                return {KEY_STATUS: STATUS_OK}
+            elif action == ACTION_CONVERT:
+                return self.convert(request.get(KEY_FILE), str(request.get(KEY_SESSION, SESSION_ID_DEFAULT)))
+            elif action == ACTION_ADD:
+                return self.add(request.get(KEY_FILE), str(request.get(KEY_SESSION, "")), progress)
+            elif action == ACTION_REMOVE:
+                return self.remove(str(request.get(KEY_SESSION, "")), str(request.get(KEY_ACTIVITY_ID, "")), progress)
+            elif action == ACTION_VNC_SETUP:
+                return self.vnc_setup(str(request.get(KEY_SESSION, "")), progress)
+            elif action == ACTION_JOB_STATUS:
+                if not is_integer(request.get(KEY_JOB_ID)):
+                    return get_error_response("Job id must be an integer")
+                job_info = self.job_manager.get_status(request.get(KEY_JOB_ID))
+                if not job_info:
+                    return get_error_response("Unknown job id: {}".format(request.get(KEY_JOB_ID)))
+                return {KEY_STATUS: STATUS_OK, KEY_JOB: job_info}
+            elif action == ACTION_JOB_WAIT:
+                job_ids = request.get(KEY_JOB_IDS)
+                if job_ids is not None and (not isinstance(job_ids, list)
+                                            or not all([is_integer(job_id) for job_id in job_ids])):
+                    return get_error_response("Job ids must be a list of integers")
+                timeout = request.get(KEY_TIMEOUT)
+                if timeout is not None and (isinstance(timeout, bool) or not isinstance(timeout, (int, long, float))
+                                            or timeout < 0):
+                    return get_error_response("Timeout must be a non-negative number")
+                jobs = self.job_manager.wait(job_ids, timeout)
+                return {KEY_STATUS: STATUS_OK, KEY_JOBS: [job.get_info() for job in jobs]}
+            elif action == ACTION_METRICS:
+                if not perf_mgmt.enabled:
+                    return get_error_response("Instrumentation is not enabled (use the 'timings' options)")
+                return {KEY_STATUS: STATUS_OK, KEY_METRICS: perf_mgmt.registry.get_metrics()}
+            else:
+                return get_error_response("Unknown action: {}".format(action))
+        # Managers abort on fatal configuration errors, which must not stop the server
+        except SystemExit:
+            return get_error_response("Fatal error when processing action '{}'".format(action))
+        # Unexpected errors (e.g., due to invalid request values) must not stop
+        # the handler either, and the client gets a response
+        except Exception as e:
+            logging.exception("Unexpected error when processing request {}".format(json.dumps(request)))
+            return get_error_response("Unexpected error when processing action '{}': {}".format(action, str(e)))
+
+    # Process a request as part of a job; the response is the job result, and
+    # an error response makes the job fail (it is retried only if a transient
+    # error occurred, see job_mgmt.py)
+    def run_job_request(self, request, progress):
+        response = self.process_request_data(request, progress)
+        if response[KEY_STATUS] != STATUS_OK:
+            raise RuntimeError(response[KEY_MESSAGE])
+        return response
+
+    # Convert a training content file to a SCORM package for a session
+    def convert(self, yaml_file, session_id):
+        if not yaml_file:
+            return get_error_response("Content file name is undefined")
+        yaml_file = os.path.abspath(yaml_file)
+        logging.info("Convert training content file '{}' to SCORM package.".format(yaml_file))
+        scorm_file_base = SESSION_PACKAGE_NAME_FORMAT.format(yaml_file, session_id)
+        with self.conversion_lock:
+            scorm_file, training_title = cnt2lms.yaml2scorm(yaml_file, scorm_file_base, self.program_path,
+                                                            self.get_enable_vnc(), session_id, self.config_file)
+        if not scorm_file:
+            return get_error_response("Failed to convert training content file '{}'".format(yaml_file))
+        return {KEY_STATUS: STATUS_OK, "package": scorm_file, "title": training_title}
+
+    # Convert a training content file and add the resulting package to the LMS;
+    # steps recorded in progress as done already are skipped
+    def add(self, yaml_file, session_id, progress=None):
+        if progress is None:
+            progress = {}
+        if not session_id:
+            return get_error_response("Session id is undefined")
+        if "package" not in progress:
+            response = self.convert(yaml_file, session_id)
+            if response[KEY_STATUS] != STATUS_OK:
+                return response
+            progress["package"] = response["package"]
+            progress["title"] = response["title"]
+        target_file = Storyboard.LMS_PACKAGE_FILE_FORMAT.format(session_id)
+        if not progress.get("copied"):
+            if not self.lms_manager.copy_package(progress["package"], target_file):
+                return get_error_response("SCORM package copy to LMS repository failed")
+            progress["copied"] = True
+        if KEY_ACTIVITY_ID not in progress:
+            activity_name = Storyboard.ACTIVITY_NAME_FORMAT.format(session_id, progress["title"].encode('utf-8'))
+            activity_description = Storyboard.ACTIVITY_DESCRIPTION_FORMAT.format(time.strftime("%Y-%m-%d %H:%M:%S"))
+            activity_id = self.lms_manager.add_activity(activity_name, activity_description, target_file)
+            if not activity_id:
+                return get_error_response("Failed to add converted SCORM package '{}' to LMS".format(progress["package"]))
+            progress[KEY_ACTIVITY_ID] = activity_id
+        return {KEY_STATUS: STATUS_OK, "package": progress["package"], "title": progress["title"],
+                KEY_ACTIVITY_ID: progress[KEY_ACTIVITY_ID]}
+
+    # Remove the activity of a session from the LMS, and stop its noVNC servers;
+    # steps recorded in progress as done already are skipped
+    def remove(self, session_id, activity_id, progress=None):
+        if progress is None:
+            progress = {}
+        if not session_id or not activity_id:
+            return get_error_response("Session id and activity id are required")
+        logging.info("Remove session #{} (activity with id '{}') from LMS.".format(session_id, activity_id))
+        if not progress.get("deleted"):
+            package_file = Storyboard.LMS_PACKAGE_FILE_FORMAT.format(session_id)
+            if not self.lms_manager.delete_activity(activity_id, package_file):
+                return get_error_response("Failed to remove activity with id '{}' from LMS".format(activity_id))
+            progress["deleted"] = True
+        if self.get_enable_vnc():
+            vnc_manager = vnc_mgmt.VncManager(self.config_file)
+            vnc_ports = vnc_manager.get_session_ports(session_id)
+            if not vnc_ports:
+                return get_error_response("Failed to get cyber range info")
+            if not vnc_manager.stop_novnc_servers(session_id, vnc_ports):
+                return get_error_response("Failed to stop VNC servers")
+        return {KEY_STATUS: STATUS_OK}
+
+    # Set up VNC access to the cyber range of a session; steps recorded in
+    # progress as done already are skipped
+    def vnc_setup(self, session_id, progress=None):
+        if progress is None:
+            progress = {}
+        if not session_id:
+            return get_error_response("Session id is undefined")
+        if not self.get_enable_vnc():
+            logging.info("VNC setup not enabled in the config file => ignore request")
+            return {KEY_STATUS: STATUS_OK}
+        logging.info("Set up VNC server to access the cyber range for session #{}.".format(session_id))
+        vnc_manager = vnc_mgmt.VncManager(self.config_file)
+        if "vnc_ports" not in progress:
+            vnc_ports = vnc_manager.get_range_info(session_id)
+            if not vnc_ports:
+                return get_error_response("Failed to get cyber range info")
+            progress["vnc_ports"] = vnc_ports
+        if not progress.get("access_file_created"):
+            if not vnc_manager.create_access_file(session_id, progress["vnc_ports"]):
+                return get_error_response("Failed to create range access file")
+            progress["access_file_created"] = True
+        if not vnc_manager.start_novnc_servers(progress["vnc_ports"], session_id):
+            return get_error_response("Failed to start VNC servers")
+        return {KEY_STATUS: STATUS_OK}
+
+    # Run the server until interrupted, then remove the socket file
+    def run(self):
+        logging.info("Serve requests on socket '{}'.".format(self.socket_path))
+        try:
+            self.serve_forever()
+        except KeyboardInterrupt:
+            logging.info("Server interrupted => stop serving requests.")
+        finally:
+            self.server_close()
+            if os.path.exists(self.socket_path):
+                os.remove(self.socket_path)
+
+
+#############################################################################
+# Functions
+#############################################################################
+
+# Build an error response with the given message
+def get_error_response(message):
+    logging.error(message)
+    return {KEY_STATUS: STATUS_ERROR, KEY_MESSAGE: message}
+
+# Check whether a request value is an integer (JSON booleans are not)
+def is_integer(value):
+    return isinstance(value, (int, long)) and not isinstance(value, bool)
+
+# Send a request (a dictionary) to the server listening on the given socket,
+# and return its response
+def send_request(socket_path, request):
+    client_socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        client_socket.connect(socket_path)
+        client_stream = client_socket.makefile("rw")
+        client_stream.write(json.dumps(request) + "\n")
+        client_stream.flush()
+        return json.loads(client_stream.readline())
+    finally:
+        client_socket.close()
+
+
+#############################################################################
+# Main program (used for testing purposes)
+#############################################################################
+def main(args):
+
+    # Configure logging level for running the tests below
+    logging.basicConfig(level=logging.INFO,
+                        format='* %(levelname)s: %(filename)s: %(message)s')
+
+    # Send the request given as argument (or a ping request) to the server
+    if not args:
+        logging.error("Usage: srv_mgmt.py <SOCKET> [REQUEST]")
+        sys.exit(1)
+    try:
+        if len(args) >= 2:
+            request = json.loads(args[1])
+        else:
+            request = {KEY_ACTION: ACTION_PING}
+        start_time = time.time()
+        response = send_request(args[0], request)
+        logging.info("Response received in {:.3f} s: {}".format(time.time() - start_time, json.dumps(response)))
+    except (socket.error, ValueError) as e:
+        logging.error("Request failed: {}".format(str(e)))
+        sys.exit(1)
+
+
+#############################################################################
+# Run main program
+#############################################################################
+if __name__ == "__main__":
+    main(sys.argv[1:])
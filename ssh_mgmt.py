@@ -0,0 +1,305 @@
+#############################################################################
+# SSH connection management for CyLMS
+#############################################################################
+
+# External imports
+import atexit
+import distutils.spawn
+import errno
+import logging
+import os
+import pipes
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+# Internal imports
+import perf_mgmt
+
+#############################################################################
+# Constants
+#############################################################################
+
+## SSH/SCP connection options (need to be separated because of limitations on how
+## options are passed to subprocess.check_output() calls)
+SSH_HOSTS_NULL = "-o UserKnownHostsFile=/dev/null"
+SSH_STRICT_NO = "-o StrictHostKeyChecking=no"
+SSH_BGND_EXEC = "-f"
+### Exit code of ssh when an error occurred in ssh itself (e.g., connection failure)
+SSH_ERROR_EXIT_CODE = 255
+### Marker printed by the remote shell before running a command that cannot
+### safely be run twice, so that ssh failures can be told apart depending on
+### whether the command was started or not
+COMMAND_STARTED_MARKER = "CYLMS_COMMAND_STARTED"
+COMMAND_STARTED_ECHO = "echo {};".format(COMMAND_STARTED_MARKER)
+
+## Connection multiplexing options: a master connection is opened once per host
+## and shared by all subsequent ssh/scp commands via a control socket; the master
+## exits when the program ends, or after being idle for the persist time (seconds)
+CONTROL_DIR_PREFIX = "cylms-ssh-"
+CONTROL_PATH_TEMPLATE = "-o ControlPath={}/%r@%h:%p"
+CONTROL_MASTER_YES = "-o ControlMaster=yes"
+CONTROL_MASTER_NO = "-o ControlMaster=no"
+CONTROL_PERSIST_TEMPLATE = "-o ControlPersist={}"
+CONTROL_PERSIST_TIME = 600
+CONTROL_EXIT = ["-O", "exit"]
+MASTER_NO_COMMAND = "-N"
+
+## File transfer options: files are streamed to a temporary file that replaces
+## the target once complete; rsync (if available on both sides) only sends the
+## differences with the target, or with a file with a similar name if the target
+## doesn't exist yet
+SEND_CHUNK_SIZE = 64 * 1024
+SEND_TEMP_SUFFIX = ".cylms-part"
+SEND_COMMAND_TEMPLATE = "cat > {0} && mv -f {0} {1}"
+RSYNC_COMMAND = "rsync"
+RSYNC_OPTIONS = ["--copy-links", "--fuzzy", "--stats"]
+RSYNC_BYTES_SENT_REGEX = re.compile(r"Total bytes sent:\s*([\d,.]+)")
+### Exit code of rsync when the remote rsync cannot be started
+RSYNC_PROTOCOL_ERROR = 12
+
+#############################################################################
+# Class that represents a multiplexed SSH connection to a host
+#############################################################################
+class SshConnection:
+
+    # Constructor
+    def __init__(self, host):
+        self.host = host
+        self.control_dir = None
+        self.master_started = False
+        self.lock = threading.Lock()
+        # Whether transfers can use rsync (until it fails to start on the host)
+        self.rsync_supported = distutils.spawn.find_executable(RSYNC_COMMAND) is not None
+
+    # Get the options common to all ssh/scp commands
+    def get_options(self):
+        options = [SSH_HOSTS_NULL, SSH_STRICT_NO]
+        if self.control_dir:
+            options.append(CONTROL_PATH_TEMPLATE.format(self.control_dir))
+        return options
+
+    # Start the master connection (if not started already); if the master cannot
+    # be started, commands will still work using individual connections
+    def start_master(self):
+        with self.lock:
+            if self.master_started:
+                return
+            self.master_started = True
+            self.control_dir = tempfile.mkdtemp(prefix=CONTROL_DIR_PREFIX)
+            logging.debug("Start SSH master connection to '{}'.".format(self.host))
+            # The master is sent to background after authentication, and its
+            # output is discarded so that it doesn't keep our pipes open
+            perf_mgmt.add_subprocess("ssh")
+            with open(os.devnull, "w") as devnull:
+                return_code = subprocess.call(
+                    ["ssh"] + self.get_options()
+                    + [CONTROL_MASTER_YES, CONTROL_PERSIST_TEMPLATE.format(CONTROL_PERSIST_TIME),
+                       MASTER_NO_COMMAND, SSH_BGND_EXEC, self.host],
+                    stdin=devnull, stdout=devnull, stderr=devnull)
+            if return_code != 0:
+                logging.warning("Failed to start SSH master connection to '{}' => use individual connections."
+                                .format(self.host))
+
+    # Run a command on the host and return its output; the command is given
+    # as a list of arguments; an exception is raised if the command fails (see
+    # get_error() regarding whether the command can be run again); idempotent
+    # commands are those that can safely be run several times
+    @perf_mgmt.timed("ssh.run")
+    def run(self, command, background=False, input_data=None, idempotent=False):
+        self.start_master()
+        ssh_command = ["ssh"] + self.get_options() + [CONTROL_MASTER_NO]
+        if background:
+            ssh_command.append(SSH_BGND_EXEC)
+        ssh_command.append(self.host)
+        check_started = not idempotent and not background
+        if check_started:
+            ssh_command.append(COMMAND_STARTED_ECHO)
+        ssh_command.extend(command)
+        perf_mgmt.add_subprocess("ssh")
+        if input_data is None:
+            try:
+                output = subprocess.check_output(ssh_command, stderr=subprocess.STDOUT)
+                return_code = 0
+            except subprocess.CalledProcessError as error:
+                output = error.output
+                return_code = error.returncode
+        else:
+            # Commands that read their input (e.g., scripts) get it via stdin
+            perf_mgmt.add_bytes("ssh.input", len(input_data))
+            ssh_process = subprocess.Popen(ssh_command, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                           stderr=subprocess.STDOUT)
+            output = ssh_process.communicate(input_data)[0]
+            return_code = ssh_process.returncode
+        perf_mgmt.add_bytes("ssh.output", len(output))
+
+        # If ssh itself failed, the command can be run again if it was not started
+        started = not check_started or COMMAND_STARTED_MARKER in output
+        if check_started:
+            output = output.replace(COMMAND_STARTED_MARKER + "\n", "", 1)
+        if return_code != 0:
+            raise get_error(return_code, ssh_command, output,
+                            return_code == SSH_ERROR_EXIT_CODE and (idempotent or not started))
+        return output
+
+    # Copy local files to the given path on the host; an exception
+    # is raised if the copy fails
+    @perf_mgmt.timed("ssh.copy")
+    def copy(self, local_files, remote_path):
+        self.start_master()
+        scp_command = ["scp", "-q"] + self.get_options() + [CONTROL_MASTER_NO]
+        scp_command.extend(local_files)
+        scp_command.append("{}:{}".format(self.host, remote_path))
+        perf_mgmt.add_subprocess("scp")
+        if perf_mgmt.enabled:
+            perf_mgmt.add_bytes("ssh.copy", sum([os.path.getsize(local_file) for local_file in local_files]))
+        try:
+            return subprocess.check_output(scp_command, stderr=subprocess.STDOUT)
+        except subprocess.CalledProcessError as error:
+            raise get_error(error.returncode, error.cmd, error.output, True)
+
+    # Stream a local file to the given path on the host; return the number
+    # of bytes sent and the duration of the transfer; an exception is raised
+    # if the transfer fails
+    @perf_mgmt.timed("ssh.send_file")
+    def send_file(self, local_file, remote_file):
+        self.start_master()
+        remote_command = SEND_COMMAND_TEMPLATE.format(pipes.quote(remote_file + SEND_TEMP_SUFFIX),
+                                                      pipes.quote(remote_file))
+        ssh_command = ["ssh"] + self.get_options() + [CONTROL_MASTER_NO, self.host, remote_command]
+        start_time = time.time()
+        byte_count = 0
+        with open(local_file, "rb") as file_stream:
+            perf_mgmt.add_subprocess("ssh")
+            ssh_process = subprocess.Popen(ssh_command, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                           stderr=subprocess.STDOUT)
+            try:
+                while True:
+                    chunk = file_stream.read(SEND_CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    ssh_process.stdin.write(chunk)
+                    byte_count += len(chunk)
+                ssh_process.stdin.close()
+            except IOError as e:
+                # A broken pipe means that the remote command failed (see below)
+                if e.errno != errno.EPIPE:
+                    ssh_process.kill()
+                    ssh_process.wait()
+                    raise
+        output = ssh_process.stdout.read()
+        ssh_process.wait()
+        perf_mgmt.add_bytes("ssh.send_file", byte_count)
+        if ssh_process.returncode != 0:
+            raise get_error(ssh_process.returncode, ssh_command, output, True)
+        return byte_count, time.time() - start_time
+
+    # Synchronize local files to a directory on the host with rsync; return
+    # the number of bytes sent and the duration of the transfer; an exception
+    # is raised if the transfer fails
+    @perf_mgmt.timed("ssh.sync_files")
+    def sync_files(self, local_files, remote_dir):
+        self.start_master()
+        ssh_shell = " ".join(["ssh"] + self.get_options() + [CONTROL_MASTER_NO])
+        rsync_command = [RSYNC_COMMAND] + RSYNC_OPTIONS + ["-e", ssh_shell] + local_files \
+                        + ["{}:{}".format(self.host, remote_dir)]
+        start_time = time.time()
+        perf_mgmt.add_subprocess("rsync")
+        try:
+            output = subprocess.check_output(rsync_command, stderr=subprocess.STDOUT)
+        except subprocess.CalledProcessError as error:
+            if error.returncode == RSYNC_PROTOCOL_ERROR:
+                logging.warning("Cannot use rsync with '{}' => use plain transfers.".format(self.host))
+                self.rsync_supported = False
+                raise
+            raise get_error(error.returncode, error.cmd, error.output, True)
+        match = RSYNC_BYTES_SENT_REGEX.search(output)
+        if match:
+            byte_count = int(re.sub(r"[^\d]", "", match.group(1)))
+        else:
+            byte_count = sum([os.path.getsize(local_file) for local_file in local_files])
+        perf_mgmt.add_bytes("ssh.sync_files", byte_count)
+        return byte_count, time.time() - start_time
+
+    # Close the master connection (if any)
+    def close(self):
+        with self.lock:
+            if self.control_dir:
+                logging.debug("Stop SSH master connection to '{}'.".format(self.host))
+                perf_mgmt.add_subprocess("ssh")
+                with open(os.devnull, "w") as devnull:
+                    subprocess.call(["ssh"] + self.get_options() + CONTROL_EXIT + [self.host],
+                                    stdin=devnull, stdout=devnull, stderr=devnull)
+                shutil.rmtree(self.control_dir, ignore_errors=True)
+                self.control_dir = None
+            self.master_started = False
+
+
+#############################################################################
+# Functions
+#############################################################################
+
+# Get the exception raised when a command fails; its 'retryable' attribute
+# tells whether the command can safely be run again, and may then succeed,
+# that is, if it is a file transfer, if ssh itself failed when running an
+# idempotent command, or if ssh failed before the command was started (the
+# callers decide whether to retry, see job_mgmt.py)
+def get_error(return_code, command, output, retryable):
+    error = subprocess.CalledProcessError(return_code, command, output)
+    error.retryable = retryable
+    return error
+
+# Connections indexed by host, so that there is at most one master
+# connection per host for the lifetime of the process
+connections = {}
+connections_lock = threading.Lock()
+
+# Get the connection to the given host (created if needed)
+def get_connection(host):
+    with connections_lock:
+        if host not in connections:
+            connections[host] = SshConnection(host)
+        return connections[host]
+
+# Close all the connections; called automatically at program exit
+def close_connections():
+    with connections_lock:
+        for connection in connections.values():
+            connection.close()
+        connections.clear()
+
+atexit.register(close_connections)
+
+
+#############################################################################
+# Main program (used for testing purposes)
+#############################################################################
+def main(args):
+
+    # Configure logging level for running the tests below
+    logging.basicConfig(level=logging.DEBUG,
+                        format='* %(levelname)s: %(filename)s: %(message)s')
+
+    # Run a few commands on the host given as argument via the same connection
+    if not args:
+        logging.error("Usage: ssh_mgmt.py <HOST>")
+        sys.exit(1)
+    connection = get_connection(args[0])
+    for index in range(3):
+        try:
+            output = connection.run(["echo", "Command #{}".format(index + 1)])
+            logging.info("Command output: {}".format(output.rstrip()))
+        except subprocess.CalledProcessError as error:
+            logging.error("Command failed\n  Error message: {}".format(error.output.rstrip()))
+            sys.exit(1)
+
+
+#############################################################################
+# Run main program
+#############################################################################
+if __name__ == "__main__":
+    main(sys.argv[1:])
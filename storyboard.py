@@ -15,6 +15,15 @@ class Storyboard:
     CONFIG_SECTION_ID = "section_id"
     CONFIG_ENABLE_VNC = "enable_vnc"
     CONFIG_RANGE_DIRECTORY = "range_directory"
+    CONFIG_COURSE_CACHE_TTL = "course_cache_ttl"
+    CONFIG_LMS_CONCURRENCY = "lms_concurrency"
+    CONFIG_VNC_PROXY = "vnc_proxy"
+    CONFIG_LMS_BACKEND = "lms_backend"
+    CONFIG_LMS_DATABASE = "lms_database"
+    CONFIG_LMS_LATENCY = "lms_latency"
+    CONFIG_LMS_FAILURE_RATE = "lms_failure_rate"
+    CONFIG_LMS_URL = "lms_url"
+    CONFIG_LMS_TOKEN = "lms_token"
 
     # Content description file constants
     ## Top section about training
@@ -58,5 +67,17 @@ class Storyboard:
     TAG_QUESTION_OBJECTIVE_ID = "questionObjectiveId"
 
     # Other constants
+    ## Activity name and description formats, and name format of package files
+    ## stored in the LMS repository (the session id is used as argument)
+    ACTIVITY_NAME_FORMAT = "Activity #{}: {}"
+    ACTIVITY_DESCRIPTION_FORMAT = "Added on: {}"
+    LMS_PACKAGE_FILE_FORMAT = "training_content{}.zip"
+    ## Name format of shared packages (used by all the sessions of a training)
+    ## stored in the LMS repository (the package content hash is used as argument),
+    ## and file that contains the per-session parameters of a shared package
+    LMS_SHARED_PACKAGE_FILE_FORMAT = "training_shared_{}.zip"
+    SESSION_FILE = "shared/session.js"
     ACCESS_RANGE_BASE_PORT = 3000
     VNC_BASE_PORT = 5900
+    ## Port of the single noVNC proxy used for all trainees (if enabled)
+    VNC_PROXY_PORT = 6080
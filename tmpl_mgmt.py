@@ -0,0 +1,155 @@
+#############################################################################
+# SCORM template management for CyLMS
+#############################################################################
+
+# External imports
+import io
+import logging
+import os
+import re
+import zipfile
+
+# Internal imports
+from storyboard import Storyboard
+
+#############################################################################
+# Constants
+#############################################################################
+
+# Template files that contain tags to be replaced with training content
+QUESTION_TEMPLATE_FILE = "Playing/questions.js"
+START_TEMPLATE_FILE = "shared/assessmenttemplate.html"
+MANIFEST_TEMPLATE_FILE = "imsmanifest.xml"
+
+# Tags that are recognized in each of the template files above
+QUESTION_TAGS = [Storyboard.TAG_QUESTION_ID, Storyboard.TAG_QUESTION_BODY, Storyboard.TAG_QUESTION_TYPE,
+                 Storyboard.TAG_QUESTION_ANSWER, Storyboard.TAG_QUESTION_CORRECT_ANSWER,
+                 Storyboard.TAG_QUESTION_OBJECTIVE_ID]
+START_TAGS = [Storyboard.TAG_SHOW_RANGE_BUTTON, Storyboard.TAG_TRAINING_LEVEL, Storyboard.TAG_TRAINING_TITLE,
+              Storyboard.TAG_TRAINING_OVERVIEW, Storyboard.TAG_PORT_FILENAME]
+MANIFEST_TAGS = [Storyboard.TAG_TRAINING_ID]
+
+# Hint tags are numbered (e.g., "questionHint1"), hence they are matched separately
+HINT_TAG_PATTERN = "{}([0-9]+)".format(Storyboard.TAG_QUESTION_HINT)
+
+#############################################################################
+# Class that represents a template file compiled into literal segments
+# and placeholder slots
+#############################################################################
+class CompiledTemplate:
+
+    # Constructor
+    def __init__(self, content, tags, use_hints=False):
+
+        # Build a regular expression that matches all tags; longer tags are
+        # tried first so that a tag which is a prefix of another one is not
+        # matched by mistake
+        patterns = [re.escape(tag) for tag in sorted(tags, key=len, reverse=True)]
+        if use_hints:
+            patterns.insert(0, HINT_TAG_PATTERN)
+        tag_regex = re.compile("|".join(patterns))
+
+        # Split content into literal segments (strings) and slots (tuples
+        # containing the tag and, for hints, the hint index)
+        self.segments = []
+        position = 0
+        for match in tag_regex.finditer(content):
+            if match.start() > position:
+                self.segments.append(content[position:match.start()])
+            if use_hints and match.group(0).startswith(Storyboard.TAG_QUESTION_HINT):
+                self.segments.append((Storyboard.TAG_QUESTION_HINT, int(match.group(1))))
+            else:
+                self.segments.append((match.group(0), None))
+            position = match.end()
+        if position < len(content):
+            self.segments.append(content[position:])
+
+        logging.debug("Compiled template with {} segment(s).".format(len(self.segments)))
+
+    # Render the template by appending its segments to the given buffer (a list);
+    # tag values must be encoded strings; hint slots that have no corresponding
+    # hint are rendered as empty strings
+    def render_into(self, buffer, values, hints=None):
+        for segment in self.segments:
+            if type(segment) != tuple:
+                buffer.append(segment)
+            elif segment[1] is None:
+                buffer.append(values[segment[0]])
+            elif hints and segment[1] <= len(hints):
+                buffer.append(hints[segment[1] - 1])
+
+    # Render the template and return the resulting content
+    def render(self, values, hints=None):
+        buffer = []
+        self.render_into(buffer, values, hints)
+        return "".join(buffer)
+
+
+#############################################################################
+# Class that manages the compiled files of a SCORM template directory
+#############################################################################
+class TemplateManager:
+
+    # Constructor
+    def __init__(self, template_dir):
+        self.template_dir = template_dir
+        self.question_template = self.compile_file(QUESTION_TEMPLATE_FILE, QUESTION_TAGS, use_hints=True)
+        self.start_template = self.compile_file(START_TEMPLATE_FILE, START_TAGS)
+        self.manifest_template = self.compile_file(MANIFEST_TEMPLATE_FILE, MANIFEST_TAGS)
+
+    # Read a template file and compile it; the template is either
+    # a directory or a pre-built ZIP archive
+    def compile_file(self, file_name, tags, use_hints=False):
+        if os.path.isfile(self.template_dir):
+            logging.debug("Compile template file '{}' in '{}'.".format(file_name, self.template_dir))
+            with zipfile.ZipFile(self.template_dir) as template_zip:
+                content = template_zip.read(file_name)
+        else:
+            file_path = os.path.join(self.template_dir, file_name)
+            logging.debug("Compile template file '{}'.".format(file_path))
+            with io.open(file_path, 'rb') as template_file:
+                content = template_file.read()
+        return CompiledTemplate(content, tags, use_hints)
+
+
+#############################################################################
+# Functions
+#############################################################################
+
+# Compiled templates indexed by template path, so that each template
+# is read and compiled only once per process
+template_managers = {}
+
+# Get the manager for the given template directory or ZIP archive (compile it if needed)
+def get_template_manager(template_dir):
+    template_dir = os.path.abspath(template_dir)
+    if template_dir not in template_managers:
+        template_managers[template_dir] = TemplateManager(template_dir)
+    return template_managers[template_dir]
+
+
+#############################################################################
+# Main program (used for testing purposes)
+#############################################################################
+def main():
+
+    # Configure logging level for running the tests below
+    logging.basicConfig(level=logging.INFO,
+                        format='* %(levelname)s: %(filename)s: %(message)s')
+
+    # Compile the template located in the program directory
+    program_path = os.path.dirname(os.path.realpath(__file__))
+    template_manager = get_template_manager(program_path + "/Template")
+
+    # Show the number of segments for each template file
+    logging.info("Compiled template files:")
+    logging.info("  - {}: {} segment(s)".format(QUESTION_TEMPLATE_FILE, len(template_manager.question_template.segments)))
+    logging.info("  - {}: {} segment(s)".format(START_TEMPLATE_FILE, len(template_manager.start_template.segments)))
+    logging.info("  - {}: {} segment(s)".format(MANIFEST_TEMPLATE_FILE, len(template_manager.manifest_template.segments)))
+
+
+#############################################################################
+# Run main program
+#############################################################################
+if __name__ == "__main__":
+    main()
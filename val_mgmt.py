@@ -0,0 +1,304 @@
+#############################################################################
+# Training content validation for CyLMS
+#############################################################################
+
+# External imports
+import codecs
+import logging
+import sys
+import yaml
+
+# Internal imports
+from storyboard import Storyboard
+
+#############################################################################
+# Constants
+#############################################################################
+
+# Loader used to compose training content files (based on libyaml if available)
+YAML_LOADER = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
+# Node types used in schemas, mapped to the tags of YAML nodes
+TYPE_STRING = "string"
+TYPE_INTEGER = "integer"
+TYPE_FLOAT = "float"
+TYPE_BOOLEAN = "boolean"
+TYPE_NULL = "null"
+TYPE_LIST = "list"
+TYPE_MAPPING = "mapping"
+TYPE_TAGS = {TYPE_STRING: "tag:yaml.org,2002:str",
+             TYPE_INTEGER: "tag:yaml.org,2002:int",
+             TYPE_FLOAT: "tag:yaml.org,2002:float",
+             TYPE_BOOLEAN: "tag:yaml.org,2002:bool",
+             TYPE_NULL: "tag:yaml.org,2002:null",
+             TYPE_LIST: "tag:yaml.org,2002:seq",
+             TYPE_MAPPING: "tag:yaml.org,2002:map"}
+
+# Types of scalar values that are converted to text (numbers are
+# accepted for identifiers and answers)
+TEXT_TYPES = [TYPE_STRING]
+ID_TYPES = [TYPE_STRING, TYPE_INTEGER]
+LEVEL_TYPES = [TYPE_STRING, TYPE_INTEGER, TYPE_FLOAT, TYPE_NULL]
+
+# Format of error messages
+ERROR_FORMAT = "Line {}: {}"
+
+#############################################################################
+# Functions used as schema rules (they are defined before the schema)
+#############################################################################
+
+# Check that the type of a question is consistent with its choices; the
+# arguments are the question mapping node and its values indexed by key
+def check_question_type(node, value_nodes):
+    type_node = value_nodes.get(Storyboard.KEY_TYPE)
+    if type_node is None:
+        # The type is determined from the presence of choices
+        return []
+    if type_node.value == Storyboard.VALUE_TYPE_FILL_IN and Storyboard.KEY_CHOICES in value_nodes:
+        return [(type_node, "Fill-in type questions cannot have a '{}' field"
+                 .format(Storyboard.KEY_CHOICES))]
+    if type_node.value == Storyboard.VALUE_TYPE_CHOICE and Storyboard.KEY_CHOICES not in value_nodes:
+        return [(type_node, "Choice type questions must have a '{}' field"
+                 .format(Storyboard.KEY_CHOICES))]
+    return []
+
+
+#############################################################################
+# Schema of training content files; each node of the schema defines the
+# accepted types of the corresponding YAML node, and in addition:
+#   - for mappings: the name used in error messages, the known keys and their
+#     schemas, the required keys, and rules that check several keys together
+#   - for lists: the schema of the items
+#   - for scalars: the accepted values (if restricted)
+#############################################################################
+
+## Question section
+QUESTION_SCHEMA = {
+    "types": [TYPE_MAPPING],
+    "name": "question",
+    "keys": {
+        Storyboard.KEY_ID: {"types": ID_TYPES},
+        Storyboard.KEY_TYPE: {"types": TEXT_TYPES,
+                              "values": [Storyboard.VALUE_TYPE_FILL_IN, Storyboard.VALUE_TYPE_CHOICE,
+                                         Storyboard.VALUE_TYPE_NUMERIC]},
+        Storyboard.KEY_BODY: {"types": ID_TYPES},
+        # Choices are given either as a comma-separated string or as a list
+        Storyboard.KEY_CHOICES: {"types": TEXT_TYPES + [TYPE_LIST], "items": {"types": TEXT_TYPES}},
+        Storyboard.KEY_ANSWER: {"types": ID_TYPES},
+        Storyboard.KEY_HINTS: {"types": [TYPE_LIST], "items": {"types": TEXT_TYPES}},
+    },
+    "required": [Storyboard.KEY_ID, Storyboard.KEY_BODY, Storyboard.KEY_ANSWER],
+    "rules": [check_question_type]
+}
+
+## Training section
+TRAINING_SCHEMA = {
+    "types": [TYPE_MAPPING],
+    "name": "training",
+    "keys": {
+        Storyboard.KEY_ID: {"types": ID_TYPES},
+        Storyboard.KEY_TITLE: {"types": TEXT_TYPES},
+        Storyboard.KEY_RESOURCES: {"types": TEXT_TYPES},
+        Storyboard.KEY_OVERVIEW: {"types": TEXT_TYPES},
+        Storyboard.KEY_LEVEL: {"types": LEVEL_TYPES},
+        Storyboard.KEY_QUESTIONS: {"types": [TYPE_LIST], "items": QUESTION_SCHEMA},
+    },
+    "required": [Storyboard.KEY_ID, Storyboard.KEY_OVERVIEW]
+}
+
+## Document, i.e., a list of top-level sections (empty documents are allowed)
+DOCUMENT_SCHEMA = {
+    "types": [TYPE_LIST, TYPE_NULL],
+    "items": {
+        "types": [TYPE_MAPPING],
+        "name": "top-level section",
+        "keys": {
+            Storyboard.KEY_TRAINING: {"types": [TYPE_LIST], "items": TRAINING_SCHEMA}
+        },
+        "required": [Storyboard.KEY_TRAINING]
+    }
+}
+
+#############################################################################
+# Class that checks YAML nodes against a schema node; the schema is compiled
+# into a tree of validators once, so that nodes are checked without any
+# further processing of the schema
+#############################################################################
+class NodeValidator:
+
+    # Constructor
+    def __init__(self, schema, label):
+        self.label = label
+        self.name = schema.get("name")
+        self.tags = set([TYPE_TAGS[node_type] for node_type in schema["types"]])
+        self.type_names = " or ".join(schema["types"])
+        self.values = None
+        if "values" in schema:
+            self.values = set(schema["values"])
+        self.key_validators = {}
+        for key, key_schema in schema.get("keys", {}).items():
+            self.key_validators[key] = NodeValidator(key_schema, "field '{}'".format(key))
+        self.required_keys = schema.get("required", [])
+        self.item_validator = None
+        if "items" in schema:
+            self.item_validator = NodeValidator(schema["items"], "item of {}".format(label))
+        self.rules = schema.get("rules", [])
+
+    # Check a node and its children; errors are appended to the list as
+    # (node, message) pairs; the context describes the enclosing mapping
+    def validate(self, node, context, errors):
+
+        if node.tag not in self.tags:
+            errors.append((node, "Incorrect type of {} in {}: {} (expected {})"
+                           .format(self.label, context, get_type_name(node), self.type_names)))
+            return
+
+        if isinstance(node, yaml.ScalarNode):
+            if self.values is not None and node.value not in self.values:
+                errors.append((node, "Invalid value of {} in {}: '{}' (expected one of: {})"
+                               .format(self.label, context, get_node_text(node), ", ".join(sorted(self.values)))))
+
+        elif isinstance(node, yaml.MappingNode):
+            # Only scalar keys can be known tags
+            value_nodes = {}
+            for key_node, value_node in node.value:
+                if isinstance(key_node, yaml.ScalarNode):
+                    value_nodes[key_node.value] = value_node
+
+            # Mappings are identified in messages by their id (if valid)
+            if self.name:
+                id_node = value_nodes.get(Storyboard.KEY_ID)
+                if isinstance(id_node, yaml.ScalarNode):
+                    context = "{} '{}'".format(self.name, get_node_text(id_node))
+                else:
+                    context = "{} in {}".format(self.name, context)
+
+            for key_node, value_node in node.value:
+                key_validator = None
+                if isinstance(key_node, yaml.ScalarNode):
+                    key_validator = self.key_validators.get(key_node.value)
+                if key_validator:
+                    key_validator.validate(value_node, context, errors)
+                else:
+                    errors.append((key_node, "Unknown tag in {}: {}".format(context, get_node_text(key_node))))
+            for key in self.required_keys:
+                if key not in value_nodes:
+                    errors.append((node, "Required field in {} is missing: {}".format(context, key)))
+
+            if self.rules:
+                for rule in self.rules:
+                    for error_node, message in rule(node, value_nodes):
+                        errors.append((error_node, "{} (in {})".format(message, context)))
+
+        elif isinstance(node, yaml.SequenceNode) and self.item_validator:
+            for item_node in node.value:
+                self.item_validator.validate(item_node, context, errors)
+
+
+#############################################################################
+# Class that validates training content (the document schema is compiled once)
+#############################################################################
+class ContentValidator:
+
+    # Constructor
+    def __init__(self, schema=DOCUMENT_SCHEMA):
+        self.validator = NodeValidator(schema, "document")
+
+    # Validate a document node; return the list of error messages
+    # (with line numbers), which is empty if the document is valid
+    def validate_document(self, document_node):
+        errors = []
+        self.validator.validate(document_node, "training content", errors)
+        errors.sort(key=lambda error: (error[0].start_mark.line, error[0].start_mark.column))
+        return [ERROR_FORMAT.format(error_node.start_mark.line + 1, message) for error_node, message in errors]
+
+    # Validate all the documents in a training content file; return the
+    # list of error messages, which is empty if the file is valid; as for
+    # conversion, files without any training are invalid
+    def validate_file(self, input_file):
+        errors = []
+        training_count = 0
+        try:
+            with codecs.open(input_file, 'r', 'utf-8') as stream:
+                for document_node in yaml.compose_all(stream, Loader=YAML_LOADER):
+                    errors.extend(self.validate_document(document_node))
+                    training_count += count_trainings(document_node)
+        except IOError as e:
+            errors.append("I/O error: " + str(e))
+        except yaml.YAMLError as e:
+            errors.append("YAML error: " + str(e))
+        else:
+            if not errors and not training_count:
+                errors.append("No data in the input file")
+        return errors
+
+
+#############################################################################
+# Functions
+#############################################################################
+
+# Get the type name of a node, as used in schemas
+def get_type_name(node):
+    for node_type, tag in TYPE_TAGS.items():
+        if node.tag == tag:
+            return node_type
+    return node.tag
+
+# Get the text of a scalar node (encoded for use in messages), or a short
+# description of other nodes
+def get_node_text(node):
+    if isinstance(node, yaml.ScalarNode):
+        return node.value.encode('utf-8')
+    return "<{}>".format(get_type_name(node))
+
+# Count the trainings in a document node that was validated
+def count_trainings(document_node):
+    training_count = 0
+    if isinstance(document_node, yaml.SequenceNode):
+        for item_node in document_node.value:
+            if isinstance(item_node, yaml.MappingNode):
+                for key_node, value_node in item_node.value:
+                    if key_node.value == Storyboard.KEY_TRAINING and isinstance(value_node, yaml.SequenceNode):
+                        training_count += len(value_node.value)
+    return training_count
+
+# Content validator (created on first use)
+content_validator = None
+
+# Get the content validator (create it if needed)
+def get_content_validator():
+    global content_validator
+    if not content_validator:
+        content_validator = ContentValidator()
+    return content_validator
+
+
+#############################################################################
+# Main program (used for testing purposes)
+#############################################################################
+def main(args):
+
+    # Configure logging level for running the tests below
+    logging.basicConfig(level=logging.INFO,
+                        format='* %(levelname)s: %(filename)s: %(message)s')
+
+    # Validate the training content files given as arguments
+    if not args:
+        logging.error("Usage: val_mgmt.py <FILE>...")
+        sys.exit(1)
+    error_count = 0
+    for input_file in args:
+        errors = get_content_validator().validate_file(input_file)
+        for error in errors:
+            logging.error("{}: {}".format(input_file, error))
+        error_count += len(errors)
+    logging.info("Validated {} file(s): {} error(s) found.".format(len(args), error_count))
+    if error_count:
+        sys.exit(1)
+
+
+#############################################################################
+# Run main program
+#############################################################################
+if __name__ == "__main__":
+    main(sys.argv[1:])
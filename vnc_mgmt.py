@@ -7,9 +7,19 @@
 import sys
 import subprocess
 import logging
+import collections
+import json
+import os
+import tempfile
+import time
+from multiprocessing.pool import ThreadPool
 
 # Internal imports
 import cfg_mgmt
+import job_mgmt
+import perf_mgmt
+import range_mgmt
+import ssh_mgmt
 from storyboard import Storyboard
 
 #############################################################################
@@ -19,17 +29,16 @@ from storyboard import Storyboard
 # Default range id (if not provided as argument)
 RANGE_ID_DEFAULT = 1
 
-# Constants regarding getting range info
-## Tunnel creation file settings
-TUNNEL_FILENAME_TEMPLATE = "{}/{}/create_tunnels.sh"
-SSH_TAG = "ssh"
-TUNNEL_UNIT_INDEX = 12
-TUNNEL_IP_INDEX = 2
-## Range details file settings
-DETAILS_FILENAME_TEMPLATE = "{}/{}/range_details-cr{}.yml"
-KVM_DOMAIN_TAG = "kvm_domain"
-INTERFACE_TAG = "eth0"
-VALUE_INDEX = 1
+# Constants regarding VNC port discovery
+## VNC display query settings: the displays of all domains are queried in a
+## single virsh invocation that runs several commands separated by ';', each
+## domain being preceded by a marker line; domains that cannot be resolved
+## that way are queried in parallel, one virsh invocation per domain
+VIRSH_COMMAND = "virsh"
+VIRSH_SEPARATOR = "; "
+VIRSH_MARKER = "CYLMS_DOMAIN="
+VIRSH_BATCH_TEMPLATE = "echo {}'{}'; vncdisplay '{}'"
+VNC_QUERY_THREADS = 8
 
 # Constants regarding access range file creation
 ACCESS_RANGE_FILENAME_TEMPLATE="access_range{}.html"
@@ -38,18 +47,51 @@ PAGE_HEADING_TEMPLATE="  <h1>Cyber Range for Activity #{}</h1>\n"
 #TRAINEE_LINK_TEMPLATE="    document.write(\"<li><a href='http://\" + location.hostname + \":{}/vnc.html'>Trainee #{:02d}</a></li>\");\n"
 TRAINEE_LINK_TEMPLATE="    document.write(\"<li><a href='http://\" + location.hostname + \":{}/vnc_lite.html'>Trainee #{:02d}</a></li>\");\n"
 VNC_SERVER_PATH = "/root/noVNC"
+## Link template used when a single noVNC proxy routes all trainees based on tokens
+PROXY_TRAINEE_LINK_TEMPLATE="    document.write(\"<li><a href='http://\" + location.hostname + \":{}/vnc_lite.html?path=websockify%3Ftoken%3D{}'>Trainee #{:02d}</a></li>\");\n"
 
 # Constants regarding noVNC server start/stop
-NOVNC_START_CMD_TEMPLATE = "nohup {}/utils/launch.sh --listen {} --vnc 192.168.122.1:{} > /tmp/novnc{}.out 2>&1 &"
+NOVNC_START_CMD_TEMPLATE = "nohup {}/utils/launch.sh --listen {} --vnc 192.168.122.1:{} > /tmp/novnc{}.out 2>&1 < /dev/null &"
 NOVNC_STOP_CMD_TEMPLATE = "pkill --full '192.168.122.1:{}'"
 RM_FILE_CMD_TEMPLATE = "rm -f {}"
-
-# Other constants
-## SSH/SCP connection options (need to be separated because of limitations on how
-## options are passed to subprocess.check_output() calls)
-SSH_HOSTS_NULL = "-o UserKnownHostsFile=/dev/null"
-SSH_STRICT_NO = "-o StrictHostKeyChecking=no"
-SSH_BGND_EXEC = "-f"
+## Servers are started/stopped by a single script run on the LMS host (via 'sh -s'),
+## which prints a status line for each port; started servers are checked after a
+## short delay (in seconds), so that servers that exit right away are detected
+REMOTE_SHELL_COMMAND = ["sh", "-s"]
+NOVNC_STATUS_MARKER = "CYLMS_STATUS"
+NOVNC_START_SCRIPT_TEMPLATE = "{}\npid_{}=$!\n"
+NOVNC_CHECK_SCRIPT_TEMPLATE = "if kill -0 $pid_{0} 2> /dev/null; then echo \"{1} {0} running $pid_{0}\"; "\
+                              "else echo \"{1} {0} failed\"; fi\n"
+NOVNC_STOP_SCRIPT_TEMPLATE = "{} > /dev/null 2>&1 && echo \"{} {} stopped\" || echo \"{} {} not_running\"\n"
+NOVNC_START_CHECK_DELAY = 1
+NOVNC_RUNNING = "running"
+NOVNC_STOPPED = "stopped"
+
+# Constants regarding session snapshots: the range info of each session is saved
+# locally at VNC setup (in a directory relative to the program path), so that
+# teardown doesn't depend on the range files, virsh, or even the range itself
+SNAPSHOT_DIRECTORY = "cache/sessions"
+SNAPSHOT_FILENAME_TEMPLATE = "session{}.json"
+SNAPSHOT_VERSION = 1
+TEMP_SNAPSHOT_PREFIX = ".cylms-"
+
+# Constants regarding the single noVNC proxy (websockify with token-based routing);
+# the proxy reads the targets from the token files of all sessions in the token
+# directory each time a connection is made, so sessions are added or removed by
+# only updating their token files, and the proxy is started if it isn't running
+PROXY_TOKEN_DIR = VNC_SERVER_PATH + "/tokens"
+PROXY_TOKEN_FILE_TEMPLATE = PROXY_TOKEN_DIR + "/session{}.cfg"
+PROXY_TOKEN_TEMPLATE = "session{}-trainee{:02d}"
+PROXY_TOKEN_LINE_TEMPLATE = "{}: 192.168.122.1:{}\n"
+PROXY_TOKEN_FILE_MARKER = "CYLMS_TOKENS_EOF"
+PROXY_MATCH_PATTERN = "--token-source " + PROXY_TOKEN_DIR
+PROXY_START_CMD_TEMPLATE = "nohup {0}/utils/websockify/run --web {0} --token-plugin TokenFile --token-source {1} {2} "\
+                           "> /tmp/novnc_proxy.out 2>&1 < /dev/null &"
+PROXY_START_SCRIPT_TEMPLATE = "mkdir -p {0}\ncat > {1} << '{2}'\n{3}{2}\n"\
+                              "if ! pgrep -f -- '{4}' > /dev/null; then\n{5}\nsleep {6}\nfi\n"\
+                              "if pid=$(pgrep -o -f -- '{4}'); then echo \"{7} {8} running $pid\"; "\
+                              "else echo \"{7} {8} failed\"; fi\n"
+PROXY_STOP_SCRIPT_TEMPLATE = "rm -f {} {}\necho \"{} {} stopped\"\n"
 
 #############################################################################
 # Class that contains VNC management functionality
@@ -59,8 +101,8 @@ class VncManager:
     # Constructor
     def __init__(self, config_file):
 
-        # Initialize configuration manager
-        self.cfg_manager = cfg_mgmt.CfgManager(config_file)
+        # Initialize configuration manager (shared with other managers)
+        self.cfg_manager = cfg_mgmt.get_cfg_manager(config_file)
 
         # Initialize internal variables
         self.lms_host = self.cfg_manager.get_setting(Storyboard.CONFIG_LMS_HOST)
@@ -68,78 +110,122 @@ class VncManager:
             logging.error("Setting not defined in config file: {} => abort".format(Storyboard.CONFIG_LMS_HOST))
             sys.exit(1)
 
+        # All commands and file transfers go through the same connection
+        self.ssh_connection = ssh_mgmt.get_connection(self.lms_host)
+
+        # Use a single noVNC proxy for all trainees (if enabled)
+        self.proxy_mode = bool(self.cfg_manager.get_setting(Storyboard.CONFIG_VNC_PROXY))
+
+        # Process ids of the noVNC servers started last, indexed by port
+        self.novnc_pids = {}
+
+        # Range maps determined so far, indexed by range id, and session snapshot directory
+        self.range_maps = {}
+        self.snapshot_dir = os.path.join(os.path.dirname(os.path.realpath(__file__)), SNAPSHOT_DIRECTORY)
+
         self.range_dir = self.cfg_manager.get_setting(Storyboard.CONFIG_RANGE_DIRECTORY)
         if not self.range_dir:
             logging.error("Setting not defined in config file: {} => abort".format(Storyboard.CONFIG_RANGE_DIRECTORY))
             sys.exit(1)
 
-    # Get cyber range info from the files created by CyRIS
+    # Get cyber range info from the files created by CyRIS; return the list
+    # of VNC ports of the entry points, or None on error
     def get_range_info(self, range_id):
+        range_map = self.get_range_map(range_id)
+        if range_map is None:
+            return None
+        vnc_ports = [entry_point["vnc_port"] for entry_point in range_map.values()]
+        logging.info("- Returned list of VNC ports: {}".format(str(vnc_ports)))
+        return vnc_ports
 
-        logging.info("Get info about range #{}".format(range_id))
-
-        # Prepare tunnel creation file name
-        tunnel_filename = TUNNEL_FILENAME_TEMPLATE.format(self.range_dir, range_id)
+    # Get the entry points of the cyber range as an ordered mapping from KVM domain
+    # name to a dictionary with the IP address and VNC port of the domain; return
+    # None on error
+    def get_range_map(self, range_id):
 
-        logging.debug("  - Get entry point IP(s)")
-        instance_index = 1
-        tunnel_ip_addresses = []
+        logging.info("Get info about range #{}".format(range_id))
 
-        # Get IP addresses of entry points
-        try:
-            with open(tunnel_filename) as tunnel_file:
-                for count,line in enumerate(tunnel_file):
-                    if SSH_TAG in line:
-                        tunnel_ip_address = line.split(" ")[TUNNEL_UNIT_INDEX].split(":")[TUNNEL_IP_INDEX]
-                        tunnel_ip_addresses.append(tunnel_ip_address)
-                        instance_index += 1
-        except IOError as e:
-            logging.error("I/O Error: " + str(e))
+        # Get the entry points from the (cached) files created by CyRIS
+        range_info = range_mgmt.get_range_manager(self.range_dir).get_range_info(range_id)
+        if range_info is None:
             return None
+        kvm_domains = range_info.get_kvm_domains()
 
-        # Prepare range details file name
-        details_filename = DETAILS_FILENAME_TEMPLATE.format(self.range_dir, range_id, range_id)
+        # Get VNC ports for entry points by calling 'virsh'
+        logging.debug("  - Determine entry point VNC port(s)")
+        vnc_port_map = get_vnc_ports(kvm_domains)
+        if vnc_port_map is None:
+            return None
 
-        logging.debug("  - Get entry point domain name(s)")
-        instance_index = 1
-        kvm_domains = []
+        # Build the mapping of entry point domains to IP addresses and VNC ports
+        range_map = collections.OrderedDict()
+        for kvm_domain, ip_address in range_info.entry_points.items():
+            range_map[kvm_domain] = {"ip": ip_address, "vnc_port": vnc_port_map[kvm_domain]}
+        self.range_maps[str(range_id)] = range_map
+        return range_map
+
+    # Get the VNC ports of a session for teardown: the ports in the session
+    # snapshot are used if available, otherwise the range info is determined
+    # again; return None on error
+    def get_session_ports(self, range_id):
+        snapshot = self.load_snapshot(range_id)
+        if snapshot:
+            logging.info("Use snapshot of session #{} taken at VNC setup".format(range_id))
+            return snapshot["vnc_ports"]
+        return self.get_range_info(range_id)
+
+    # Get the name of the snapshot file of a session
+    def get_snapshot_filename(self, range_id):
+        return os.path.join(self.snapshot_dir, SNAPSHOT_FILENAME_TEMPLATE.format(range_id))
+
+    # Save the snapshot of a session (VNC ports, entry point domains and
+    # noVNC server process ids)
+    def save_snapshot(self, range_id, vnc_ports):
+        snapshot = {"version": SNAPSHOT_VERSION, "session": str(range_id), "lms_host": self.lms_host,
+                    "time": time.strftime("%Y-%m-%d %H:%M:%S"), "proxy_mode": self.proxy_mode,
+                    "vnc_ports": vnc_ports, "entry_points": self.range_maps.get(str(range_id), {}),
+                    "novnc_pids": dict([(str(port), pid) for port, pid in self.novnc_pids.items()])}
+        temp_name = None
+        try:
+            if not os.path.isdir(self.snapshot_dir):
+                os.makedirs(self.snapshot_dir)
+            temp_fd, temp_name = tempfile.mkstemp(prefix=TEMP_SNAPSHOT_PREFIX, dir=self.snapshot_dir)
+            with os.fdopen(temp_fd, "w") as snapshot_file:
+                json.dump(snapshot, snapshot_file, indent=2, sort_keys=True, separators=(",", ": "))
+            os.rename(temp_name, self.get_snapshot_filename(range_id))
+        except (IOError, OSError) as e:
+            logging.warning("Cannot save snapshot of session #{}: {}".format(range_id, str(e)))
+            if temp_name and os.path.exists(temp_name):
+                os.remove(temp_name)
+            return False
+        logging.debug("Saved snapshot of session #{}".format(range_id))
+        return True
 
-        # Get IP addresses of all domains and find the domain name associated with the
-        # entry point addresses determined above
+    # Load the snapshot of a session; return None if there is no valid snapshot
+    # for the session on the current LMS host
+    def load_snapshot(self, range_id):
+        snapshot_filename = self.get_snapshot_filename(range_id)
+        if not os.path.isfile(snapshot_filename):
+            return None
         try:
-            with open(details_filename) as details_file:
-                for count,line in enumerate(details_file):
-                    if KVM_DOMAIN_TAG in line:
-                        kvm_domain = line.split(":")[VALUE_INDEX].strip()
-                    elif INTERFACE_TAG in line:
-                        ip_address = line.split(":")[VALUE_INDEX].strip()
-                        if ip_address in tunnel_ip_addresses:
-                            kvm_domains.append(kvm_domain)
-                            instance_index += 1
-        except IOError as e:
-            logging.error("I/O Error: " + str(e))
+            with open(snapshot_filename) as snapshot_file:
+                snapshot = json.load(snapshot_file)
+        except (IOError, ValueError) as e:
+            logging.warning("Cannot read snapshot of session #{} => ignore it: {}".format(range_id, str(e)))
             return None
+        if snapshot.get("version") != SNAPSHOT_VERSION or snapshot.get("lms_host") != self.lms_host:
+            return None
+        return snapshot
 
-        # Get VNC ports for entry points by calling 'virsh' 
-        logging.debug("  - Determine entry point VNC port(s)")
-        instance_index = 1
-        vnc_ports = []
-        for kvm_domain in kvm_domains:
-            try:
-                # Run virsh command to get VNC port index
-                cmd_output = subprocess.check_output(["virsh", "vncdisplay", kvm_domain], stderr=subprocess.STDOUT)
-                vnc_port = int(cmd_output.split(":")[1].strip()) + Storyboard.VNC_BASE_PORT
-                vnc_ports.append(vnc_port)
-            except subprocess.CalledProcessError as error:
-                logging.error("Failed to get VNC port for domain '{}'\n  Error message: {}".format(kvm_domain, error.output.rstrip()))
-                return None
-            
-            instance_index += 1
-
-        logging.info("- Returned list of VNC ports: {}".format(str(vnc_ports)))
-        return vnc_ports
+    # Remove the snapshot of a session (if any)
+    def remove_snapshot(self, range_id):
+        try:
+            os.remove(self.get_snapshot_filename(range_id))
+        except OSError:
+            pass
 
     # Create the access range file
+    @perf_mgmt.timed("vnc.create_access_file")
     def create_access_file(self, range_id, vnc_ports):
 
         # Prepare access range file name
@@ -163,8 +249,13 @@ class VncManager:
             access_range_file.write("  <h2><ul><script>\n")
             trainee_index = 1
             for vnc_port in vnc_ports:
-                range_port = vnc_port - Storyboard.VNC_BASE_PORT + Storyboard.ACCESS_RANGE_BASE_PORT
-                access_range_file.write(TRAINEE_LINK_TEMPLATE.format(range_port, trainee_index))
+                if self.proxy_mode:
+                    proxy_token = PROXY_TOKEN_TEMPLATE.format(range_id, trainee_index)
+                    access_range_file.write(PROXY_TRAINEE_LINK_TEMPLATE.format(Storyboard.VNC_PROXY_PORT, proxy_token,
+                                                                               trainee_index))
+                else:
+                    range_port = vnc_port - Storyboard.VNC_BASE_PORT + Storyboard.ACCESS_RANGE_BASE_PORT
+                    access_range_file.write(TRAINEE_LINK_TEMPLATE.format(range_port, trainee_index))
                 trainee_index += 1
             access_range_file.write("  </script></ul></h2>\n")
 
@@ -179,12 +270,11 @@ class VncManager:
         logging.debug("  - Copy range file to Moodle server")
         destination_path = self.lms_host + ":" + VNC_SERVER_PATH 
         try:
-            cmd_output = subprocess.check_output(
-                ["scp", SSH_HOSTS_NULL, SSH_STRICT_NO, access_range_filename, destination_path],
-                stderr=subprocess.STDOUT)
+            cmd_output = self.ssh_connection.copy([access_range_filename], VNC_SERVER_PATH)
 
         # Any execution error will lead to an exception, which we handle below
         except subprocess.CalledProcessError as error:
+            job_mgmt.record_error(error)
             logging.error("Error when copying file '{}' to '{}'\n  Error message: {}"
                           .format(access_range_filename, destination_path, error.output.rstrip()))
             return False
@@ -192,65 +282,233 @@ class VncManager:
         logging.info("- Copied file to '{}'".format(destination_path))
         return True
 
-    # Start the noVNC servers
-    def start_novnc_servers(self, vnc_ports):
+    # Start the noVNC servers of a session in one round trip; return True
+    # if all the servers were started successfully; in proxy mode, the session
+    # id is required to update the token file of the session
+    @perf_mgmt.timed("novnc.start")
+    def start_novnc_servers(self, vnc_ports, range_id=None):
+
+        if self.proxy_mode:
+            started = self.start_proxy_session(range_id, vnc_ports)
+        else:
+            started = self.start_session_servers(vnc_ports)
+
+        # Save the session snapshot used for teardown
+        if started and range_id is not None:
+            self.save_snapshot(range_id, vnc_ports)
+        return started
+
+    # Start one noVNC server for each VNC port; return True on success
+    def start_session_servers(self, vnc_ports):
 
         logging.info("Start noVNC servers on '{}'".format(self.lms_host))
 
-        # Start servers
+        # Build the script that starts all the servers, then checks them
         access_range_ports = []
+        script = ""
         for vnc_port in vnc_ports:
             access_range_port = vnc_port - Storyboard.VNC_BASE_PORT + Storyboard.ACCESS_RANGE_BASE_PORT
             access_range_ports.append(access_range_port)
             novnc_start_cmd = NOVNC_START_CMD_TEMPLATE.format(VNC_SERVER_PATH, access_range_port, vnc_port, access_range_port)
-            try:
-                cmd_output = subprocess.check_output(
-                    ["ssh", SSH_HOSTS_NULL, SSH_STRICT_NO, SSH_BGND_EXEC, self.lms_host, novnc_start_cmd],
-                    stderr=subprocess.STDOUT)
-
-            # Any execution error will lead to an exception, which we handle below
-            except subprocess.CalledProcessError as error:
-                logging.error("Error when starting noVNC servers on '{}'\n  Error message: {}"
-                              .format(self.lms_host, error.output.rstrip()))
+            script += NOVNC_START_SCRIPT_TEMPLATE.format(novnc_start_cmd, access_range_port)
+        script += "sleep {}\n".format(NOVNC_START_CHECK_DELAY)
+        for access_range_port in access_range_ports:
+            script += NOVNC_CHECK_SCRIPT_TEMPLATE.format(access_range_port, NOVNC_STATUS_MARKER)
+
+        port_status = self.run_novnc_script(script)
+        if port_status is None:
+            return False
+        self.novnc_pids = {}
+        for access_range_port in access_range_ports:
+            status = port_status.get(access_range_port, [])
+            if not status or status[0] != NOVNC_RUNNING:
+                logging.error("Failed to start noVNC server on port {} (see /tmp/novnc{}.out on '{}')"
+                              .format(access_range_port, access_range_port, self.lms_host))
                 return False
+            self.novnc_pids[access_range_port] = int(status[1])
 
-        logging.info("- Started noVNC server(s) on port(s): {}".format(access_range_ports))        
+        logging.info("- Started noVNC server(s) on port(s): {}".format(access_range_ports))
         return True
 
-    # Stop the noVNC servers
+    # Stop the noVNC servers of a session and remove its access range file
+    # in one round trip; return True if all the servers were stopped
+    @perf_mgmt.timed("novnc.stop")
     def stop_novnc_servers(self, range_id, vnc_ports):
 
+        # Stop the servers as they were started (according to the snapshot, if any)
+        snapshot = self.load_snapshot(range_id)
+        if snapshot:
+            proxy_mode = snapshot.get("proxy_mode")
+        else:
+            proxy_mode = self.proxy_mode
+        if proxy_mode:
+            stopped = self.stop_proxy_session(range_id)
+        else:
+            stopped = self.stop_session_servers(range_id, vnc_ports)
+
+        # The session snapshot is not needed anymore
+        if stopped:
+            self.remove_snapshot(range_id)
+        return stopped
+
+    # Stop the noVNC servers for the given VNC ports and remove the access
+    # range file; return True on success
+    def stop_session_servers(self, range_id, vnc_ports):
+
         logging.info("Stop noVNC servers on '{}'".format(self.lms_host))
 
-        # Remove access range file from server
+        # Build the script that removes the access range file and stops all the servers
         file_name = VNC_SERVER_PATH + "/" + ACCESS_RANGE_FILENAME_TEMPLATE.format(range_id)
-        rm_file_cmd = RM_FILE_CMD_TEMPLATE.format(file_name)
+        script = RM_FILE_CMD_TEMPLATE.format(file_name) + "\n"
+        for vnc_port in vnc_ports:
+            novnc_stop_cmd = NOVNC_STOP_CMD_TEMPLATE.format(vnc_port)
+            script += NOVNC_STOP_SCRIPT_TEMPLATE.format(novnc_stop_cmd, NOVNC_STATUS_MARKER, vnc_port,
+                                                        NOVNC_STATUS_MARKER, vnc_port)
+
+        port_status = self.run_novnc_script(script)
+        if port_status is None:
+            return False
+        stopped_ports = [vnc_port for vnc_port in vnc_ports if port_status.get(vnc_port, [None])[0] == NOVNC_STOPPED]
+        if len(stopped_ports) != len(vnc_ports):
+            logging.error("Error when stopping noVNC servers on '{}': no server found for port(s): {}"
+                          .format(self.lms_host, [vnc_port for vnc_port in vnc_ports if vnc_port not in stopped_ports]))
+            return False
+
+        logging.info("- Stopped noVNC server(s) on port(s): {}".format(vnc_ports))
+        return True
+
+    # Add the targets of a session to the noVNC proxy by writing its token file,
+    # and start the proxy if it isn't running; return True on success
+    def start_proxy_session(self, range_id, vnc_ports):
+
+        logging.info("Add session #{} to noVNC proxy on '{}'".format(range_id, self.lms_host))
+
+        token_lines = ""
+        trainee_index = 1
+        for vnc_port in vnc_ports:
+            token_lines += PROXY_TOKEN_LINE_TEMPLATE.format(PROXY_TOKEN_TEMPLATE.format(range_id, trainee_index), vnc_port)
+            trainee_index += 1
+        proxy_start_cmd = PROXY_START_CMD_TEMPLATE.format(VNC_SERVER_PATH, PROXY_TOKEN_DIR, Storyboard.VNC_PROXY_PORT)
+        script = PROXY_START_SCRIPT_TEMPLATE.format(PROXY_TOKEN_DIR, PROXY_TOKEN_FILE_TEMPLATE.format(range_id),
+                                                    PROXY_TOKEN_FILE_MARKER, token_lines, PROXY_MATCH_PATTERN,
+                                                    proxy_start_cmd, NOVNC_START_CHECK_DELAY, NOVNC_STATUS_MARKER,
+                                                    Storyboard.VNC_PROXY_PORT)
+
+        port_status = self.run_novnc_script(script)
+        if port_status is None:
+            return False
+        status = port_status.get(Storyboard.VNC_PROXY_PORT, [])
+        if not status or status[0] != NOVNC_RUNNING:
+            logging.error("Failed to start noVNC proxy on port {} (see /tmp/novnc_proxy.out on '{}')"
+                          .format(Storyboard.VNC_PROXY_PORT, self.lms_host))
+            return False
+        self.novnc_pids = {Storyboard.VNC_PROXY_PORT: int(status[1])}
+
+        logging.info("- Added {} trainee(s) to noVNC proxy on port {}".format(len(vnc_ports), Storyboard.VNC_PROXY_PORT))
+        return True
+
+    # Remove the targets of a session from the noVNC proxy by removing its token
+    # file, together with the access range file; the proxy keeps running for
+    # the other sessions; return True on success
+    def stop_proxy_session(self, range_id):
+
+        logging.info("Remove session #{} from noVNC proxy on '{}'".format(range_id, self.lms_host))
+
+        file_name = VNC_SERVER_PATH + "/" + ACCESS_RANGE_FILENAME_TEMPLATE.format(range_id)
+        script = PROXY_STOP_SCRIPT_TEMPLATE.format(file_name, PROXY_TOKEN_FILE_TEMPLATE.format(range_id),
+                                                   NOVNC_STATUS_MARKER, Storyboard.VNC_PROXY_PORT)
+        port_status = self.run_novnc_script(script)
+        if port_status is None:
+            return False
+
+        logging.info("- Removed session #{} from noVNC proxy".format(range_id))
+        return True
+
+    # Run a noVNC management script on the LMS host; return a dictionary that
+    # maps each port to its status fields, or None on error
+    def run_novnc_script(self, script):
+        logging.debug("noVNC management script:\n{}".format(script))
         try:
-            cmd_output = subprocess.check_output(
-                ["ssh", SSH_HOSTS_NULL, SSH_STRICT_NO, self.lms_host, rm_file_cmd],
-                stderr=subprocess.STDOUT)
+            cmd_output = self.ssh_connection.run(REMOTE_SHELL_COMMAND, input_data=script)
 
         # Any execution error will lead to an exception, which we handle below
         except subprocess.CalledProcessError as error:
-            logging.error("Error when removing access range file from '{}'\n  Error message: {}"
+            job_mgmt.record_error(error)
+            logging.error("Error when managing noVNC servers on '{}'\n  Error message: {}"
                           .format(self.lms_host, error.output.rstrip()))
+            return None
 
-        # Stop servers
-        for vnc_port in vnc_ports:
-            novnc_stop_cmd = NOVNC_STOP_CMD_TEMPLATE.format(vnc_port)
-            try:
-                cmd_output = subprocess.check_output(
-                    ["ssh", SSH_HOSTS_NULL, SSH_STRICT_NO, self.lms_host, novnc_stop_cmd],
-                    stderr=subprocess.STDOUT)
-
-            # Any execution error will lead to an exception, which we handle below
-            except subprocess.CalledProcessError as error:
-                logging.error("Error when stopping noVNC servers on '{}'\n  Error message: {}"
-                              .format(self.lms_host, error.output.rstrip()))
-                return False
+        port_status = {}
+        for output_line in cmd_output.splitlines():
+            fields = output_line.split()
+            if len(fields) >= 3 and fields[0] == NOVNC_STATUS_MARKER and fields[1].isdigit():
+                port_status[int(fields[1])] = fields[2:]
+        return port_status
 
-        logging.info("- Stopped noVNC server(s) on port(s): {}".format(vnc_ports))
-        return True
+
+#############################################################################
+# Functions
+#############################################################################
+
+# Get the VNC ports of the given KVM domains as a dictionary; return None on error
+def get_vnc_ports(kvm_domains):
+
+    vnc_port_map = {}
+    if not kvm_domains:
+        return vnc_port_map
+
+    # Query all the domains in one virsh invocation; virsh may stop at the first
+    # failed command, so the output is processed even if an error occurred
+    virsh_commands = VIRSH_SEPARATOR.join([VIRSH_BATCH_TEMPLATE.format(VIRSH_MARKER, kvm_domain, kvm_domain)
+                                           for kvm_domain in kvm_domains])
+    try:
+        perf_mgmt.add_subprocess(VIRSH_COMMAND)
+        with perf_mgmt.timer("virsh"):
+            cmd_output = subprocess.check_output([VIRSH_COMMAND, virsh_commands], stderr=subprocess.STDOUT)
+    except subprocess.CalledProcessError as error:
+        cmd_output = error.output
+    except OSError as e:
+        logging.error("Failed to run '{}': {}".format(VIRSH_COMMAND, str(e)))
+        return None
+    kvm_domain = None
+    for output_line in cmd_output.splitlines():
+        output_line = output_line.strip()
+        if output_line.startswith(VIRSH_MARKER):
+            kvm_domain = output_line[len(VIRSH_MARKER):]
+        elif kvm_domain and ":" in output_line and kvm_domain not in vnc_port_map:
+            vnc_display = output_line.rsplit(":", 1)[1].strip()
+            if vnc_display.isdigit():
+                vnc_port_map[kvm_domain] = int(vnc_display) + Storyboard.VNC_BASE_PORT
+
+    # Query the remaining domains (if any) in parallel
+    remaining_domains = [kvm_domain for kvm_domain in kvm_domains if kvm_domain not in vnc_port_map]
+    if remaining_domains:
+        logging.debug("Query VNC ports of {} domain(s) individually.".format(len(remaining_domains)))
+        pool = ThreadPool(min(VNC_QUERY_THREADS, len(remaining_domains)))
+        try:
+            vnc_ports = pool.map(get_vnc_port, remaining_domains)
+        finally:
+            pool.close()
+        for kvm_domain, vnc_port in zip(remaining_domains, vnc_ports):
+            if vnc_port is None:
+                return None
+            vnc_port_map[kvm_domain] = vnc_port
+
+    return vnc_port_map
+
+# Get the VNC port of a KVM domain; return None on error
+def get_vnc_port(kvm_domain):
+    try:
+        # Run virsh command to get VNC port index
+        perf_mgmt.add_subprocess(VIRSH_COMMAND)
+        with perf_mgmt.timer("virsh"):
+            cmd_output = subprocess.check_output([VIRSH_COMMAND, "vncdisplay", kvm_domain], stderr=subprocess.STDOUT)
+        return int(cmd_output.split(":")[1].strip()) + Storyboard.VNC_BASE_PORT
+    except subprocess.CalledProcessError as error:
+        logging.error("Failed to get VNC port for domain '{}'\n  Error message: {}".format(kvm_domain, error.output.rstrip()))
+    except (IndexError, ValueError):
+        logging.error("Failed to get VNC port for domain '{}'\n  Command output: {}".format(kvm_domain, cmd_output.rstrip()))
+    return None
 
 
 #############################################################################
@@ -276,14 +534,14 @@ def main(args):
         vnc_ports = vnc_manager.get_range_info(range_id)
         if vnc_ports:
             if vnc_manager.create_access_file(range_id, vnc_ports):
-                if not vnc_manager.start_novnc_servers(vnc_ports):
+                if not vnc_manager.start_novnc_servers(vnc_ports, range_id):
                     logging.error("Failed to start VNC servers => abort VNC setup")
             else:
                 logging.error("Failed to create range access file => abort VNC setup")
         else:
             logging.error("Failed to get cyber range info => abort VNC setup")
     else:
-        vnc_ports = vnc_manager.get_range_info(range_id)
+        vnc_ports = vnc_manager.get_session_ports(range_id)
         if vnc_ports:
             if not vnc_manager.stop_novnc_servers(range_id, vnc_ports):
                 logging.error("Failed to stop VNC servers => abort VNC setup")
@@ -0,0 +1,267 @@
+#############################################################################
+# Moodle web service management for CyLMS
+#############################################################################
+
+# External imports
+import atexit
+import httplib
+import json
+import logging
+import os
+import Queue
+import socket
+import sys
+import threading
+import urllib
+import urlparse
+import uuid
+
+# Internal imports
+import perf_mgmt
+
+#############################################################################
+# Constants
+#############################################################################
+
+# Web service endpoints (relative to the Moodle URL)
+REST_PATH = "/webservice/rest/server.php"
+UPLOAD_PATH = "/webservice/upload.php"
+REST_FORMAT = "json"
+UPLOAD_FILE_AREA = "draft"
+UPLOAD_NEW_ITEM_ID = 0
+
+# HTTP settings: connections are kept alive and reused by later requests;
+# at most POOL_SIZE idle connections are kept per Moodle site
+POOL_SIZE = 8
+HTTP_TIMEOUT = 300 # seconds
+UPLOAD_CHUNK_SIZE = 64 * 1024
+FORM_CONTENT_TYPE = "application/x-www-form-urlencoded"
+MULTIPART_CONTENT_TYPE = "multipart/form-data; boundary={}"
+FILE_CONTENT_TYPE = "application/octet-stream"
+
+# Fields of error responses
+EXCEPTION_FIELD = "exception"
+ERROR_FIELD = "error"
+MESSAGE_FIELD = "message"
+
+#############################################################################
+# Exception raised when a web service request fails; 'retryable' tells whether
+# the request can safely be sent again, that is, if it was not sent at all
+#############################################################################
+class WsError(Exception):
+
+    # Constructor
+    def __init__(self, message, retryable=False):
+        Exception.__init__(self, message)
+        self.retryable = retryable
+
+
+#############################################################################
+# Class that represents a client of the web services of a Moodle site; HTTP
+# connections are pooled, so that requests reuse kept-alive connections
+#############################################################################
+class WsClient:
+
+    # Constructor
+    def __init__(self, lms_url, token, pool_size=POOL_SIZE):
+        url_parts = urlparse.urlsplit(lms_url)
+        if url_parts.scheme not in ("http", "https") or not url_parts.netloc:
+            raise ValueError("Invalid LMS URL: {}".format(lms_url))
+        self.lms_url = lms_url
+        self.token = token
+        self.scheme = url_parts.scheme
+        self.netloc = url_parts.netloc
+        self.base_path = url_parts.path.rstrip("/")
+        self.idle_connections = Queue.LifoQueue(pool_size)
+
+    # Get an idle connection from the pool, or a new one; return the
+    # connection and whether it was reused
+    def get_http_connection(self):
+        try:
+            return self.idle_connections.get_nowait(), True
+        except Queue.Empty:
+            if self.scheme == "https":
+                return httplib.HTTPSConnection(self.netloc, timeout=HTTP_TIMEOUT), False
+            return httplib.HTTPConnection(self.netloc, timeout=HTTP_TIMEOUT), False
+
+    # Return a connection to the pool (or close it if the pool is full)
+    def release_http_connection(self, http_connection):
+        try:
+            self.idle_connections.put_nowait(http_connection)
+        except Queue.Full:
+            http_connection.close()
+
+    # Send a POST request to the given path; the body is either a string or a
+    # function that sends it over the connection; return the decoded response
+    def post(self, path, content_type, content_length, body):
+        while True:
+            http_connection, reused = self.get_http_connection()
+            request_sent = False
+            try:
+                if http_connection.sock is None:
+                    # Small requests are sent without waiting (Nagle's algorithm)
+                    http_connection.connect()
+                    http_connection.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                http_connection.putrequest("POST", self.base_path + path)
+                http_connection.putheader("Content-Type", content_type)
+                http_connection.putheader("Content-Length", str(content_length))
+                if callable(body):
+                    http_connection.endheaders()
+                    body(http_connection)
+                else:
+                    # The body is sent together with the headers
+                    http_connection.endheaders(body)
+                request_sent = True
+                response = http_connection.getresponse()
+                response_data = response.read()
+            except (httplib.HTTPException, socket.error) as e:
+                http_connection.close()
+                # Kept-alive connections may have been closed by the server in
+                # the meantime, hence requests on them are retried if they could
+                # not be sent, or if the server closed the connection instead
+                # of responding; requests that may have been processed (e.g.,
+                # on timeout) are never sent again
+                retryable = not isinstance(e, socket.timeout) and not request_sent
+                if reused and (retryable or isinstance(e, httplib.BadStatusLine)):
+                    continue
+                raise WsError("HTTP request to '{}' failed: {}".format(self.lms_url, str(e)), retryable)
+            break
+
+        if response.will_close:
+            http_connection.close()
+        else:
+            self.release_http_connection(http_connection)
+        perf_mgmt.add_bytes("ws.output", len(response_data))
+        if response.status != httplib.OK:
+            raise WsError("HTTP request to '{}' failed: {} {}".format(self.lms_url, response.status, response.reason))
+        try:
+            return json.loads(response_data)
+        except ValueError:
+            raise WsError("Invalid response from '{}': {}".format(self.lms_url, response_data[:200]))
+
+    # Call a web service function with the given parameters (a dictionary
+    # of values, lists and dictionaries); return the decoded result
+    @perf_mgmt.timed("ws.call")
+    def call(self, function, parameters={}):
+        body = urllib.urlencode([("wstoken", self.token), ("wsfunction", function),
+                                 ("moodlewsrestformat", REST_FORMAT)] + encode_parameters(parameters))
+        perf_mgmt.add_bytes("ws.input", len(body))
+        result = self.post(REST_PATH, FORM_CONTENT_TYPE, len(body), body)
+        if isinstance(result, dict) and EXCEPTION_FIELD in result:
+            raise WsError("{}: {}".format(result.get("errorcode", result[EXCEPTION_FIELD]), result.get(MESSAGE_FIELD)))
+        return result
+
+    # Upload a file to a new draft area, under the given file name; return
+    # the id of the draft area (the file is streamed, not read in memory)
+    @perf_mgmt.timed("ws.upload")
+    def upload(self, local_file, file_name):
+        boundary = uuid.uuid4().hex
+        head = ""
+        for name, value in [("token", self.token), ("filearea", UPLOAD_FILE_AREA), ("itemid", UPLOAD_NEW_ITEM_ID)]:
+            head += '--{}\r\nContent-Disposition: form-data; name="{}"\r\n\r\n{}\r\n'.format(boundary, name, value)
+        head += '--{}\r\nContent-Disposition: form-data; name="file_1"; filename="{}"\r\nContent-Type: {}\r\n\r\n' \
+                .format(boundary, file_name, FILE_CONTENT_TYPE)
+        tail = "\r\n--{}--\r\n".format(boundary)
+        file_size = os.path.getsize(local_file)
+        perf_mgmt.add_bytes("ws.upload", file_size)
+
+        def send_body(http_connection):
+            http_connection.send(head)
+            with open(local_file, "rb") as file_stream:
+                while True:
+                    chunk = file_stream.read(UPLOAD_CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    http_connection.send(chunk)
+            http_connection.send(tail)
+
+        result = self.post(UPLOAD_PATH, MULTIPART_CONTENT_TYPE.format(boundary), len(head) + file_size + len(tail),
+                           send_body)
+        if isinstance(result, dict) and ERROR_FIELD in result:
+            raise WsError("Upload of '{}' failed: {}".format(local_file, result[ERROR_FIELD]))
+        try:
+            return result[0]["itemid"]
+        except (IndexError, KeyError, TypeError):
+            raise WsError("Invalid upload response from '{}': {}".format(self.lms_url, result))
+
+    # Close the idle connections
+    def close(self):
+        while True:
+            try:
+                self.idle_connections.get_nowait().close()
+            except Queue.Empty:
+                break
+
+
+#############################################################################
+# Functions
+#############################################################################
+
+# Encode web service parameters as (name, value) pairs, using the nested
+# name format expected by Moodle (e.g., "activities[0][name]")
+def encode_parameters(parameters, prefix=None):
+    if isinstance(parameters, dict):
+        items = sorted(parameters.items())
+    elif isinstance(parameters, (list, tuple)):
+        items = enumerate(parameters)
+    else:
+        if isinstance(parameters, unicode):
+            parameters = parameters.encode("utf-8")
+        elif isinstance(parameters, bool):
+            parameters = int(parameters)
+        return [(prefix, parameters)]
+    pairs = []
+    for key, value in items:
+        name = str(key) if prefix is None else "{}[{}]".format(prefix, key)
+        pairs.extend(encode_parameters(value, name))
+    return pairs
+
+# Clients indexed by Moodle URL and token, so that HTTP connections are
+# shared by all the managers of the process
+clients = {}
+clients_lock = threading.Lock()
+
+# Get the client of the given Moodle site (created if needed)
+def get_client(lms_url, token):
+    with clients_lock:
+        if (lms_url, token) not in clients:
+            clients[(lms_url, token)] = WsClient(lms_url, token)
+        return clients[(lms_url, token)]
+
+# Close the connections of all the clients; called automatically at program exit
+def close_clients():
+    with clients_lock:
+        for client in clients.values():
+            client.close()
+
+atexit.register(close_clients)
+
+
+#############################################################################
+# Main program (used for testing purposes)
+#############################################################################
+def main(args):
+
+    # Configure logging level for running the tests below
+    logging.basicConfig(level=logging.INFO,
+                        format='* %(levelname)s: %(filename)s: %(message)s')
+
+    # List the courses of the Moodle site given as argument
+    if len(args) < 2:
+        logging.error("Usage: ws_mgmt.py <URL> <TOKEN>")
+        sys.exit(1)
+    client = get_client(args[0], args[1])
+    try:
+        for course in client.call("core_course_get_courses"):
+            logging.info("Course #{}: {} ({})".format(course["id"], course["fullname"].encode("utf-8"),
+                                                      course["shortname"].encode("utf-8")))
+    except WsError as e:
+        logging.error("Web service call failed: {}".format(str(e)))
+        sys.exit(1)
+
+
+#############################################################################
+# Run main program
+#############################################################################
+if __name__ == "__main__":
+    main(sys.argv[1:])